@@ -0,0 +1,264 @@
+"""
+准入控制
+/api/analyze 的各阶段（上传、推理、热力图渲染）各有并发上限和有界等待队列：队列已满时立即返回429，
+排队超过等待上限时返回503，两者都带 Retry-After。突发流量时被接纳的请求延迟有界，而不是所有请求
+一起排在OCR引擎后面直到 gunicorn 超时。
+
+请求分优先级通道：窗口人员交互使用的 interactive 通道和后台批量任务的 bulk 通道各自排队。
+interactive 严格优先：只有 interactive 没有请求在排队时才向 bulk 分配名额，且 bulk 最多占用部分名额，
+其余名额始终为 interactive 保留。
+
+计数在每个Web进程内独立进行（gunicorn 多 worker 时总上限为各进程之和）。
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from config import ADMISSION_CONFIG
+
+
+class AdmissionRejected(Exception):
+    """请求未被接纳"""
+
+    def __init__(self, stage: str, status: int, retry_after: int, reason: str):
+        super().__init__(f"{stage}: {reason}")
+        self.stage = stage
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionTicket:
+    """已接纳请求在某一阶段的排队信息"""
+
+    def __init__(self, stage: str, lane: str, wait_ms: float):
+        self.stage = stage
+        self.lane = lane
+        self.wait_ms = wait_ms
+        self.granted = False
+
+
+class LaneMetrics:
+    """单个优先级通道的计数和最近请求的延迟分位数"""
+
+    def __init__(self, window: int):
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_ms = deque(maxlen=window)
+        self.latency_ms = deque(maxlen=window)
+
+    def snapshot(self) -> Dict:
+        return {
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'wait_ms': _percentiles(self.wait_ms),
+            'latency_ms': _percentiles(self.latency_ms)
+        }
+
+
+class AdmissionStage:
+    """单个阶段的并发上限和按优先级通道划分的有界FIFO等待队列
+
+    名额释放时先分给优先级最高的、有请求排队且未达容量上限的通道；同一优先级的多个通道之间按权重
+    （平滑加权轮询）选择。每个通道最多占用 max_share 比例的名额，低优先级通道不能占用为高优先级通道
+    保留的名额。已开始执行的请求不会被抢占。
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float, service_time: float,
+                 lanes: Optional[Dict] = None):
+        """
+        Args:
+            name: 阶段名称
+            concurrency: 同时执行的请求数上限
+            max_queue: 每个通道的等待队列长度上限，超出时返回429
+            max_wait: 排队等待上限（秒），超出时返回503
+            service_time: 单个请求耗时的先验值（秒），用于估算 Retry-After
+            lanes: 通道配置 {名称: {'priority', 'weight', 'max_share'}}，默认使用 config.ADMISSION_CONFIG['lanes']
+        """
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.max_wait = float(max_wait)
+        self.service_time = float(service_time)
+        self.active = 0
+        self.cond = threading.Condition()
+
+        lanes = lanes or ADMISSION_CONFIG['lanes']
+        self.priorities = {lane: int(spec.get('priority', 0)) for lane, spec in lanes.items()}
+        self.weights = {lane: float(spec.get('weight', 1)) for lane, spec in lanes.items()}
+        self.capacity = {lane: max(1, int(self.concurrency * spec['max_share'])) for lane, spec in lanes.items()}
+        self.lane_active = {lane: 0 for lane in lanes}
+        self.queues = {lane: deque() for lane in lanes}
+        self.credits = {lane: 0.0 for lane in lanes}
+        self.metrics = {lane: LaneMetrics(ADMISSION_CONFIG['metrics_window']) for lane in lanes}
+
+    def check(self, lane: str):
+        """不占用名额，只检查该通道队列是否已满（读取上传内容之前快速拒绝）"""
+        with self.cond:
+            if self._queue_full(lane):
+                self.metrics[lane].rejected += 1
+                raise AdmissionRejected(self.name, 429, self._retry_after(lane), '等待队列已满')
+
+    @contextmanager
+    def enter(self, lane: str) -> Iterator[AdmissionTicket]:
+        """在指定通道占用一个执行名额，必要时排队等待"""
+        arrived = time.monotonic()
+        ticket = AdmissionTicket(self.name, lane, 0.0)
+        metrics = self.metrics[lane]
+
+        with self.cond:
+            if not self.queues[lane] and self._can_start(lane) and not self._preferred_waiting(lane):
+                self._start(lane, ticket)
+            else:
+                if self._queue_full(lane):
+                    metrics.rejected += 1
+                    raise AdmissionRejected(self.name, 429, self._retry_after(lane), '等待队列已满')
+
+                self.queues[lane].append(ticket)
+                deadline = arrived + self.max_wait
+                while not ticket.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.queues[lane].remove(ticket)
+                        metrics.timed_out += 1
+                        raise AdmissionRejected(self.name, 503, self._retry_after(lane), '排队等待超时')
+                    self.cond.wait(remaining)
+
+            started = time.monotonic()
+            ticket.wait_ms = (started - arrived) * 1000.0
+            metrics.admitted += 1
+            metrics.wait_ms.append(ticket.wait_ms)
+
+        try:
+            yield ticket
+        finally:
+            finished = time.monotonic()
+            alpha = ADMISSION_CONFIG['ema_alpha']
+            with self.cond:
+                self.active -= 1
+                self.lane_active[lane] -= 1
+                self.service_time = (1 - alpha) * self.service_time + alpha * (finished - started)
+                metrics.latency_ms.append((finished - arrived) * 1000.0)
+                self._dispatch()
+
+    def snapshot(self) -> Dict:
+        """当前占用、各通道排队深度和延迟分位数"""
+        with self.cond:
+            return {
+                'active': self.active,
+                'concurrency': self.concurrency,
+                'max_queue': self.max_queue,
+                'service_time': round(self.service_time, 3),
+                'lanes': {
+                    lane: dict(self.metrics[lane].snapshot(),
+                               active=self.lane_active[lane],
+                               capacity=self.capacity[lane],
+                               queue_depth=len(self.queues[lane]))
+                    for lane in self.queues
+                }
+            }
+
+    def _can_start(self, lane: str) -> bool:
+        return self.active < self.concurrency and self.lane_active[lane] < self.capacity[lane]
+
+    def _preferred_waiting(self, lane: str) -> bool:
+        """是否有更高优先级通道的请求在排队等待可用的名额"""
+        return any(queue and self.priorities[other] < self.priorities[lane] and self._can_start(other)
+                   for other, queue in self.queues.items())
+
+    def _start(self, lane: str, ticket: AdmissionTicket):
+        self.active += 1
+        self.lane_active[lane] += 1
+        ticket.granted = True
+
+    def _dispatch(self):
+        """把空出的名额分给优先级最高的可启动通道的队首请求，同一优先级内按平滑加权轮询"""
+        granted = False
+        while self.active < self.concurrency:
+            eligible = [lane for lane, queue in self.queues.items() if queue and self._can_start(lane)]
+            if not eligible:
+                break
+            top = min(self.priorities[lane] for lane in eligible)
+            eligible = [lane for lane in eligible if self.priorities[lane] == top]
+            total = sum(self.weights[lane] for lane in eligible)
+            for lane in eligible:
+                self.credits[lane] += self.weights[lane]
+            lane = max(eligible, key=lambda name: self.credits[name])
+            self.credits[lane] -= total
+            self._start(lane, self.queues[lane].popleft())
+            granted = True
+        if granted:
+            self.cond.notify_all()
+
+    def _queue_full(self, lane: str) -> bool:
+        return not self._can_start(lane) and len(self.queues[lane]) >= self.max_queue
+
+    def _retry_after(self, lane: str) -> int:
+        """按该通道排在前面的请求数、通道容量和平均耗时估算多久后重试（秒）"""
+        rounds = (len(self.queues[lane]) + 1) / self.capacity[lane]
+        return int(min(max(math.ceil(rounds * self.service_time), 1), ADMISSION_CONFIG['max_retry_after']))
+
+
+def _percentiles(values) -> Dict:
+    """p50 / p95（毫秒）"""
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        'p50': round(ordered[int(round(0.5 * last))], 1),
+        'p95': round(ordered[int(round(0.95 * last))], 1)
+    }
+
+
+class AdmissionController:
+    """各阶段的准入控制
+
+    阶段对象在首次使用时按进程创建：gunicorn preload_app 时模块在 master 中导入，
+    gevent 猴子补丁在 fork 之后才生效，提前创建的条件变量会阻塞整个 worker。
+    """
+
+    def __init__(self, stages: Optional[Dict] = None):
+        """
+        Args:
+            stages: 各阶段配置，默认使用 config.ADMISSION_CONFIG['stages']
+        """
+        self.config = stages or ADMISSION_CONFIG['stages']
+        self.stages: Dict[str, AdmissionStage] = {}
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def stage(self, name: str) -> AdmissionStage:
+        """返回本进程的阶段对象"""
+        if self.pid != os.getpid():
+            self.stages = {}
+            self.lock = threading.Lock()
+            self.pid = os.getpid()
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = AdmissionStage(name, **self.config[name])
+            return self.stages[name]
+
+    def check(self, name: str, lane: Optional[str] = None):
+        """阶段中该通道的等待队列已满时抛出 AdmissionRejected"""
+        self.stage(name).check(self.lane(lane))
+
+    def enter(self, name: str, lane: Optional[str] = None):
+        """在指定通道占用阶段名额的上下文管理器，返回 AdmissionTicket"""
+        return self.stage(name).enter(self.lane(lane))
+
+    @staticmethod
+    def lane(name: Optional[str]) -> str:
+        """规范化通道名称，未知或缺省时使用默认通道"""
+        name = (name or '').strip().lower()
+        return name if name in ADMISSION_CONFIG['lanes'] else ADMISSION_CONFIG['default_lane']
+
+    def snapshot(self) -> Dict:
+        """各阶段的当前状态"""
+        return {name: self.stage(name).snapshot() for name in self.config}
@@ -2,20 +2,27 @@
 模块4: Web端服务系统
 功能：提供Web API接口，整合前三个模块
 """
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, render_template_string, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
-from pathlib import Path
 import traceback
-import json
 from datetime import datetime
 
-# 导入前面的模块
-from module1_detection import CertificateDetector
-from module2_extraction import CertificateExtractor
-from module3_forgery import ForgeryDetectionSystem
-from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_CONTENT_LENGTH
+from config import INFERENCE_CONFIG, THREAD_CONFIG
+from thread_budget import governor
+
+if INFERENCE_CONFIG['mode'] == 'local':
+    # 模型在Web进程内加载：在导入 numpy/cv2/paddle/torch 之前按Web进程数设置线程预算
+    # （gevent worker 的请求协程不并行，每进程按1个请求线程计）
+    governor.configure(THREAD_CONFIG['web_workers'], 1)
+
+# remote 模式下模型推理在独立的推理进程中执行，Web进程不导入 paddle/torch
+from inference_client import InferenceClient, InferenceError, heatmap_paths, run_blocking
+from admission import AdmissionController, AdmissionRejected
+from deadline import Deadline
+from single_flight import SingleFlight, content_digest
+from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_CONTENT_LENGTH, ADMISSION_CONFIG, DEADLINE_CONFIG
 
 
 # 创建Flask应用
@@ -27,10 +34,24 @@ CORS(app)
 # 确保上传文件夹存在
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 
-# 初始化所有模块
-detector = CertificateDetector()
-extractor = CertificateExtractor()
-forgery_system = ForgeryDetectionSystem()
+
+def create_pipeline():
+    """
+    创建分析流水线
+
+    remote 模式（gunicorn 部署）转发给 inference_server.py 的推理进程池；
+    local 模式（开发调试）在当前进程内加载模型。
+    """
+    if INFERENCE_CONFIG['mode'] == 'remote':
+        return InferenceClient()
+
+    from inference_server import AnalysisPipeline
+    return AnalysisPipeline()
+
+
+pipeline = create_pipeline()
+admission = AdmissionController()
+single_flight = SingleFlight()
 
 
 def allowed_file(filename):
@@ -38,7 +59,42 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
-# HTML模板
+def shares_degraded_result(response, deadline, leader_deadline_ms) -> bool:
+    """
+    合并请求能否直接使用第一个请求的结果
+
+    第一个请求因截止时间跳过了分析（结果降级或超时失败）时，只有本请求的截止时间不晚于它时才复用；
+    本请求剩余时间更多时应自己重新分析，而不是继承别人的降级结果。
+    """
+    degraded = response.get('deadline_exceeded') or (response.get('result') or {}).get('degraded')
+    if not degraded:
+        return True
+    if deadline is None:
+        return False
+    # 留出1秒余量，截止时间相近的请求仍然合并
+    return leader_deadline_ms is not None and deadline.epoch_ms() <= leader_deadline_ms + 1000.0
+
+
+def request_lane() -> str:
+    """请求的优先级通道：/api/bulk/ 下的接口为 bulk，否则取请求头，缺省为 interactive"""
+    if request.path.startswith('/api/bulk/'):
+        return 'bulk'
+    return AdmissionController.lane(request.headers.get(ADMISSION_CONFIG['priority_header']))
+
+
+def admission_rejected(error: AdmissionRejected):
+    """未被接纳的请求：429（队列已满）或503（排队超时），带 Retry-After"""
+    print(f"请求未被接纳 [{error.stage}]: {error.reason}，{error.retry_after} 秒后重试")
+    response = jsonify({
+        'success': False,
+        'error': f'服务繁忙（{error.reason}），请 {error.retry_after} 秒后重试',
+        'retry_after': error.retry_after
+    })
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
 <html lang="zh-CN">
@@ -341,17 +397,28 @@ HTML_TEMPLATE = '''
 
                 <div style="margin-top: 20px;">
                     <div style="margin-bottom: 10px;">
-                        <strong>图像分析 (权重40%):</strong> <span id="imageScore">-</span>
+                        <strong>图像分析 (权重35%):</strong> <span id="imageScore">-</span>
                         <div style="color: #666; margin-top: 5px;" id="imageAnalysis"></div>
                     </div>
                     <div style="margin-bottom: 10px;">
-                        <strong>文本分析 (权重35%):</strong> <span id="textScore">-</span>
+                        <strong>文本分析 (权重30%):</strong> <span id="textScore">-</span>
                         <div style="color: #666; margin-top: 5px;" id="textAnalysis"></div>
                     </div>
                     <div style="margin-bottom: 10px;">
-                        <strong>结构分析 (权重25%):</strong> <span id="structureScore">-</span>
+                        <strong>结构分析 (权重20%):</strong> <span id="structureScore">-</span>
                         <div style="color: #666; margin-top: 5px;" id="structureAnalysis"></div>
                     </div>
+                    <div style="margin-bottom: 10px;">
+                        <strong>元数据分析 (权重15%):</strong> <span id="metadataScore">-</span>
+                        <div style="color: #666; margin-top: 5px;" id="metadataAnalysis"></div>
+                    </div>
+                </div>
+
+                <div style="margin-top: 20px; display: none;" id="heatmapSection">
+                    <strong>可疑区域:</strong> <span id="regionCount">-</span>
+                    <div style="margin-top: 10px;">
+                        <img id="heatmapImage" style="max-width: 100%; border-radius: 5px;" alt="可疑区域热力图">
+                    </div>
                 </div>
 
                 <div style="margin-top: 20px; padding: 15px; background: #fff; border-radius: 5px;">
@@ -468,10 +535,21 @@ HTML_TEMPLATE = '''
             document.getElementById('imageScore').textContent = (result.forgery_result.image_score * 100).toFixed(1) + '%';
             document.getElementById('textScore').textContent = (result.forgery_result.text_score * 100).toFixed(1) + '%';
             document.getElementById('structureScore').textContent = (result.forgery_result.structure_score * 100).toFixed(1) + '%';
+            document.getElementById('metadataScore').textContent = (result.forgery_result.metadata_score * 100).toFixed(1) + '%';
 
             document.getElementById('imageAnalysis').textContent = result.forgery_result.image_analysis || '正常';
             document.getElementById('textAnalysis').textContent = result.forgery_result.text_analysis || '正常';
             document.getElementById('structureAnalysis').textContent = result.forgery_result.structure_analysis || '正常';
+            document.getElementById('metadataAnalysis').textContent = result.forgery_result.metadata_analysis || '正常';
+
+            const heatmapSection = document.getElementById('heatmapSection');
+            if (result.forgery_result.heatmap_url) {
+                document.getElementById('regionCount').textContent = result.forgery_result.suspicious_regions.length + ' 处';
+                document.getElementById('heatmapImage').src = result.forgery_result.heatmap_url;
+                heatmapSection.style.display = 'block';
+            } else {
+                heatmapSection.style.display = 'none';
+            }
 
             document.getElementById('recommendation').textContent = result.forgery_result.recommendation;
 
@@ -514,85 +592,104 @@ def index():
 
 
 @app.route('/api/analyze', methods=['POST'])
+@app.route('/api/bulk/analyze', methods=['POST'])
 def analyze_certificate():
     """
     分析证件接口
 
+    /api/bulk/analyze 供后台批量任务使用（bulk 通道，只使用空闲容量）；
+    /api/analyze 默认为 interactive 通道，可用 X-Request-Priority 请求头指定通道。
+    X-Deadline-Ms 请求头指定时间预算（毫秒），时间不足时跳过可选分析器并返回降级结果。
+
     输入: 上传的图片文件
     输出: JSON格式的分析结果
     """
+    lane = request_lane()
+    # 截止时间从收到请求时起算，排队等待也计入预算
+    deadline = Deadline.from_header(request.headers.get(DEADLINE_CONFIG['header']))
     try:
-        # 检查文件
-        if 'file' not in request.files:
-            return jsonify({'success': False, 'error': '没有文件上传'})
-
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'success': False, 'error': '文件名为空'})
-
-        if not allowed_file(file.filename):
-            return jsonify({'success': False, 'error': '不支持的文件类型'})
-
-        # 保存文件 - 处理中文文件名
-        original_filename = file.filename
-        # 提取文件扩展名（从原始文件名）
-        name, ext = os.path.splitext(original_filename)
-        # 如果没有扩展名，拒绝
-        if not ext:
-            return jsonify({'success': False, 'error': '文件必须有扩展名'})
-        # 生成安全的文件名：时间戳 + 扩展名
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')  # 加微秒避免冲突
-        filename = f"{timestamp}{ext.lower()}"  # 使用小写扩展名
-        filepath = UPLOAD_FOLDER / filename
-        file.save(str(filepath))
-
-        # 步骤1: 检测证件
-        detection_result = detector.detect_certificate(str(filepath))
-
-        if not detection_result['has_certificate']:
-            return jsonify({
-                'success': False,
-                'error': '未检测到证件，请确认上传的是证件图片'
-            })
-
-        # 步骤2: 提取结构化信息
-        extraction_result = extractor.extract(
-            detection_result['ocr_text'],
-            detection_result['certificate_type']
-        )
-
-        # 步骤3: 鉴伪检测
-        forgery_result = forgery_system.detect(
-            str(filepath),
-            detection_result['ocr_result'],
-            detection_result['ocr_text'],
-            extraction_result['extracted_fields'],
-            detection_result['certificate_type'],
-            detection_result['bbox']
-        )
-
-        # 返回结果
-        result = {
-            'certificate_type': detection_result['certificate_type'],
-            'confidence': detection_result['confidence'],
-            'extracted_fields': extraction_result['extracted_fields'],
-            'forgery_result': {
-                'forgery_score': forgery_result['forgery_score'],
-                'forgery_risk': forgery_result['forgery_risk'],
-                'image_score': forgery_result['image_score'],
-                'text_score': forgery_result['text_score'],
-                'structure_score': forgery_result['structure_score'],
-                'image_analysis': forgery_result['image_analysis'],
-                'text_analysis': forgery_result['text_analysis'],
-                'structure_analysis': forgery_result['structure_analysis'],
-                'recommendation': forgery_result['recommendation']
-            }
-        }
+        # 推理阶段队列已满时在读取上传内容之前快速拒绝
+        admission.check('inference', lane)
+
+        with admission.enter('upload', lane) as upload_ticket:
+            # 检查文件
+            if 'file' not in request.files:
+                return jsonify({'success': False, 'error': '没有文件上传'})
+
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'success': False, 'error': '文件名为空'})
+
+            if not allowed_file(file.filename):
+                return jsonify({'success': False, 'error': '不支持的文件类型'})
+
+            # 保存文件 - 处理中文文件名
+            original_filename = file.filename
+            # 提取文件扩展名（从原始文件名）
+            name, ext = os.path.splitext(original_filename)
+            # 如果没有扩展名，拒绝
+            if not ext:
+                return jsonify({'success': False, 'error': '文件必须有扩展名'})
+            # 生成安全的文件名：时间戳 + 扩展名
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')  # 加微秒避免冲突
+            filename = f"{timestamp}{ext.lower()}"  # 使用小写扩展名
+            filepath = UPLOAD_FOLDER / filename
+            file.save(str(filepath))
+            # 哈希最多16MB的上传内容，放到线程池执行，不阻塞事件循环
+            digest = run_blocking(content_digest, filepath)
+
+        # 步骤1-3: 元数据检测、证件检测、信息提取、鉴伪检测
+        # 同一通道同时上传的相同文件只分析一次，重复请求不占用推理名额，等待并共享第一个请求的结果
+        # （按通道区分，interactive 请求不会排在 bulk 请求的调度之后）
+        inference_wait = {'ms': 0.0}
+
+        def run_inference():
+            with admission.enter('inference', lane) as inference_ticket:
+                inference_wait['ms'] = inference_ticket.wait_ms
+                return {
+                    'response': pipeline.analyze(filename, deadline=deadline),
+                    'deadline_ms': deadline.epoch_ms() if deadline is not None else None
+                }
 
+        try:
+            key, coalesced_wait_ms = f'{digest}.{lane}', 0.0
+            while True:
+                flight = single_flight.run(key, run_inference)
+                outcome, coalesced = flight.value, flight.coalesced
+                coalesced_wait_ms += flight.wait_ms
+                if not coalesced or shares_degraded_result(outcome['response'], deadline, outcome['deadline_ms']):
+                    break
+                # 第一个请求的结果已降级而本请求剩余时间更多：同样不接受该结果的重复请求按它的截止时间
+                # 再合并一次，只重新分析一次（每轮执行方的截止时间递增，循环必然结束）
+                key = f"{digest}.{lane}.{outcome['deadline_ms'] or 0:.0f}"
+        except AdmissionRejected:
+            filepath.unlink(missing_ok=True)
+            raise
+
+        if coalesced:
+            # 结果引用第一个请求保存的文件（含热力图），本请求的副本不再需要
+            filepath.unlink(missing_ok=True)
+
+        response = dict(outcome['response'])
+        response['lane'] = lane
+        response['coalesced'] = coalesced
+        response['queue_wait_ms'] = {
+            'upload': round(upload_ticket.wait_ms, 1),
+            'inference': round(inference_wait['ms'], 1)
+        }
+        if coalesced:
+            response['queue_wait_ms']['coalesced'] = round(coalesced_wait_ms, 1)
+        return jsonify(response)
+
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+
+    except InferenceError as e:
+        print(f"推理服务不可用: {str(e)}")
         return jsonify({
-            'success': True,
-            'result': result
-        })
+            'success': False,
+            'error': '推理服务暂不可用，请稍后重试'
+        }), 503
 
     except Exception as e:
         traceback.print_exc()
@@ -602,13 +699,75 @@ def analyze_certificate():
         })
 
 
+@app.route('/api/heatmap/<filename>', methods=['GET'])
+def heatmap_overlay(filename):
+    """
+    可疑区域热力图叠加接口
+
+    首次请求时渲染叠加图并缓存为PNG，之后直接返回缓存文件。
+    """
+    filename = secure_filename(filename)
+    _, png_path = heatmap_paths(filename)
+
+    if png_path.exists():
+        return send_file(str(png_path), mimetype='image/png')
+
+    try:
+        with admission.enter('heatmap', request_lane()):
+            response = pipeline.render_heatmap(filename)
+        if not response['success']:
+            return jsonify({'success': False, 'error': response['error']}), response.get('status', 500)
+
+        return send_file(response['path'], mimetype='image/png')
+
+    except AdmissionRejected as e:
+        return admission_rejected(e)
+
+    except InferenceError as e:
+        print(f"推理服务不可用: {str(e)}")
+        return jsonify({'success': False, 'error': '推理服务暂不可用，请稍后重试'}), 503
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': f'热力图渲染错误: {str(e)}'}), 500
+
+
+@app.route('/api/inference/stats', methods=['GET'])
+def inference_stats():
+    """
+    推理统计接口
+
+    返回OCR和CNN微批调度的批大小、排队等待时间直方图（remote 模式下为响应该请求的推理进程的统计）。
+    """
+    try:
+        return jsonify(pipeline.stats())
+    except InferenceError as e:
+        print(f"推理服务不可用: {str(e)}")
+        return jsonify({'success': False, 'error': '推理服务暂不可用，请稍后重试'}), 503
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    return jsonify({
+    status = {
         'status': 'healthy',
-        'timestamp': datetime.now().isoformat()
-    })
+        'timestamp': datetime.now().isoformat(),
+        'inference_mode': INFERENCE_CONFIG['mode'],
+        'admission': admission.snapshot()
+    }
+
+    if isinstance(pipeline, InferenceClient):
+        try:
+            # 线程预算取自响应的推理进程（各推理进程预算相同）
+            status['threads'] = pipeline.ping().get('threads')
+            status['inference'] = 'ok'
+        except InferenceError:
+            status['status'] = 'degraded'
+            status['inference'] = 'unavailable'
+    else:
+        status['threads'] = governor.report()
+
+    return jsonify(status)
 
 
 if __name__ == '__main__':
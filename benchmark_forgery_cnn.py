@@ -0,0 +1,105 @@
+"""
+鉴伪CNN推理基准测试
+比较 eager / TorchScript / ONNX Runtime 三种CPU推理后端在不同批大小下的延迟
+"""
+import sys
+import io
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import torch
+
+from export_forgery_model import load_eager_model, export_torchscript, export_onnx
+from config import CNN_MODEL_PATH, CNN_INFERENCE_CONFIG
+
+
+def measure(run, batch: np.ndarray, repeat: int, warmup: int = 3) -> float:
+    """返回单批推理延迟的中位数（毫秒）"""
+    for _ in range(warmup):
+        run(batch)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return float(np.median(timings))
+
+
+def build_runners(architecture: str, patch_size: int, num_threads: int, workdir: Path) -> dict:
+    """构建各推理后端的单批推理函数"""
+    torch.set_num_threads(num_threads)
+    model = load_eager_model(architecture, CNN_MODEL_PATH, random_init=True)
+
+    def torch_runner(module):
+        def run(batch):
+            with torch.inference_mode():
+                return module(torch.from_numpy(batch)).numpy()
+        return run
+
+    runners = {'eager': torch_runner(model)}
+
+    scripted = torch.jit.load(str(export_torchscript(model, workdir / 'model.torchscript.pt')))
+    runners['torchscript'] = torch_runner(scripted)
+
+    try:
+        import onnxruntime as ort
+
+        onnx_path = export_onnx(model, workdir / 'model.onnx', patch_size)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        session = ort.InferenceSession(str(onnx_path), sess_options=options,
+                                       providers=['CPUExecutionProvider'])
+        input_name = session.get_inputs()[0].name
+        runners['onnx'] = lambda batch: session.run(None, {input_name: batch})[0]
+    except ImportError:
+        print("未安装 onnxruntime，跳过ONNX后端")
+
+    return runners
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='鉴伪CNN推理基准测试')
+    parser.add_argument('--architecture', default=CNN_INFERENCE_CONFIG['architecture'], help='网络结构')
+    parser.add_argument('--batch-sizes', default='1,8,16,32,64', help='批大小列表，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=20, help='每个批大小重复次数')
+    parser.add_argument('--threads', type=int, default=CNN_INFERENCE_CONFIG['num_threads'] or 2,
+                        help='CPU推理线程数')
+
+    args = parser.parse_args()
+    patch_size = CNN_INFERENCE_CONFIG['patch_size']
+    batch_sizes = [int(b) for b in args.batch_sizes.split(',') if b.strip()]
+
+    print("="*80)
+    print("鉴伪CNN推理基准测试")
+    print("="*80)
+    print(f"结构: {args.architecture}  图像块: {patch_size}x{patch_size}  线程数: {args.threads}")
+    if not Path(CNN_MODEL_PATH).exists():
+        print("提示: 权重文件不存在，使用随机初始化权重（不影响延迟测试）")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runners = build_runners(args.architecture, patch_size, args.threads, Path(tmp))
+
+        header = f"{'批大小':>8s}" + ''.join(f"{name + ' ms':>16s}" for name in runners)
+        header += ''.join(f"{name + ' ms/块':>18s}" for name in runners)
+        print("\n" + header)
+        print("-"*80)
+
+        rng = np.random.default_rng(0)
+        for batch_size in batch_sizes:
+            batch = rng.random((batch_size, 3, patch_size, patch_size), dtype=np.float32)
+            latencies = [measure(run, batch, args.repeat) for run in runners.values()]
+
+            line = f"{batch_size:>8d}" + ''.join(f"{ms:>16.2f}" for ms in latencies)
+            line += ''.join(f"{ms / batch_size:>18.3f}" for ms in latencies)
+            print(line)
+
+    print("="*80)
@@ -0,0 +1,140 @@
+"""
+证件模板特征索引构建工具
+对模板图像执行OCR、关键点和背景频谱提取，生成 StructureValidator 和 ImageForgeryDetector 使用的二进制模板索引
+"""
+import sys
+import json
+import re
+from pathlib import Path
+from typing import Dict, List
+import cv2
+import numpy as np
+
+from module3_forgery import TemplateIndex, extract_ocr_polygons
+from config import (CERTIFICATE_TYPES, BOOKS_DIR, TEMPLATE_INDEX_PATH, TEMPLATE_MANIFEST_PATH,
+                    ALLOWED_EXTENSIONS)
+
+
+def load_manifest(manifest_path) -> List[Dict]:
+    """
+    读取模板清单
+
+    清单为JSON列表，字段与 certificate_templates 表一致：
+    [{"certificate_type": "plant", "country": "老挝", "category": null,
+      "template_image_path": "books/植物证书/.../老挝植物检疫证书.jpg"}, ...]
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def guess_country(path: Path) -> str:
+    """从模板文件名或上级目录名推测国家（如“老挝植物检疫证书” -> “老挝”）"""
+    pattern = re.compile(r'^(?:\d+\.)?([\u4e00-\u9fff]{2,8}?)(?:国?\d*$|输华|植物|动物|水产|新增|卫生|检验|检疫|证书)')
+    for name in [path.stem] + [p.name for p in path.parents]:
+        match = pattern.match(name)
+        if match:
+            return match.group(1)
+    return 'unknown'
+
+
+def scan_books(books_dir) -> List[Dict]:
+    """
+    扫描证书样本库生成模板清单
+
+    证件类型由一级目录名（如“植物证书”）确定，国家由文件名推测。
+    """
+    type_by_name = {info['name']: cert_type for cert_type, info in CERTIFICATE_TYPES.items()}
+    books_dir = Path(books_dir)
+    entries = []
+
+    for path in sorted(books_dir.rglob('*')):
+        if path.suffix.lower().lstrip('.') not in ALLOWED_EXTENSIONS:
+            continue
+        relative = path.relative_to(books_dir)
+        if len(relative.parts) < 2 or relative.parts[0] not in type_by_name:
+            continue
+        entries.append({
+            'certificate_type': type_by_name[relative.parts[0]],
+            'country': guess_country(path),
+            'category': relative.parts[1] if len(relative.parts) > 2 else None,
+            'template_image_path': str(path)
+        })
+
+    return entries
+
+
+def build_index(entries: List[Dict], detector) -> TemplateIndex:
+    """
+    对每个模板执行OCR并提取布局向量、关键点和背景频谱
+
+    Args:
+        entries: 模板清单
+        detector: CertificateDetector，用于OCR和PDF转换
+
+    Returns:
+        模板索引
+    """
+    index = TemplateIndex()
+
+    for i, entry in enumerate(entries, 1):
+        image_path = entry['template_image_path']
+        print(f"[{i}/{len(entries)}] {entry['certificate_type']} / {entry['country']}: {Path(image_path).name}")
+
+        try:
+            if image_path.lower().endswith('.pdf'):
+                image = detector._convert_pdf_to_image(image_path)
+            else:
+                with open(image_path, 'rb') as f:
+                    image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                print("  ✗ 无法读取图像")
+                continue
+
+            polygons = extract_ocr_polygons(detector.ocr.ocr(image, cls=False))
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            index.add(entry['certificate_type'], entry['country'], image_path, polygons, gray)
+            print(f"  ✓ 文本框 {len(polygons)}，关键点 {len(index.descriptors[-1])}")
+
+        except Exception as e:
+            print(f"  ✗ 错误: {str(e)}")
+
+    return index
+
+
+if __name__ == '__main__':
+    # 设置控制台编码
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='证件模板特征索引构建工具')
+    parser.add_argument('--manifest', default=str(TEMPLATE_MANIFEST_PATH),
+                        help='模板清单JSON，不存在时扫描证书样本库')
+    parser.add_argument('--books-dir', default=str(BOOKS_DIR), help='证书样本库目录')
+    parser.add_argument('--output', default=str(TEMPLATE_INDEX_PATH), help='索引输出路径')
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("证件模板特征索引构建")
+    print("="*80)
+
+    if Path(args.manifest).exists():
+        entries = load_manifest(args.manifest)
+        print(f"模板清单: {args.manifest}")
+    else:
+        entries = scan_books(args.books_dir)
+        print(f"扫描样本库: {args.books_dir}")
+    print(f"模板数量: {len(entries)}\n")
+
+    if not entries:
+        print("✗ 没有可用的模板")
+        sys.exit(1)
+
+    from module1_detection import CertificateDetector
+    index = build_index(entries, CertificateDetector())
+    index.save(args.output)
+
+    print(f"\n✓ 模板索引已保存: {args.output} ({len(index)} 个模板)")
+    print("="*80)
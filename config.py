@@ -36,13 +36,179 @@ CERTIFICATE_TYPES = {
 MODEL_DIR = BASE_DIR / 'models'
 YOLO_MODEL_PATH = MODEL_DIR / 'certificate_detection.pt'
 CNN_MODEL_PATH = MODEL_DIR / 'forgery_detection.pt'
+CNN_TORCHSCRIPT_PATH = MODEL_DIR / 'forgery_detection.torchscript.pt'
+CNN_ONNX_PATH = MODEL_DIR / 'forgery_detection.onnx'
+CNN_QUANTIZED_PATH = MODEL_DIR / 'forgery_detection.int8.torchscript.pt'
 NLP_MODEL_PATH = MODEL_DIR / 'text_verification'
+TEMPLATE_INDEX_PATH = MODEL_DIR / 'template_index.npz'
+
+# 鉴伪CNN推理配置
+CNN_INFERENCE_CONFIG = {
+    'backend': os.getenv('CNN_BACKEND', 'torch'),  # 推理后端: torch / torchscript / onnx
+    'quantization': os.getenv('CNN_QUANTIZATION') or None,  # INT8量化: None / dynamic / static
+    'architecture': 'simple',   # 网络结构，见 module3_forgery.FORGERY_MODELS
+    'patch_size': 64,           # 图像块边长（像素）
+    'batch_size': 32,           # 每批推理的图像块数量
+    'max_patches': 512,         # 单张图像最多推理的图像块数量，超出时先缩小图像
+    'num_threads': int(os.getenv('CNN_NUM_THREADS', 0)) or None,  # CPU推理线程数（torch / onnxruntime），None 时按线程预算（见 thread_budget.py）
+    'top_ratio': 0.1,           # 取概率最高的前10%图像块计算CNN得分
+}
+
+# 图像分析分辨率配置：各分析器声明所需的像素数，超出时用 INTER_AREA 缩小
+IMAGE_ANALYSIS_CONFIG = {
+    'pixel_budgets': {
+        'splice': 2_000_000,        # 块统计（64像素块）
+        'resolution': 2_000_000,    # 拉普拉斯清晰度（100像素块）
+        'edge': 2_000_000,          # Canny边缘密度
+        'copy_move': 2_000_000,     # 关键点自匹配
+        'noise': 4_000_000,         # SRM噪声残差（降采样会平滑噪声，预算较大）
+        'spectrum': 2_000_000,      # 背景频谱（再缩放到 TEMPLATE_CONFIG['spectrum_width']）
+        'cnn': CNN_INFERENCE_CONFIG['max_patches'] * CNN_INFERENCE_CONFIG['patch_size'] ** 2,
+    },
+    'jpeg_native_pixels': 1_048_576,  # JPEG块效应在原分辨率切片上计算的总像素数
+    'jpeg_tile': 512,                 # JPEG切片边长
+}
+
+# JPEG头部与二次压缩分析配置
+JPEG_ANALYSIS_CONFIG = {
+    'dct_frequencies': [(0, 1), (1, 0), (1, 1), (0, 2), (2, 0), (2, 1), (1, 2)],  # 参与直方图分析的低频AC系数
+    'histogram_bins': 32,       # 量化系数幅值直方图的桶数（不含0）
+    'min_bin_count': 20,        # 计数达到该值的桶才视为有效
+    'valley_window': 3,         # 判断空桶时两侧各看的桶数
+    'valley_ratio': 0.2,        # 低于两侧计数该比例的桶视为空桶
+    'double_compression_fraction': 0.3,  # 空桶比例达到该值时二次压缩得分为1
+    'editor_signature_score': 0.6,       # 头部含Photoshop/Adobe段时的得分
+}
+
+# 噪声残差分析配置
+NOISE_RESIDUAL_CONFIG = {
+    'block_size': 32,           # 残差统计块边长（像素预算分辨率下）
+    'truncation': 3.0,          # 残差截断阈值
+    'smooth_gradient': 24,      # 形态学梯度低于该值的像素视为平滑背景，仅在其上统计噪声
+    'min_smooth_fraction': 0.3,  # 平滑像素比例不足的块不参与统计
+    'z_threshold': 3.5,         # 稳健偏离度超过该值的块判为可疑
+    'max_flagged_fraction': 0.05,  # 可疑块比例达到该值时得分为1
+}
+
+# 伪造区域定位配置
+HEATMAP_CONFIG = {
+    'max_cells': 64,            # 热力图长边最大格数
+    'region_threshold': 0.6,    # 可疑度超过该值的格子参与连通域
+    'min_region_cells': 2,      # 可疑区域最少格数
+}
+
+# 复制-移动检测配置
+COPY_MOVE_CONFIG = {
+    'detector': 'orb',          # 关键点: orb / akaze
+    'max_side': 1600,           # 分析图像长边上限（像素）
+    'max_keypoints': 2000,      # 关键点数量上限
+    'max_hamming': 40,          # 最近邻汉明距离上限
+    'ratio': 0.8,               # 最近邻/次近邻距离比阈值
+    'min_offset': 40,           # 匹配点对最小间距（像素），排除同一局部结构
+    'offset_bin': 12,           # 位移向量量化步长（像素）
+    'min_cluster': 8,           # 克隆区域最少一致匹配数
+    'max_regions': 5,           # 最多报告的克隆区域数
+    'max_region_fraction': 0.05,  # 克隆区域面积上限（占关键点覆盖范围的比例）
+    'chunk_size': 512,          # 汉明距离分块行数
+}
 
 # 上传文件配置
 UPLOAD_FOLDER = BASE_DIR / 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
 
+# 推理服务配置（HTTP worker 与常驻推理进程池通过本地Unix套接字通信）
+INFERENCE_CONFIG = {
+    'mode': os.getenv('INFERENCE_MODE', 'local'),  # remote: 转发到推理进程池; local: 在Web进程内直接推理（开发调试）
+    'socket_path': os.getenv('INFERENCE_SOCKET', str(BASE_DIR / 'logs' / 'inference.sock')),
+    'num_workers': int(os.getenv('INFERENCE_WORKERS', 2)),  # 推理进程数，每个进程各加载一份模型
+    'threads_per_worker': int(os.getenv('INFERENCE_THREADS', 4)),  # 每个推理进程并发处理的请求数，模型调用经微批调度串行执行
+    'request_timeout': 280,     # 单个请求的等待上限（秒），小于 gunicorn 的 timeout
+    'backlog': 64,              # 套接字等待连接队列长度
+    'restart_delay': 1.0,       # 推理进程异常退出后重启前的等待（秒）
+    'preload': os.getenv('INFERENCE_PRELOAD', '1') != '0',  # 父进程加载模型并预热后再 fork，推理进程共享模型内存（GPU模式下自动关闭）
+    'pid_file': BASE_DIR / 'logs' / 'inference.pid',
+    'shared_memory': os.getenv('INFERENCE_SHARED_MEMORY', '1') != '0',  # 解码后的图像经共享内存传给推理进程
+    'shm_prefix': 'credit_img',         # 共享内存段名前缀（段名: 前缀_PID_序号）
+    'shm_pool_size': 4,                 # 每个Web进程空闲时保留的共享内存段数
+    'shm_granularity': 4 * 1024 * 1024, # 段容量取整粒度（字节），尺寸相近的图像复用同一段
+}
+
+# 线程预算配置（见 thread_budget.py）：按CPU数、推理进程数和每进程请求线程数统一设置
+# OpenMP/MKL/OpenBLAS、OpenCV、torch 和 Paddle 的线程数，避免各库按整机核数各开一个线程池
+THREAD_CONFIG = {
+    'enabled': os.getenv('THREAD_GOVERNOR', '1') != '0',
+    'cpus': int(os.getenv('INFERENCE_CPUS', 0)) or None,  # 可用CPU数，None 时按CPU亲和性和cgroup配额自动检测
+    'reserved_cpus': 1,         # 留给 gunicorn HTTP worker、推理服务父进程和系统的CPU数
+    'ocr_share': float(os.getenv('OCR_THREAD_SHARE', 0.5)),  # 每个进程的模型推理线程中分给OCR（Paddle）的比例，其余给CNN（torch）；两者的微批调度线程并发执行
+    # INFERENCE_MODE=local 时模型在Web进程内加载，按Web进程数分配（gunicorn_config.py 写入 WEB_WORKERS）
+    'web_workers': int(os.getenv('WEB_WORKERS', 1)),
+}
+
+# 推理进程内存看门狗配置（见 memory_watchdog.py）
+MEMORY_WATCHDOG_CONFIG = {
+    # 每个推理进程的内存上限（MB），每个请求结束后检查，超出时处理完在途请求后退出，由父进程重新派生
+    'limit_mb': float(os.getenv('INFERENCE_MEMORY_LIMIT_MB', 2048)),
+    # 按哪项内存判断：private 只计本进程私有的页（预加载时与父进程共享的模型页不计入），rss 为全部常驻内存
+    'metric': os.getenv('INFERENCE_MEMORY_METRIC', 'private'),
+    'trim_before_recycle': True,    # 超限时先 malloc_trim 把空闲堆内存还给系统，仍超限才回收
+    'accept_poll': 1.0,             # 请求线程等待连接的轮询间隔（秒），决定回收时多快停止接受新连接
+    'peak_buckets_mb': [16, 32, 64, 128, 256, 512, 1024],  # 单个请求RSS增量峰值直方图分桶（MB）
+}
+
+# 准入控制配置（见 admission.py），每个Web进程独立计数
+ADMISSION_CONFIG = {
+    'stages': {
+        # 接收并保存上传文件
+        'upload': {'concurrency': 8, 'max_queue': 32, 'max_wait': 10.0, 'service_time': 0.2},
+        # 送入推理进程池（OCR + 鉴伪），默认 2个gunicorn worker × 4 = 推理进程池容量（2进程 × 4线程）
+        'inference': {'concurrency': int(os.getenv('ADMISSION_INFERENCE_CONCURRENCY', 4)),
+                      'max_queue': int(os.getenv('ADMISSION_INFERENCE_QUEUE', 16)),
+                      'max_wait': 60.0, 'service_time': 5.0},
+        # 热力图叠加图渲染
+        'heatmap': {'concurrency': 2, 'max_queue': 8, 'max_wait': 10.0, 'service_time': 0.5},
+    },
+    # 优先级通道：priority 越小越优先，有更高优先级的请求在排队时不向低优先级通道分配名额；
+    # 同一优先级的通道按 weight 轮询；max_share 为通道最多占用的名额比例，其余名额为更高优先级通道保留
+    'lanes': {
+        'interactive': {'priority': 0, 'weight': 1, 'max_share': 1.0},   # 窗口人员通过Web界面交互使用
+        'bulk': {'priority': 1, 'weight': 1, 'max_share': 0.25},         # 后台批量任务，只使用空闲容量
+    },
+    'default_lane': 'interactive',
+    'priority_header': 'X-Request-Priority',  # 请求头指定通道；/api/bulk/ 下的接口固定为 bulk
+    'metrics_window': 512,      # 各通道延迟分位数统计的最近请求数
+    'ema_alpha': 0.2,           # 阶段耗时滑动平均系数（用于估算 Retry-After）
+    'max_retry_after': 120,     # Retry-After 上限（秒）
+}
+
+# 相同上传的请求合并配置（见 single_flight.py）
+SINGLE_FLIGHT_CONFIG = {
+    'enabled': os.getenv('SINGLE_FLIGHT', '1') != '0',
+    'lock_dir': BASE_DIR / 'logs' / 'singleflight',  # 锁文件和结果文件目录（同一节点的Web进程共用）
+    'poll_interval': 0.05,      # 等待其他进程时的轮询间隔（秒）
+    'max_wait': 280.0,          # 等待其他进程结果的上限（秒），超出时自己执行
+    'result_ttl': 30.0,         # 结果文件保留时间（秒）
+}
+
+# 请求截止时间配置（见 deadline.py）
+DEADLINE_CONFIG = {
+    'header': 'X-Deadline-Ms',  # 请求头：剩余时间预算（毫秒）或Unix时间戳（毫秒）形式的绝对截止时刻
+    'default_ms': int(os.getenv('REQUEST_DEADLINE_MS', 240000)),  # 未指定时的预算，小于 gunicorn 的 timeout
+    'max_ms': 270000,           # 预算上限，小于 INFERENCE_CONFIG['request_timeout']
+    'reserve': 0.5,             # 可选分析器之后为必需步骤（定位、文本、结构检测）保留的时间（秒）
+    # 可选分析器预计耗时的先验值（秒），运行后以实测耗时的指数滑动平均更新
+    'optional_cost_priors': {'cnn': 1.0, 'copy_move': 0.4, 'noise': 0.15, 'spectrum': 0.05},
+    'cost_ema_alpha': 0.2,
+}
+
+# 跨请求微批调度配置（见 micro_batch.py）
+BATCHING_CONFIG = {
+    'enabled': os.getenv('INFERENCE_BATCHING', '1') != '0',
+    'ocr': {'max_batch_size': 4, 'max_wait_ms': 5.0},       # 按图像计；文本识别把多张图像的文本行合并推理
+    'cnn': {'max_batch_size': 1024, 'max_wait_ms': 5.0},    # 按图像块计
+    'wait_buckets_ms': [0.5, 1, 2, 5, 10, 20, 50, 100],     # 排队等待时间直方图分桶（毫秒）
+}
+
 # OCR配置
 OCR_CONFIG = {
     'use_gpu': False,  # 使用CPU模式避免多进程CUDA初始化问题
@@ -57,5 +223,99 @@ FORGERY_THRESHOLDS = {
     # > 0.8 判定为伪造
 }
 
+# 鉴伪分析器调度配置
+SCHEDULER_CONFIG = {
+    'early_termination': True,  # 剩余分析器无法改变风险等级时跳过
+    'cost_ema_alpha': 0.2,      # 耗时滑动平均系数
+    'cost_priors': {            # 各分析器耗时先验（秒），运行后由实测值更新
+        'text': 0.001,
+        'structure': 0.01,
+        'image': 2.0,
+        'metadata': 0.0005,
+    },
+}
+
+# 元数据与来源分析配置
+METADATA_CONFIG = {
+    # 软件/工具字段中出现即视为经过编辑（不区分大小写的子串匹配）
+    'editor_signatures': [
+        'photoshop', 'gimp', 'paint.net', 'pixelmator', 'affinity photo', 'coreldraw',
+        'illustrator', 'inkscape', 'canva', 'snapseed', 'picsart', 'meitu', '美图',
+        'pdf-xchange', 'foxit phantompdf', 'sejda', 'pdfescape', 'ilovepdf', 'smallpdf', 'pdffiller',
+    ],
+    'modification_gap_hours': 24,   # 修改时间与创建时间相差超过该值视为后期修改
+    'flag_weights': {               # 各可疑项对元数据得分的贡献
+        'editor_software': 0.6,
+        'timestamp_order': 0.5,
+        'future_timestamp': 0.5,
+        'modified_after_creation': 0.3,
+        'incremental_update': 0.3,
+    },
+}
+
+# 模板匹配配置
+TEMPLATE_MANIFEST_PATH = BASE_DIR / 'templates.json'  # 模板清单（字段同 certificate_templates 表）
+TEMPLATE_CONFIG = {
+    'layout_grid': 16,          # 布局占用网格边长
+    'max_side': 800,            # 关键点提取图像长边（像素）
+    'max_keypoints': 500,       # 每个模板的关键点数量上限
+    'max_hamming': 48,          # 关键点最近邻汉明距离上限
+    'ratio': 0.8,               # 最近邻/次近邻距离比阈值
+    'top_k': 3,                 # 按布局取前K个模板做关键点验证
+    'layout_weight': 0.5,       # 布局相似度在综合相似度中的权重
+    'min_similarity': 0.6,      # 综合相似度低于该值时判为偏离模板
+    'spectrum_width': 1280,     # 背景频谱：文档先缩放到该宽度，底纹周期在模板与待检文档间可比
+    'spectrum_size': 256,       # FFT切片边长
+    'spectrum_tiles': 3,        # 每边均匀取的切片数（共 tiles*tiles 次FFT）
+    'spectrum_grid': 32,        # 周期峰最大值汇聚成的网格边长（频谱签名维度 grid*grid）
+    'spectrum_min_radius': 0.06,  # 去掉的低频半径（相对FFT边长），低频主要反映版面内容
+    'min_spectrum_similarity': 0.6,  # 与最近模板的频谱相似度低于该值时判为底纹/水印异常
+}
+
+# 文本对齐检查配置（容差均以文档主体行高为单位，角度单位为度）
+ALIGNMENT_CONFIG = {
+    'min_boxes': 5,             # 文本框少于该数量时不做对齐检查
+    'edge_tolerance': 0.2,      # 左边缘对齐容差
+    'baseline_tolerance': 0.25, # 行内基线偏差容差
+    'height_tolerance': 0.35,   # 行高偏差容差
+    'skew_tolerance': 1.5,      # 倾斜角偏差容差
+    'max_outlier_fraction': 0.3,  # 离群文本框比例达到该值时得分为1
+}
+
+# 逐行字体一致性检查配置
+FONT_CONFIG = {
+    'max_lines': 200,           # 参与分析的文本行数上限
+    'padding': 4,               # 拼接图中各行之间的空白行数
+    'min_component_area': 4,    # 小于该面积的连通域视为噪点
+    'title_height_ratio': 1.6,  # 行高超过主体行高该倍数的行视为标题
+    'numeric_fraction': 0.5,    # 数字字符比例达到该值的行视为数值行（日期、编号、数量）
+    'min_lines_per_role': 3,    # 同类行少于该数量时不做比较
+    'relative_floor': 0.05,     # 离散度下限（相对中位数），同一字体MAD接近0时避免放大
+    'z_threshold': 3.0,         # 笔画宽度或字高的稳健偏离度超过该值判为离群行
+    'max_outlier_fraction': 0.2,  # 离群行比例达到该值时得分为1
+}
+
+# 红色印章检测配置
+SEAL_CONFIG = {
+    'max_side': 1000,           # 分析前将图像长边缩小到该值
+    'red_hue': (10, 160),       # OpenCV色相 <= 10 或 >= 160 视为红色
+    'min_saturation': 70,
+    'min_value': 50,
+    'min_area_fraction': 0.0005,  # 红色连通域面积占图像比例的下限/上限
+    'max_area_fraction': 0.1,
+    'aspect_range': (0.6, 1.6),   # 外接矩形宽高比范围（圆形/椭圆印章）
+    'min_circularity': 0.7,       # 凸包圆度下限
+    'expected_count': (1, 3),     # 正常证书的印章数量范围
+    'bbox_margin': 0.05,          # 印章中心允许超出证件边界框的比例
+    'sharpness_tolerance': 1.25,  # 印章与周围印刷文字的边缘锐度比超出 [1/t, t] 视为可疑
+    'color_saturation': 20,       # 平均饱和度低于该值视为灰度扫描件，不检查印章缺失
+    'flag_scores': {
+        'missing_seal': 0.6,
+        'extra_seals': 0.4,
+        'outside_bbox': 0.5,
+        'sharpness_mismatch': 0.6,
+    },
+}
+
 # 训练数据集路径
 BOOKS_DIR = BASE_DIR / 'books'
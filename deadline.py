@@ -0,0 +1,101 @@
+"""
+请求截止时间
+每个分析请求携带一个截止时间，依次传给 detect_certificate、extract 和 ForgeryDetectionSystem.detect；
+剩余时间不足以运行可选分析器（CNN、复制-移动等）时跳过这些分析器并把结果标记为降级，
+而不是让整个请求超时。
+"""
+import time
+from typing import Optional
+
+from config import DEADLINE_CONFIG
+
+
+class Deadline:
+    """基于单调时钟的截止时间
+
+    跨进程传递时传绝对截止时刻（epoch_ms，Unix时间戳毫秒），接收方用 Deadline.at_epoch_ms 重建，
+    套接字排队和传输所用的时间也计入预算（Web进程和推理进程在同一台机器上，共用系统时钟）。
+    """
+
+    def __init__(self, expires_at: float):
+        """
+        Args:
+            expires_at: time.monotonic() 时间轴上的截止时刻
+        """
+        self.expires_at = expires_at
+
+    @classmethod
+    def after_ms(cls, budget_ms: Optional[float]) -> Optional['Deadline']:
+        """从现在起 budget_ms 毫秒后截止，None 表示不限时"""
+        if budget_ms is None:
+            return None
+        return cls(time.monotonic() + max(float(budget_ms), 0.0) / 1000.0)
+
+    @classmethod
+    def at_epoch_ms(cls, epoch_ms: Optional[float]) -> Optional['Deadline']:
+        """在Unix时间戳 epoch_ms（毫秒）截止，None 表示不限时"""
+        if epoch_ms is None:
+            return None
+        return cls.after_ms(float(epoch_ms) - time.time() * 1000.0)
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> Optional['Deadline']:
+        """
+        解析 X-Deadline-Ms 请求头
+
+        取值为剩余时间预算（毫秒）；大于 1e12 时视为Unix时间戳（毫秒）形式的绝对截止时刻。
+        缺省或无法解析时使用 config.DEADLINE_CONFIG['default_ms']，不超过 max_ms。
+
+        Returns:
+            截止时间，default_ms 为 None 且请求未指定时返回 None
+        """
+        budget_ms = DEADLINE_CONFIG['default_ms']
+        if value:
+            try:
+                number = float(value)
+                budget_ms = number - time.time() * 1000.0 if number > 1e12 else number
+            except ValueError:
+                print(f"无法解析截止时间: {value}")
+
+        if budget_ms is None:
+            return None
+        return cls.after_ms(min(budget_ms, DEADLINE_CONFIG['max_ms']))
+
+    def remaining(self) -> float:
+        """剩余时间（秒），已过期时为负"""
+        return self.expires_at - time.monotonic()
+
+    def remaining_ms(self) -> float:
+        """剩余时间（毫秒），不小于0"""
+        return max(self.remaining(), 0.0) * 1000.0
+
+    def epoch_ms(self) -> float:
+        """截止时刻的Unix时间戳（毫秒）"""
+        return time.time() * 1000.0 + self.remaining() * 1000.0
+
+    def expired(self) -> bool:
+        """是否已过截止时间"""
+        return self.remaining() <= 0
+
+    def reserving(self, reserve: Optional[float] = None) -> 'Deadline':
+        """
+        提前 reserve 秒的截止时间（可选步骤的等待上限，为后续必需步骤留出时间）
+
+        Args:
+            reserve: 为后续必需步骤保留的时间（秒），默认 config.DEADLINE_CONFIG['reserve']
+        """
+        if reserve is None:
+            reserve = DEADLINE_CONFIG['reserve']
+        return Deadline(self.expires_at - reserve)
+
+    def allows(self, cost: float, reserve: Optional[float] = None) -> bool:
+        """
+        剩余时间是否足够运行预计耗时 cost 秒的步骤
+
+        Args:
+            cost: 该步骤的预计耗时（秒）
+            reserve: 为后续必需步骤保留的时间（秒），默认 config.DEADLINE_CONFIG['reserve']
+        """
+        if reserve is None:
+            reserve = DEADLINE_CONFIG['reserve']
+        return self.remaining() - reserve >= cost
@@ -0,0 +1,130 @@
+"""
+鉴伪CNN模型导出工具
+将 module3_forgery.FORGERY_MODELS 中的网络导出为 TorchScript 和 ONNX，供CPU推理后端加载
+"""
+import sys
+from pathlib import Path
+import torch
+
+from module3_forgery import FORGERY_MODELS
+from config import CNN_MODEL_PATH, CNN_TORCHSCRIPT_PATH, CNN_ONNX_PATH, CNN_INFERENCE_CONFIG
+
+
+def load_eager_model(architecture: str = 'simple', weights_path=CNN_MODEL_PATH,
+                     random_init: bool = False) -> torch.nn.Module:
+    """
+    构建eager模型并加载权重
+
+    Args:
+        architecture: 网络结构名称
+        weights_path: 权重文件路径
+        random_init: 权重不存在时是否使用随机初始化（仅用于基准测试）
+
+    Returns:
+        eval模式的模型
+    """
+    model = FORGERY_MODELS[architecture]()
+
+    if weights_path and Path(weights_path).exists():
+        checkpoint = torch.load(str(weights_path), map_location='cpu')
+        if isinstance(checkpoint, dict) and 'state_dict' in checkpoint:
+            checkpoint = checkpoint['state_dict']
+        model.load_state_dict(checkpoint)
+    elif not random_init:
+        raise FileNotFoundError(f"权重文件不存在: {weights_path}")
+
+    return model.eval()
+
+
+def export_torchscript(model: torch.nn.Module, output_path) -> Path:
+    """
+    导出为冻结的 TorchScript 模型
+
+    Args:
+        model: eval模式的eager模型
+        output_path: 输出路径
+
+    Returns:
+        输出路径
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    scripted = torch.jit.script(model)
+    scripted = torch.jit.freeze(scripted)
+    scripted.save(str(output_path))
+
+    return output_path
+
+
+def export_onnx(model: torch.nn.Module, output_path, patch_size: int, opset: int = 17) -> Path:
+    """
+    导出为批大小可变的 ONNX 模型
+
+    Args:
+        model: eval模式的eager模型
+        output_path: 输出路径
+        patch_size: 图像块边长
+        opset: ONNX opset版本
+
+    Returns:
+        输出路径
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    dummy = torch.rand(1, 3, patch_size, patch_size)
+    torch.onnx.export(
+        model,
+        dummy,
+        str(output_path),
+        input_names=['patches'],
+        output_names=['probs'],
+        dynamic_axes={'patches': {0: 'batch'}, 'probs': {0: 'batch'}},
+        opset_version=opset
+    )
+
+    return output_path
+
+
+if __name__ == '__main__':
+    # 设置控制台编码
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='鉴伪CNN模型导出工具')
+    parser.add_argument('--architecture', choices=sorted(FORGERY_MODELS.keys()),
+                        default=CNN_INFERENCE_CONFIG['architecture'], help='网络结构')
+    parser.add_argument('--weights', default=str(CNN_MODEL_PATH), help='eager模型权重路径')
+    parser.add_argument('--format', choices=['torchscript', 'onnx', 'all'], default='all',
+                        help='导出格式')
+    parser.add_argument('--torchscript-output', default=str(CNN_TORCHSCRIPT_PATH),
+                        help='TorchScript输出路径')
+    parser.add_argument('--onnx-output', default=str(CNN_ONNX_PATH), help='ONNX输出路径')
+    parser.add_argument('--patch-size', type=int, default=CNN_INFERENCE_CONFIG['patch_size'],
+                        help='图像块边长')
+    parser.add_argument('--opset', type=int, default=17, help='ONNX opset版本')
+
+    args = parser.parse_args()
+
+    print("="*80)
+    print("鉴伪CNN模型导出")
+    print("="*80)
+
+    try:
+        model = load_eager_model(args.architecture, args.weights)
+    except FileNotFoundError as e:
+        print(f"\n✗ {str(e)}")
+        sys.exit(1)
+
+    if args.format in ('torchscript', 'all'):
+        path = export_torchscript(model, args.torchscript_output)
+        print(f"✓ TorchScript: {path}")
+
+    if args.format in ('onnx', 'all'):
+        path = export_onnx(model, args.onnx_output, args.patch_size, args.opset)
+        print(f"✓ ONNX: {path}")
+
+    print("\n在 config.py 中设置 CNN_INFERENCE_CONFIG['backend']（或环境变量 CNN_BACKEND）以切换推理后端")
@@ -1,13 +1,20 @@
 """
 Gunicorn 配置文件 - GPU优化版本
 """
+import gc
+import os
 import multiprocessing
 
+# 模型推理由 inference_server.py 的推理进程池执行，HTTP worker 只做转发
+os.environ.setdefault('INFERENCE_MODE', 'remote')
+
 # 绑定地址
 bind = "0.0.0.0:5000"
 
 # Worker配置 - GPU环境下使用较少worker
-workers = 2  # GPU环境建议2-4个worker
+workers = 2  # HTTP worker不加载模型，推理进程数见 INFERENCE_WORKERS
+# INFERENCE_MODE=local 时模型在各 worker 中加载，线程预算按 worker 数分配（见 thread_budget.py）
+os.environ.setdefault('WEB_WORKERS', str(workers))
 worker_class = "gevent"  # 使用gevent异步worker
 worker_connections = 1000
 
@@ -28,7 +35,12 @@ proc_name = "credit_detection_gpu"
 # 预加载应用
 preload_app = True
 
-# 最大请求数后重启worker
+
+def pre_fork(server, worker):
+    """fork 前冻结 master 中已有的对象，worker 的GC不再写入这些对象所在的页（INFERENCE_MODE=local 时包括模型）"""
+    gc.freeze()
+
+# 最大请求数后重启worker（HTTP worker不加载模型；推理进程按内存上限回收，见 memory_watchdog.py）
 max_requests = 1000
 max_requests_jitter = 50
 
@@ -0,0 +1,163 @@
+"""
+推理服务客户端
+HTTP worker 通过本地Unix套接字把请求转发给常驻推理进程池（见 inference_server.py）。
+本模块不导入 paddle/torch；gevent worker 打过猴子补丁后套接字读写是协作式的，
+等待推理结果时不会阻塞同一 worker 中的其他请求。图像在Web进程解码一次后经共享内存交给推理进程
+（见 shared_image.py），套接字上只传描述符。
+"""
+import os
+import pickle
+import socket
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from config import INFERENCE_CONFIG, UPLOAD_FOLDER
+from shared_image import SharedImagePool, decode_image
+
+
+# 消息帧：8字节大端长度 + pickle 负载（仅用于本机受信任进程之间）
+HEADER = struct.Struct('>Q')
+
+
+class InferenceError(Exception):
+    """推理服务不可用或通信失败"""
+
+
+def run_blocking(fn, *args):
+    """
+    执行CPU密集的调用（图像解码、拷贝、上传内容哈希）
+
+    gevent worker 打过猴子补丁时放到 hub 的原生线程池执行，等待期间事件循环继续处理其他请求
+    （cv2.imdecode 和大数组拷贝执行时释放GIL）；否则直接调用。fn 中不能使用 gevent 锁。
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return fn(*args)
+    if not monkey.is_module_patched('socket'):
+        return fn(*args)
+
+    import gevent
+    return gevent.get_hub().threadpool.apply(fn, args)
+
+
+def send_message(sock: socket.socket, message) -> None:
+    """发送一条消息"""
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def recv_message(sock: socket.socket):
+    """接收一条消息，连接在消息中途关闭时抛出 ConnectionError"""
+    (length,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    return pickle.loads(_recv_exact(sock, length))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    """读取恰好 size 字节"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError('连接已关闭')
+        received += count
+    return buffer
+
+
+def heatmap_paths(filename: str) -> Tuple[Path, Path]:
+    """返回上传文件对应的热力图数据文件和叠加图缓存文件路径"""
+    stem = Path(filename).stem
+    return UPLOAD_FOLDER / f"{stem}_heatmap.npz", UPLOAD_FOLDER / f"{stem}_heatmap.png"
+
+
+class InferenceClient:
+    """推理服务客户端
+
+    每个请求建立一条短连接（本机Unix套接字连接开销可以忽略），空闲的推理进程接受连接后
+    处理请求并返回结果；所有推理进程都忙时连接在套接字队列中等待。
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = None):
+        """
+        初始化客户端
+
+        Args:
+            socket_path: 推理服务套接字路径，默认使用 config.INFERENCE_CONFIG['socket_path']
+            timeout: 单个请求的等待上限（秒）
+        """
+        self.socket_path = str(socket_path or INFERENCE_CONFIG['socket_path'])
+        self.timeout = timeout if timeout is not None else INFERENCE_CONFIG['request_timeout']
+        self.pool = None
+        self.pool_pid = None
+
+    def analyze(self, filename: str, deadline=None) -> Dict:
+        """
+        分析上传目录中的证件文件，返回 {'success', 'result' | 'error'}
+
+        Args:
+            filename: 上传目录中的文件名
+            deadline: 请求截止时间（deadline.Deadline，可选），以绝对截止时刻传给推理进程
+        """
+        message = {
+            'op': 'analyze',
+            'filename': filename,
+            'image': None,
+            'deadline_epoch_ms': deadline.epoch_ms() if deadline is not None else None
+        }
+
+        pool = self._image_pool()
+        # 解码和像素拷贝是CPU密集操作，不能占住 gevent worker 的事件循环
+        image = run_blocking(decode_image, UPLOAD_FOLDER / filename) if pool is not None else None
+        if image is None:
+            # PDF、无法解码或未启用共享内存时由推理进程读取文件
+            return self.request(message)
+
+        with pool.lease(image, run=run_blocking) as descriptor:
+            del image
+            message['image'] = descriptor
+            return self.request(message)
+
+    def render_heatmap(self, filename: str) -> Dict:
+        """渲染并缓存热力图叠加图，返回 {'success', 'path' | 'error'}"""
+        return self.request({'op': 'render_heatmap', 'filename': filename})
+
+    def stats(self) -> Dict:
+        """响应该请求的推理进程的微批调度统计"""
+        return self.request({'op': 'stats'}, timeout=5.0)
+
+    def ping(self, timeout: float = 2.0) -> Dict:
+        """检查推理服务是否可用"""
+        return self.request({'op': 'ping'}, timeout=timeout)
+
+    def _image_pool(self) -> Optional[SharedImagePool]:
+        """当前进程的共享内存缓冲池
+
+        gunicorn preload_app 时客户端在 master 中创建，按PID延迟创建，保证各 worker 使用各自的段。
+        """
+        if not INFERENCE_CONFIG['shared_memory']:
+            return None
+        if self.pool_pid != os.getpid():
+            self.pool = SharedImagePool()
+            self.pool_pid = os.getpid()
+        return self.pool
+
+    def request(self, message: Dict, timeout: Optional[float] = None) -> Dict:
+        """
+        发送请求并等待结果
+
+        Raises:
+            InferenceError: 推理服务未启动、超时或连接中断
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(timeout if timeout is not None else self.timeout)
+            sock.connect(self.socket_path)
+            send_message(sock, message)
+            return recv_message(sock)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            raise InferenceError(f"推理服务通信失败: {str(e)}") from e
+        finally:
+            sock.close()
@@ -0,0 +1,532 @@
+"""
+推理服务
+常驻推理进程池：通过本地Unix套接字处理 HTTP worker（见 inference_client.py）转发的请求。
+父进程加载 PaddleOCR 和鉴伪模型并预热一次，冻结GC后再派生推理进程，各推理进程按写时复制
+共享模型所在的内存页；父进程之后只负责监听套接字、派生和重启推理进程。
+
+用法:
+    python inference_server.py [--workers N] [--socket PATH]
+    python inference_server.py --memory-report    # 查看运行中的推理进程池的共享/私有内存
+"""
+import os
+import gc
+import sys
+import json
+import tempfile
+import signal
+import socket
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, Optional
+
+# OpenMP/MKL/OpenBLAS 在库加载时读取线程数环境变量，线程预算必须在导入 numpy/cv2 之前写入
+# （INFERENCE_MODE=local 时 app.py 已按Web进程数设置，这里不覆盖）
+from thread_budget import governor
+if governor.budget is None:
+    governor.configure()
+
+import cv2
+import numpy as np
+
+from inference_client import send_message, recv_message, heatmap_paths
+from shared_image import attach_image, decode_image, sweep_stale_segments
+from deadline import Deadline
+from memory_stats import pool_memory, process_memory, format_pool_memory
+from memory_watchdog import MemoryWatchdog
+from config import INFERENCE_CONFIG, MEMORY_WATCHDOG_CONFIG, OCR_CONFIG, UPLOAD_FOLDER
+
+
+class AnalysisPipeline:
+    """证件分析流水线：元数据 -> 检测/OCR -> 信息提取 -> 鉴伪
+
+    在推理进程内运行（INFERENCE_MODE=local 时在Web进程内运行）。
+    """
+
+    def __init__(self):
+        """加载模型（paddle/torch 只在这里导入）"""
+        from module1_detection import CertificateDetector
+        from module2_extraction import CertificateExtractor
+        from module3_forgery import ForgeryDetectionSystem, ImageForgeryDetector
+
+        governor.apply_runtime()
+        self.detector = CertificateDetector()
+        self.extractor = CertificateExtractor()
+        self.forgery_system = ForgeryDetectionSystem()
+        self.render_overlay = ImageForgeryDetector.render_heatmap_overlay
+        self.watchdog: Optional[MemoryWatchdog] = None    # 推理进程中由 InferenceServer 设置
+
+    def handle(self, request: Dict) -> Dict:
+        """按 op 分派请求"""
+        op = request.get('op')
+        if op == 'analyze':
+            # 绝对截止时刻：在套接字队列中等待的时间也计入预算
+            deadline = Deadline.at_epoch_ms(request.get('deadline_epoch_ms'))
+            descriptor = request.get('image')
+            if descriptor is None:
+                return self.analyze(request['filename'], deadline=deadline)
+            # Web进程已解码的图像在共享内存中，离开 with 块前释放对映射的引用
+            with attach_image(descriptor) as image:
+                response = self.analyze(request['filename'], image, deadline)
+                del image
+            return response
+        if op == 'render_heatmap':
+            return self.render_heatmap(request['filename'])
+        if op == 'stats':
+            return self.stats()
+        if op == 'ping':
+            return {'success': True, 'pid': os.getpid(), 'threads': governor.report()}
+        return {'success': False, 'error': f'未知的请求类型: {op}'}
+
+    def analyze(self, filename: str, image: Optional[np.ndarray] = None,
+                deadline: Optional[Deadline] = None) -> Dict:
+        """
+        分析上传目录中的证件文件
+
+        Args:
+            filename: 上传目录中的文件名
+            image: 已解码的BGR图像（可选，None 时在此解码一次，各阶段共用）
+            deadline: 请求截止时间（可选），剩余时间不足时跳过可选分析器，结果标记为降级
+
+        Returns:
+            {'success': True, 'result': {...}} 或 {'success': False, 'error': ...}
+        """
+        filepath = UPLOAD_FOLDER / filename
+        if image is None:
+            image = decode_image(filepath)
+
+        # 步骤0: 元数据与来源检测（只读文件头部，不解码图像）
+        metadata_result = self.forgery_system.inspect_metadata(str(filepath))
+
+        # 步骤1: 检测证件
+        detection_result = self.detector.detect_certificate(str(filepath), image, deadline)
+
+        if detection_result['deadline_exceeded']:
+            return {
+                'success': False,
+                'deadline_exceeded': True,
+                'error': '请求排队时间过长，已超过截止时间，请稍后重试'
+            }
+
+        if not detection_result['has_certificate']:
+            return {
+                'success': False,
+                'error': '未检测到证件，请确认上传的是证件图片'
+            }
+
+        # 步骤2: 提取结构化信息
+        extraction_result = self.extractor.extract(
+            detection_result['ocr_text'],
+            detection_result['certificate_type'],
+            deadline
+        )
+
+        # 步骤3: 鉴伪检测
+        forgery_result = self.forgery_system.detect(
+            str(filepath),
+            detection_result['ocr_result'],
+            detection_result['ocr_text'],
+            extraction_result['extracted_fields'],
+            detection_result['certificate_type'],
+            detection_result['bbox'],
+            metadata=metadata_result,
+            image=image,
+            deadline=deadline
+        )
+
+        # 保存定位结果（叠加图按需渲染）
+        localization = forgery_result.get('image_localization')
+        suspicious_regions = []
+        cloned_regions = []
+        heatmap_url = None
+        if localization:
+            cloned_regions = localization.get('cloned_regions', [])
+            if localization['heatmap'].size > 0:
+                self.save_localization(filename, localization)
+                suspicious_regions = localization['regions']
+                heatmap_url = f"/api/heatmap/{filename}"
+
+        result = {
+            'certificate_type': detection_result['certificate_type'],
+            'confidence': detection_result['confidence'],
+            'extracted_fields': extraction_result['extracted_fields'],
+            'degraded': forgery_result['degraded'] or extraction_result['degraded'],
+            'forgery_result': {
+                'forgery_score': forgery_result['forgery_score'],
+                'forgery_risk': forgery_result['forgery_risk'],
+                'score_bounds': forgery_result['score_bounds'],
+                'score_complete': forgery_result['score_complete'],
+                'risk_determined': forgery_result['risk_determined'],
+                'image_score': forgery_result['image_score'],
+                'image_score_bounds': forgery_result['image_score_bounds'],
+                'text_score': forgery_result['text_score'],
+                'structure_score': forgery_result['structure_score'],
+                'metadata_score': forgery_result['metadata_score'],
+                'image_analysis': forgery_result['image_analysis'],
+                'text_analysis': forgery_result['text_analysis'],
+                'structure_analysis': forgery_result['structure_analysis'],
+                'metadata_analysis': forgery_result['metadata_analysis'],
+                'metadata': forgery_result['metadata'],
+                'suspicious_regions': suspicious_regions,
+                'cloned_regions': cloned_regions,
+                'seal_regions': forgery_result['seal_regions'],
+                'skipped_analyzers': forgery_result['skipped_analyzers'],
+                'degraded_analyzers': forgery_result['degraded_analyzers'],
+                'heatmap_url': heatmap_url,
+                'recommendation': forgery_result['recommendation']
+            }
+        }
+
+        return {'success': True, 'result': result}
+
+    def warmup(self):
+        """
+        用合成图像完整运行一次分析流程
+
+        PaddleOCR、torch 和 OpenCV 在首次推理时才分配缓冲区、选择算子实现；在父进程中预热后，
+        这些内存也在 fork 后与推理进程共享，第一个真实请求也不再承担初始化耗时。
+        """
+        image = np.full((800, 1200, 3), 255, dtype=np.uint8)
+        cv2.rectangle(image, (40, 40), (1160, 760), (0, 0, 0), 3)
+        for i, text in enumerate(['CERTIFICATE 2024', 'NAME ZHANG SAN', 'NO 110101199001011234', 'DATE 2024-01-01']):
+            cv2.putText(image, text, (100, 160 + i * 150), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (0, 0, 0), 4)
+
+        fd, path = tempfile.mkstemp(prefix='_warmup_', suffix='.png', dir=str(UPLOAD_FOLDER))
+        os.close(fd)
+        filename = Path(path).name
+        start = time.perf_counter()
+        try:
+            cv2.imwrite(path, image)
+            self.analyze(filename, image)
+            print(f"模型预热完成，耗时 {time.perf_counter() - start:.1f} 秒")
+        except Exception as e:
+            print(f"模型预热失败（不影响服务）: {str(e)}")
+        finally:
+            for leftover in (Path(path),) + tuple(heatmap_paths(filename)):
+                leftover.unlink(missing_ok=True)
+
+    def stats(self) -> Dict:
+        """本进程各微批调度器的批大小和排队等待时间直方图、内存看门狗状态，以及推理进程池的内存"""
+        batchers = {
+            'ocr': self.detector.ocr_batcher,
+            'cnn': self.forgery_system.image_detector.patch_batcher
+        }
+        return {
+            'success': True,
+            'pid': os.getpid(),
+            'batching': {name: batcher.stats() for name, batcher in batchers.items() if batcher is not None},
+            'watchdog': self.watchdog.stats() if self.watchdog is not None else None,
+            'memory': self.memory()
+        }
+
+    @staticmethod
+    def memory() -> Dict:
+        """推理进程池各进程的共享/私有内存（MB）；不在推理服务中运行时只报告当前进程"""
+        server_pid = _server_pid()
+        if server_pid is not None and server_pid == os.getppid():
+            return pool_memory(server_pid)
+        return {'process': process_memory()}
+
+    def save_localization(self, filename: str, localization: Dict):
+        """
+        保存紧凑热力图和可疑区域，供叠加图接口按需渲染
+
+        热力图只有几KB，叠加图PNG在首次请求时才生成。
+        """
+        data_path, _ = heatmap_paths(filename)
+        np.savez_compressed(
+            str(data_path),
+            heatmap=localization['heatmap'],
+            regions=np.array(json.dumps(localization['regions']))
+        )
+
+    def render_heatmap(self, filename: str) -> Dict:
+        """
+        渲染热力图叠加图并缓存为PNG
+
+        Returns:
+            {'success': True, 'path': 缓存PNG路径} 或 {'success': False, 'error': ..., 'status': HTTP状态码}
+        """
+        image_path = UPLOAD_FOLDER / filename
+        data_path, png_path = heatmap_paths(filename)
+
+        if png_path.exists():
+            return {'success': True, 'path': str(png_path)}
+
+        if not image_path.exists() or not data_path.exists():
+            return {'success': False, 'error': '热力图不存在', 'status': 404}
+
+        if image_path.suffix.lower() == '.pdf':
+            image = self.detector._convert_pdf_to_image(str(image_path))
+        else:
+            with open(image_path, 'rb') as f:
+                image = cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+
+        if image is None:
+            return {'success': False, 'error': '无法读取图像', 'status': 404}
+
+        with np.load(str(data_path)) as data:
+            heatmap = data['heatmap']
+            regions = json.loads(str(data['regions']))
+
+        overlay = self.render_overlay(image, heatmap, regions)
+        success, encoded = cv2.imencode('.png', overlay)
+        if not success:
+            return {'success': False, 'error': '热力图渲染失败', 'status': 500}
+
+        # 先写临时文件再改名，避免并发请求读到不完整的缓存
+        tmp_path = png_path.with_suffix(f'.png.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, png_path)
+
+        return {'success': True, 'path': str(png_path)}
+
+
+class InferenceServer:
+    """推理进程池
+
+    父进程创建监听套接字后派生 num_workers 个推理进程，各进程在同一套接字上 accept，
+    由内核把连接分给空闲进程；推理进程退出（异常，或内存超限后主动回收）后父进程自动重启该槽位。每个推理进程用
+    threads_per_worker 个线程并发处理请求，OCR和CNN推理经微批调度跨请求合批（见 micro_batch.py）。
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, num_workers: Optional[int] = None,
+                 threads_per_worker: Optional[int] = None):
+        """
+        初始化推理服务
+
+        Args:
+            socket_path: 监听的Unix套接字路径，默认使用 config.INFERENCE_CONFIG['socket_path']
+            num_workers: 推理进程数，默认使用 config.INFERENCE_CONFIG['num_workers']
+            threads_per_worker: 每个推理进程的请求线程数，默认使用 config.INFERENCE_CONFIG['threads_per_worker']
+        """
+        self.socket_path = Path(socket_path or INFERENCE_CONFIG['socket_path'])
+        self.num_workers = int(num_workers or INFERENCE_CONFIG['num_workers'])
+        self.threads_per_worker = max(1, int(threads_per_worker or INFERENCE_CONFIG['threads_per_worker']))
+        self.listener = None
+        self.children = {}          # pid -> 槽位号
+        self.stopping = False
+        self.pipeline = None        # 预加载时由父进程持有，推理进程 fork 后共享
+
+    def serve_forever(self):
+        """启动推理进程池并监护，直到收到 SIGTERM/SIGINT"""
+        self._bind()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        if self._should_preload():
+            self._preload()
+
+        for slot in range(self.num_workers):
+            self._spawn(slot)
+
+        try:
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+
+                slot = self.children.pop(pid, None)
+                if slot is None or self.stopping:
+                    continue
+
+                if status == 0:
+                    print(f"推理进程 {pid} (槽位 {slot}) 因内存超限已回收，"
+                          f"{INFERENCE_CONFIG['restart_delay']} 秒后重启")
+                else:
+                    print(f"推理进程 {pid} (槽位 {slot}) 退出，状态 {status}，"
+                          f"{INFERENCE_CONFIG['restart_delay']} 秒后重启")
+                time.sleep(INFERENCE_CONFIG['restart_delay'])
+                if not self.stopping:
+                    self._spawn(slot)
+        finally:
+            self._cleanup()
+
+    def _bind(self):
+        """创建监听套接字（清理上次异常退出遗留的套接字文件和共享内存段）"""
+        sweep_stale_segments()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(str(self.socket_path))
+        os.chmod(str(self.socket_path), 0o660)
+        self.listener.listen(int(INFERENCE_CONFIG['backlog']))
+
+    @staticmethod
+    def _should_preload() -> bool:
+        """是否在父进程中加载模型（CUDA上下文不能跨 fork 使用，GPU模式下由各推理进程自行加载）"""
+        if not INFERENCE_CONFIG['preload']:
+            return False
+        if OCR_CONFIG.get('use_gpu'):
+            print("OCR使用GPU，推理进程各自加载模型")
+            return False
+        return True
+
+    def _preload(self):
+        """
+        在父进程中加载模型、预热，然后冻结GC
+
+        加载前关闭自动GC，避免回收在模型对象之间留下空洞；fork 前 gc.freeze() 把现有对象移入
+        永久代，推理进程的GC不再遍历（写入）这些对象，模型所在的页保持共享。
+        预热时 torch 只用1个线程（见 ThreadGovernor.single_threaded），父进程不留下 fork 后不可用的
+        OpenMP 线程池；推理进程中的线程数仍按线程预算。
+        """
+        gc.disable()
+        start = time.perf_counter()
+        self.pipeline = AnalysisPipeline()
+        print(f"父进程模型加载完成，耗时 {time.perf_counter() - start:.1f} 秒")
+        with governor.single_threaded():
+            self.pipeline.warmup()
+        gc.freeze()
+        print(f"已冻结 {gc.get_freeze_count()} 个对象，推理进程共享模型内存")
+
+    def _spawn(self, slot: int):
+        """派生一个推理进程"""
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._worker_main(slot)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.children[pid] = slot
+        print(f"推理进程 {pid} (槽位 {slot}) 已启动")
+
+    def _worker_main(self, slot: int):
+        """推理进程主循环：加载一次模型，之后由多个请求线程并发处理连接，内存超限时返回"""
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由父进程统一处理
+        governor.apply_runtime()
+
+        if self.pipeline is not None:
+            # 父进程已冻结预加载的对象，推理进程恢复对之后新建对象的自动GC
+            gc.enable()
+            pipeline = self.pipeline
+            print(f"推理进程 {os.getpid()} (槽位 {slot}) 使用预加载的模型，请求线程数 {self.threads_per_worker}")
+        else:
+            pipeline = AnalysisPipeline()
+            print(f"推理进程 {os.getpid()} (槽位 {slot}) 模型加载完成，请求线程数 {self.threads_per_worker}")
+
+        watchdog = MemoryWatchdog()
+        pipeline.watchdog = watchdog
+        # accept 带超时，请求线程才能在回收时停止接受新连接
+        self.listener.settimeout(MEMORY_WATCHDOG_CONFIG['accept_poll'])
+
+        threads = [
+            threading.Thread(target=self._accept_loop, args=(pipeline, watchdog), name=f'request-{i}', daemon=True)
+            for i in range(self.threads_per_worker)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"推理进程 {os.getpid()} (槽位 {slot}) 在途请求已处理完，退出: {watchdog.recycle_reason}")
+
+    def _accept_loop(self, pipeline: AnalysisPipeline, watchdog: MemoryWatchdog):
+        """请求线程：逐个接受连接并处理，看门狗标记回收后退出"""
+        while not watchdog.recycling.is_set():
+            try:
+                conn, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            with conn, watchdog.request():
+                self._serve_connection(conn, pipeline)
+
+    def _serve_connection(self, conn: socket.socket, pipeline: AnalysisPipeline):
+        """读取一个请求，执行并写回结果；客户端已断开时丢弃结果"""
+        conn.settimeout(INFERENCE_CONFIG['request_timeout'])
+        try:
+            request = recv_message(conn)
+        except (OSError, EOFError) as e:
+            print(f"读取请求失败: {str(e)}")
+            return
+
+        try:
+            response = pipeline.handle(request)
+        except Exception as e:
+            traceback.print_exc()
+            response = {'success': False, 'error': f'处理错误: {str(e)}'}
+
+        try:
+            send_message(conn, response)
+        except OSError as e:
+            print(f"返回结果失败（客户端可能已超时断开）: {str(e)}")
+
+    def _handle_stop(self, signum, frame):
+        """停止服务：通知所有推理进程退出"""
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _cleanup(self):
+        """关闭监听套接字并删除套接字文件"""
+        if self.listener is not None:
+            self.listener.close()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+
+def _server_pid() -> Optional[int]:
+    """运行中的推理服务父进程PID（读取 pid 文件），未运行时返回None"""
+    try:
+        return int(Path(INFERENCE_CONFIG['pid_file']).read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+if __name__ == '__main__':
+    # 设置控制台编码
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', line_buffering=True)
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='证件分析推理服务')
+    parser.add_argument('--workers', type=int, default=INFERENCE_CONFIG['num_workers'], help='推理进程数')
+    parser.add_argument('--threads', type=int, default=INFERENCE_CONFIG['threads_per_worker'], help='每个推理进程的请求线程数')
+    parser.add_argument('--socket', default=INFERENCE_CONFIG['socket_path'], help='Unix套接字路径')
+    parser.add_argument('--memory-report', action='store_true', help='打印运行中的推理进程池的共享/私有内存后退出')
+    args = parser.parse_args()
+    # 按命令行指定的进程数和线程数重新计算（torch/paddle 尚未导入）
+    governor.configure(args.workers, args.threads)
+
+    if args.memory_report:
+        server_pid = _server_pid()
+        if server_pid is None:
+            sys.exit("推理服务未运行")
+        print(format_pool_memory(pool_memory(server_pid)))
+        sys.exit(0)
+
+    pid_file = Path(INFERENCE_CONFIG['pid_file'])
+    pid_file.parent.mkdir(parents=True, exist_ok=True)
+    pid_file.write_text(str(os.getpid()))
+
+    print("="*80)
+    print("证件分析推理服务")
+    print("="*80)
+    print(f"套接字: {args.socket}")
+    print(f"推理进程数: {args.workers}")
+    print(f"每进程请求线程数: {args.threads}")
+    if governor.budget is not None:
+        print(f"线程预算: 可用CPU {governor.budget.cpus}，每进程OCR线程 {governor.budget.ocr_threads}，"
+              f"CNN线程 {governor.budget.cnn_threads}，"
+              f"每请求线程 OpenCV/BLAS {governor.budget.request_share}")
+    print("="*80)
+
+    try:
+        InferenceServer(args.socket, args.workers, args.threads).serve_forever()
+    finally:
+        if pid_file.exists() and pid_file.read_text() == str(os.getpid()):
+            pid_file.unlink()
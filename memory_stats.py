@@ -0,0 +1,213 @@
+"""
+进程内存统计
+从 /proc/<pid>/smaps_rollup 读取进程的常驻内存，区分与其他进程共享的页和私有页。
+推理服务在 fork 前加载模型，推理进程与父进程共享模型所在的页，只有私有页是每个进程各自的开销；
+PSS（按共享进程数均摊后的内存）之和即整个推理进程池的实际内存占用。
+
+另有按请求采样用的轻量接口：当前/峰值RSS（/proc/self/statm、VmHWM）和 glibc 分配器统计。
+"""
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+PROC_DIR = Path('/proc')
+
+# smaps_rollup 字段 -> 报告字段
+SMAPS_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty',
+    'Swap': 'swap',
+}
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class _MallInfo2(ctypes.Structure):
+    """glibc struct mallinfo2（glibc >= 2.33）"""
+    _fields_ = [(name, ctypes.c_size_t) for name in (
+        'arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks', 'fsmblks', 'uordblks', 'fordblks', 'keepcost'
+    )]
+
+
+_libc = None
+
+
+def _glibc():
+    """
+    加载C库，无法加载时返回None
+
+    mallinfo2（glibc >= 2.33）和 malloc_trim 分别检查：旧版 glibc 只是没有分配器统计，
+    malloc_trim 仍然可用；musl、macOS 两者都没有。
+    """
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+        except OSError:
+            _libc = False
+            return None
+        if hasattr(libc, 'mallinfo2'):
+            libc.mallinfo2.restype = _MallInfo2
+        if hasattr(libc, 'malloc_trim'):
+            libc.malloc_trim.argtypes = [ctypes.c_size_t]
+            libc.malloc_trim.restype = ctypes.c_int
+        _libc = libc
+    return _libc or None
+
+
+def process_memory(pid: Optional[int] = None) -> Optional[Dict]:
+    """
+    读取进程的内存统计
+
+    Args:
+        pid: 进程ID，默认当前进程
+
+    Returns:
+        各项内存（MB），含 shared（共享页）和 private（私有页）；进程不存在或无权限读取时返回None
+    """
+    pid = pid or os.getpid()
+    totals = {name: 0 for name in SMAPS_FIELDS.values()}
+
+    # 旧内核没有 smaps_rollup，逐个映射累加 smaps
+    for filename in ('smaps_rollup', 'smaps'):
+        path = PROC_DIR / str(pid) / filename
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, value = line.partition(':')
+                    name = SMAPS_FIELDS.get(key)
+                    if name is not None:
+                        totals[name] += int(value.split()[0])
+            break
+        except FileNotFoundError:
+            continue
+        except (PermissionError, ProcessLookupError, ValueError):
+            return None
+    else:
+        return None
+
+    report = {name: round(kb / 1024.0, 1) for name, kb in totals.items()}
+    report['shared'] = round((totals['shared_clean'] + totals['shared_dirty']) / 1024.0, 1)
+    report['private'] = round((totals['private_clean'] + totals['private_dirty']) / 1024.0, 1)
+    return report
+
+
+def child_pids(parent_pid: int) -> List[int]:
+    """列出 parent_pid 的直接子进程"""
+    children = []
+    for entry in PROC_DIR.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+        # 进程名可能含空格和括号，从最后一个 ')' 之后解析：state ppid ...
+        fields = stat[stat.rfind(')') + 2:].split()
+        if len(fields) > 1 and int(fields[1]) == parent_pid:
+            children.append(int(entry.name))
+    return sorted(children)
+
+
+def pool_memory(parent_pid: int) -> Dict:
+    """
+    进程池的内存报告：父进程和各子进程的共享/私有内存
+
+    Args:
+        parent_pid: 进程池父进程ID
+
+    Returns:
+        {'parent': {...}, 'workers': {pid: {...}}, 'total_pss': MB, 'total_private': MB}
+    """
+    parent = process_memory(parent_pid)
+    workers = {}
+    for pid in child_pids(parent_pid):
+        memory = process_memory(pid)
+        if memory is not None:
+            workers[pid] = memory
+
+    reports = ([parent] if parent else []) + list(workers.values())
+    return {
+        'parent': parent,
+        'workers': workers,
+        'total_pss': round(sum(memory['pss'] for memory in reports), 1),
+        'total_private': round(sum(memory['private'] for memory in reports), 1)
+    }
+
+
+def format_pool_memory(report: Dict) -> str:
+    """把 pool_memory 的结果格式化为表格文本"""
+    lines = [f"{'进程':<16}{'RSS':>10}{'PSS':>10}{'共享':>10}{'私有':>10}  (MB)"]
+    rows = [('父进程', report['parent'])] if report['parent'] else []
+    rows += [(f'推理进程 {pid}', memory) for pid, memory in report['workers'].items()]
+    for label, memory in rows:
+        lines.append(f"{label:<16}{memory['rss']:>10.1f}{memory['pss']:>10.1f}"
+                     f"{memory['shared']:>10.1f}{memory['private']:>10.1f}")
+    lines.append(f"合计 PSS {report['total_pss']:.1f} MB，私有 {report['total_private']:.1f} MB")
+    return '\n'.join(lines)
+
+
+def rss_mb() -> float:
+    """当前进程的常驻内存（MB），读取 /proc/self/statm，开销远小于 smaps_rollup"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 1048576.0
+    except (FileNotFoundError, IndexError, ValueError):
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    """当前进程自上次 reset_peak_rss 以来的RSS峰值（MB，/proc/self/status 的 VmHWM）"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (FileNotFoundError, ValueError):
+        pass
+    return 0.0
+
+
+def reset_peak_rss() -> bool:
+    """把 VmHWM 重置为当前RSS（Linux >= 4.0），不支持时返回False"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def malloc_stats() -> Optional[Dict]:
+    """
+    glibc 分配器统计（MB）
+
+    Returns:
+        in_use: 已分配未释放；free: 已释放但仍留在堆中（未还给系统）；mmap: 直接 mmap 的大块；
+        非 glibc 平台或 glibc < 2.33 时返回None
+    """
+    libc = _glibc()
+    if libc is None or not hasattr(libc, 'mallinfo2'):
+        return None
+    info = libc.mallinfo2()
+    return {
+        'heap': round(info.arena / 1048576.0, 1),
+        'mmap': round(info.hblkhd / 1048576.0, 1),
+        'in_use': round(info.uordblks / 1048576.0, 1),
+        'free': round(info.fordblks / 1048576.0, 1)
+    }
+
+
+def malloc_trim() -> bool:
+    """把 glibc 堆中空闲的内存还给系统，非 glibc 平台返回False"""
+    libc = _glibc()
+    if libc is None or not hasattr(libc, 'malloc_trim'):
+        return False
+    return bool(libc.malloc_trim(0))
@@ -0,0 +1,113 @@
+"""
+推理进程内存看门狗
+每个请求结束后采样推理进程的内存和 glibc 分配器统计；超过上限时先尝试把空闲堆内存还给系统，
+仍超限则标记回收：推理进程停止接受新连接，处理完在途请求后退出，由父进程重新派生
+（预加载模式下从父进程 fork，不需要重新加载模型）。
+
+同时记录每个请求期间RSS相对请求开始时的增量峰值。同一进程内有并发请求时，
+峰值覆盖重叠的所有请求，偏保守。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from config import MEMORY_WATCHDOG_CONFIG
+from memory_stats import (malloc_stats, malloc_trim, peak_rss_mb, process_memory, reset_peak_rss,
+                          rss_mb)
+from micro_batch import Histogram
+
+
+class MemoryWatchdog:
+    """单个推理进程的内存看门狗（在推理进程 fork 之后创建）"""
+
+    def __init__(self, limit_mb: Optional[float] = None, metric: Optional[str] = None):
+        """
+        Args:
+            limit_mb: 内存上限（MB），默认使用 config.MEMORY_WATCHDOG_CONFIG['limit_mb']，0 表示不限制
+            metric: 判断上限用的内存项：private / rss，默认使用 config.MEMORY_WATCHDOG_CONFIG['metric']
+        """
+        self.limit_mb = float(MEMORY_WATCHDOG_CONFIG['limit_mb'] if limit_mb is None else limit_mb)
+        self.metric = metric or MEMORY_WATCHDOG_CONFIG['metric']
+        self.requests = 0
+        self.in_flight = 0
+        self.trims = 0
+        self.last_sample: Dict = {}
+        self.recycle_reason = None
+        self.recycling = threading.Event()
+        self.peak_growth = Histogram(MEMORY_WATCHDOG_CONFIG['peak_buckets_mb'])
+        self.max_peak_growth = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def request(self) -> Iterator[None]:
+        """包住一个请求的处理：测量期间的RSS峰值，结束后检查内存上限"""
+        with self.lock:
+            if self.in_flight == 0:
+                reset_peak_rss()
+            self.in_flight += 1
+            baseline = rss_mb()
+
+        try:
+            yield
+        finally:
+            growth = max(peak_rss_mb() - baseline, 0.0)
+            self.peak_growth.observe(growth)
+            with self.lock:
+                self.in_flight -= 1
+                self.requests += 1
+                self.max_peak_growth = max(self.max_peak_growth, growth)
+            self.check()
+
+    def usage_mb(self) -> float:
+        """按配置的内存项采样当前用量（MB）"""
+        if self.metric == 'private':
+            memory = process_memory()
+            if memory is not None:
+                return memory['private']
+        return rss_mb()
+
+    def check(self) -> bool:
+        """
+        采样内存并与上限比较，超限时标记回收
+
+        Returns:
+            是否需要回收本进程
+        """
+        usage = self.usage_mb()
+        if self.limit_mb > 0 and usage > self.limit_mb and MEMORY_WATCHDOG_CONFIG['trim_before_recycle']:
+            # OCR中间缓冲区释放后常留在 glibc 堆中，先还给系统再判断
+            if malloc_trim():
+                self.trims += 1
+            usage = self.usage_mb()
+
+        with self.lock:
+            self.last_sample = {
+                'time': time.time(),
+                'usage_mb': round(usage, 1),
+                'rss_mb': round(rss_mb(), 1),
+                'malloc': malloc_stats()
+            }
+            if self.limit_mb <= 0 or usage <= self.limit_mb or self.recycling.is_set():
+                return self.recycling.is_set()
+            self.recycle_reason = (f"{self.metric} 内存 {usage:.0f}MB 超过上限 {self.limit_mb:.0f}MB"
+                                   f"（已处理 {self.requests} 个请求）")
+
+        print(f"推理进程即将回收: {self.recycle_reason}")
+        self.recycling.set()
+        return True
+
+    def stats(self) -> Dict:
+        """内存上限、最近一次采样、分配器统计和单个请求的RSS增量峰值直方图"""
+        with self.lock:
+            return {
+                'limit_mb': self.limit_mb,
+                'metric': self.metric,
+                'requests': self.requests,
+                'in_flight': self.in_flight,
+                'trims': self.trims,
+                'recycling': self.recycling.is_set(),
+                'recycle_reason': self.recycle_reason,
+                'last_sample': dict(self.last_sample),
+                'request_peak_mb': dict(self.peak_growth.snapshot(), max=round(self.max_peak_growth, 1))
+            }
@@ -0,0 +1,216 @@
+"""
+跨请求微批调度
+推理进程内多个请求线程并发提交 OCR 图像或 CNN 图像块，调度线程在 max_wait_ms 内收集请求，
+凑成一批（不超过 max_batch_size）后一次推理，再把结果分发回各调用方。模型只在调度线程中调用，
+因此 PaddleOCR / torch 模型不需要支持多线程并发。
+"""
+import bisect
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from config import BATCHING_CONFIG
+from deadline import Deadline
+
+
+class Histogram:
+    """固定分桶直方图（线程安全）"""
+
+    def __init__(self, bounds: Sequence[float]):
+        """
+        Args:
+            bounds: 各桶上界（升序），最后另有一个 +inf 桶
+        """
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        """记录一个观测值"""
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+
+    def snapshot(self) -> Dict:
+        """返回各桶计数、总数和均值"""
+        with self.lock:
+            counts = list(self.counts)
+            total, value_sum = self.total, self.sum
+        labels = [str(bound) for bound in self.bounds] + ['inf']
+        return {
+            'buckets': [{'le': label, 'count': count} for label, count in zip(labels, counts)],
+            'count': total,
+            'mean': round(value_sum / total, 3) if total else 0.0
+        }
+
+
+class _Pending:
+    """一个等待批处理的提交"""
+
+    __slots__ = ('item', 'size', 'enqueued', 'done', 'result')
+
+    def __init__(self, item: Any, size: int):
+        self.item = item
+        self.size = size
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+
+
+class MicroBatcher:
+    """跨请求微批调度器
+
+    run_batch 接收一批提交项，返回等长的结果列表；某一项的结果为异常对象时只向该项的调用方抛出，
+    run_batch 本身抛出异常时整批调用方都收到该异常。
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int, max_wait_ms: float,
+                 size_of: Optional[Callable[[Any], int]] = None):
+        """
+        初始化调度器
+
+        Args:
+            name: 调度器名称（用于统计输出）
+            run_batch: 批处理函数
+            max_batch_size: 每批的最大容量（按 size_of 计量，超过容量的单个提交单独成批）
+            max_wait_ms: 收到第一个提交后最多等待多久凑批（毫秒）
+            size_of: 提交项的容量计量函数，默认每项计1
+        """
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+        self.size_of = size_of or (lambda item: 1)
+
+        self.queue = deque()
+        self.queued_size = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.thread_pid = None
+
+        size_bounds = [1 << i for i in range(self.max_batch_size.bit_length())]
+        if size_bounds[-1] < self.max_batch_size:
+            size_bounds.append(self.max_batch_size)
+        self.batch_sizes = Histogram(size_bounds)
+        self.wait_times = Histogram(BATCHING_CONFIG['wait_buckets_ms'])
+
+        # 推理服务在父进程预热后 fork：子进程中没有调度线程，条件变量里却残留父进程调度线程的等待项
+        # （notify 会唤醒这个不存在的线程），因此在子进程中重建调度状态
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._reset_after_fork())
+
+    def submit(self, item: Any, deadline: Optional[Deadline] = None) -> Any:
+        """
+        提交一项并阻塞等待其结果
+
+        Args:
+            item: 提交项
+            deadline: 请求截止时间（可选），到期仍未得到结果时抛出 TimeoutError：尚未开始推理的提交从队列中移除，
+                      已在推理中的批次照常完成，本项结果丢弃
+
+        Returns:
+            run_batch 对该项的结果
+        """
+        pending = _Pending(item, int(self.size_of(item)))
+        with self.cond:
+            self._ensure_thread()
+            self.queue.append(pending)
+            self.queued_size += pending.size
+            self.cond.notify()
+
+        if not pending.done.wait(deadline.remaining() if deadline is not None else None):
+            with self.cond:
+                if pending in self.queue:
+                    self.queue.remove(pending)
+                    self.queued_size -= pending.size
+            if not pending.done.is_set():
+                raise TimeoutError(f"{self.name} 微批推理在请求截止时间内未完成")
+        if isinstance(pending.result, BaseException):
+            raise pending.result
+        return pending.result
+
+    def stats(self) -> Dict:
+        """批大小和排队等待时间（毫秒）直方图"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batch_size': self.batch_sizes.snapshot(),
+            'wait_ms': self.wait_times.snapshot()
+        }
+
+    def _ensure_thread(self):
+        """按需启动调度线程（fork 后的子进程中重新启动）"""
+        if self.thread is not None and self.thread_pid == os.getpid() and self.thread.is_alive():
+            return
+        if self.thread_pid != os.getpid():
+            # fork 时父进程的排队项不属于本进程
+            self.queue.clear()
+            self.queued_size = 0
+        self.thread = threading.Thread(target=self._loop, name=f'batch-{self.name}', daemon=True)
+        self.thread_pid = os.getpid()
+        self.thread.start()
+
+    def _reset_after_fork(self):
+        """fork 后在子进程中重建队列、条件变量和统计（父进程预热产生的统计不计入）"""
+        self.queue = deque()
+        self.queued_size = 0
+        self.cond = threading.Condition()
+        self.thread = None
+        self.thread_pid = None
+        self.batch_sizes = Histogram(self.batch_sizes.bounds)
+        self.wait_times = Histogram(self.wait_times.bounds)
+
+    def _loop(self):
+        """调度线程主循环"""
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for pending in batch:
+                self.wait_times.observe((started - pending.enqueued) * 1000.0)
+            self.batch_sizes.observe(sum(pending.size for pending in batch))
+
+            try:
+                results = self.run_batch([pending.item for pending in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} 批处理结果数 {len(results)} 与提交数 {len(batch)} 不一致")
+            except Exception as e:
+                results = [e] * len(batch)
+
+            for pending, result in zip(batch, results):
+                pending.result = result
+                pending.done.set()
+
+    def _collect(self) -> List[_Pending]:
+        """等待第一个提交，再在 max_wait 内收集到批容量上限"""
+        with self.cond:
+            # 等待期间超时的提交会被移出队列，队列再次为空时重新等待
+            while True:
+                while not self.queue:
+                    self.cond.wait()
+
+                deadline = self.queue[0].enqueued + self.max_wait
+                while self.queue and self.queued_size < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if self.queue:
+                    break
+
+            batch = [self.queue.popleft()]
+            size = batch[0].size
+            while self.queue and size + self.queue[0].size <= self.max_batch_size:
+                pending = self.queue.popleft()
+                batch.append(pending)
+                size += pending.size
+            self.queued_size -= size
+            return batch
+
@@ -8,7 +8,11 @@ from paddleocr import PaddleOCR
 from PIL import Image
 import os
 from typing import Dict, Tuple, List, Optional
-from config import OCR_CONFIG, CERTIFICATE_TYPES
+from config import OCR_CONFIG, CERTIFICATE_TYPES, BATCHING_CONFIG
+from micro_batch import MicroBatcher
+from pdf_utils import PDF_LOCK
+from deadline import Deadline
+from thread_budget import governor
 
 
 class CertificateDetector:
@@ -16,14 +20,26 @@ class CertificateDetector:
 
     def __init__(self):
         """初始化OCR引擎"""
-        self.ocr = PaddleOCR(**OCR_CONFIG)
-
-    def detect_certificate(self, image_path: str) -> Dict:
+        options = dict(OCR_CONFIG)
+        if 'cpu_threads' not in options and governor.ocr_threads():
+            # PaddleOCR 默认按10个线程推理，多个推理进程时按线程预算限制
+            options['cpu_threads'] = governor.ocr_threads()
+        self.ocr = PaddleOCR(**options)
+
+        # 并发请求的OCR合批执行，OCR引擎只在调度线程中调用
+        self.ocr_batcher = None
+        if BATCHING_CONFIG['enabled']:
+            self.ocr_batcher = MicroBatcher('ocr', self._ocr_batch, **BATCHING_CONFIG['ocr'])
+
+    def detect_certificate(self, image_path: str, image: Optional[np.ndarray] = None,
+                           deadline: Optional[Deadline] = None) -> Dict:
         """
         检测图像中的证件
 
         Args:
             image_path: 图像路径
+            image: 已解码的BGR图像（可选，提供时不再从文件解码，OCR也直接使用该图像）
+            deadline: 请求截止时间（可选），OCR之前已过期或合批OCR在截止时间内未完成时返回 deadline_exceeded
 
         Returns:
             检测结果字典，包含：
@@ -39,18 +55,28 @@ class CertificateDetector:
             'confidence': 0.0,
             'bbox': None,
             'ocr_result': None,
-            'ocr_text': ''
+            'ocr_text': '',
+            'deadline_exceeded': False
         }
 
+        # OCR是必需步骤，不能降级；排队已耗尽时间时不再启动
+        if deadline is not None and deadline.expired():
+            result['deadline_exceeded'] = True
+            result['error'] = '请求已超过截止时间'
+            return result
+
         try:
             # 检查文件类型
             file_ext = os.path.splitext(image_path)[1].lower()
 
             # 如果是PDF，需要先转换为图片
-            if file_ext == '.pdf':
+            if image is not None:
+                ocr_input = image
+            elif file_ext == '.pdf':
                 image = self._convert_pdf_to_image(image_path)
                 if image is None:
                     raise ValueError(f"无法读取PDF: {image_path}")
+                ocr_input = image_path
             else:
                 # 读取图像 - 使用numpy方式处理中文路径
                 with open(image_path, 'rb') as f:
@@ -59,9 +85,10 @@ class CertificateDetector:
 
                 if image is None:
                     raise ValueError(f"无法读取图像: {image_path}")
+                ocr_input = image_path
 
             # 执行OCR识别
-            ocr_result = self.ocr.ocr(image_path, cls=False)
+            ocr_result = self._run_ocr(ocr_input, deadline)
             result['ocr_result'] = ocr_result
 
             # 提取OCR文本
@@ -82,12 +109,83 @@ class CertificateDetector:
                 bbox = self._detect_certificate_bbox(image, ocr_result)
                 result['bbox'] = bbox
 
+        except TimeoutError:
+            result['deadline_exceeded'] = True
+            result['error'] = '请求已超过截止时间'
+
         except Exception as e:
             print(f"证件检测错误: {str(e)}")
             result['error'] = str(e)
 
         return result
 
+    def _run_ocr(self, ocr_input, deadline: Optional[Deadline] = None):
+        """执行OCR（启用微批调度时与并发请求合批，等待超过截止时间时抛出 TimeoutError）"""
+        if self.ocr_batcher is not None:
+            return self.ocr_batcher.submit(ocr_input, deadline)
+        return self.ocr.ocr(ocr_input, cls=False)
+
+    def _ocr_batch(self, inputs: List) -> List:
+        """
+        微批调度的批处理函数
+
+        多张已解码图像时分别做文本检测，所有文本行合并后一次识别；只有一项、含文件路径（PDF）
+        或OCR引擎没有分步的检测器/识别器（非 PaddleOCR 2.x）时逐项执行。结果格式与单独调用 ocr() 相同。
+
+        Args:
+            inputs: 各请求的OCR输入（BGR图像或文件路径）
+
+        Returns:
+            各请求的OCR结果，失败的项为异常对象
+        """
+        if len(inputs) > 1 and all(isinstance(item, np.ndarray) for item in inputs) and \
+                hasattr(self.ocr, 'text_detector') and hasattr(self.ocr, 'text_recognizer'):
+            try:
+                return self._detect_then_recognize(inputs)
+            except Exception as e:
+                print(f"OCR合批识别失败，改为逐张识别: {str(e)}")
+
+        results = []
+        for item in inputs:
+            try:
+                results.append(self.ocr.ocr(item, cls=False))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _detect_then_recognize(self, images: List[np.ndarray]) -> List:
+        """
+        逐张检测文本框，裁剪后的文本行跨图像合并识别
+
+        检测、排序和裁剪使用 PaddleOCR 2.x TextSystem 自身的检测器和 sorted_boxes / 裁剪函数，
+        与单张 ocr(cls=False) 的流程相同，只把识别阶段换成一次 text_recognizer 调用；
+        识别后同样丢弃置信度低于 drop_score 的文本行。
+        """
+        # paddleocr 导入时把包目录加入 sys.path，tools 为其自带的推理脚本包
+        from tools.infer.predict_system import sorted_boxes
+        from tools.infer.utility import get_minarea_rect_crop, get_rotate_crop_image
+
+        crop_text_box = get_rotate_crop_image if self.ocr.args.det_box_type == 'quad' else get_minarea_rect_crop
+        boxes_per_image = []
+        crops = []
+        for image in images:
+            boxes, _ = self.ocr.text_detector(image)
+            boxes = sorted_boxes(boxes) if boxes is not None and len(boxes) else []
+            boxes_per_image.append(boxes)
+            crops.extend(crop_text_box(image, box.copy()) for box in boxes)
+
+        recognized = self.ocr.text_recognizer(crops)[0] if crops else []
+
+        results = []
+        offset = 0
+        for boxes in boxes_per_image:
+            lines = [[box.tolist(), (text, score)]
+                     for box, (text, score) in zip(boxes, recognized[offset:offset + len(boxes)])
+                     if score >= self.ocr.drop_score]
+            offset += len(boxes)
+            results.append([lines or None])
+        return results
+
     def _extract_ocr_text(self, ocr_result) -> str:
         """
         从OCR结果中提取文本
@@ -358,29 +456,30 @@ class CertificateDetector:
         try:
             import fitz  # PyMuPDF
 
-            # 打开PDF
-            doc = fitz.open(pdf_path)
+            with PDF_LOCK:
+                # 打开PDF
+                doc = fitz.open(pdf_path)
 
-            # 获取第一页
-            if len(doc) == 0:
-                print(f"PDF文件为空: {pdf_path}")
-                return None
+                # 获取第一页
+                if len(doc) == 0:
+                    print(f"PDF文件为空: {pdf_path}")
+                    return None
 
-            page = doc[0]
+                page = doc[0]
 
-            # 设置缩放因子以提高分辨率
-            zoom = 2.0  # 放大2倍
-            mat = fitz.Matrix(zoom, zoom)
+                # 设置缩放因子以提高分辨率
+                zoom = 2.0  # 放大2倍
+                mat = fitz.Matrix(zoom, zoom)
 
-            # 渲染为图像
-            pix = page.get_pixmap(matrix=mat)
+                # 渲染为图像
+                pix = page.get_pixmap(matrix=mat)
 
-            # 转换为numpy数组
-            img_data = pix.tobytes("ppm")
-            nparr = np.frombuffer(img_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                # 转换为numpy数组
+                img_data = pix.tobytes("ppm")
+                nparr = np.frombuffer(img_data, np.uint8)
+                image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
-            doc.close()
+                doc.close()
 
             return image
 
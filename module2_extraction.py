@@ -6,6 +6,7 @@ import re
 from typing import Dict, Optional, List
 from datetime import datetime
 import json
+from deadline import Deadline
 
 
 class CertificateExtractor:
@@ -101,13 +102,14 @@ class CertificateExtractor:
             ],
         }
 
-    def extract(self, ocr_text: str, certificate_type: str) -> Dict:
+    def extract(self, ocr_text: str, certificate_type: str, deadline: Optional[Deadline] = None) -> Dict:
         """
         提取证件的结构化信息
 
         Args:
             ocr_text: OCR识别的文本
             certificate_type: 证件类型 ('animal', 'plant', 'food')
+            deadline: 请求截止时间（可选），已过期时跳过额外信息提取并标记 degraded
 
         Returns:
             提取的结构化信息字典
@@ -115,7 +117,8 @@ class CertificateExtractor:
         result = {
             'certificate_type': certificate_type,
             'extracted_fields': {},
-            'raw_text': ocr_text
+            'raw_text': ocr_text,
+            'degraded': False
         }
 
         # 提取通用字段
@@ -132,8 +135,12 @@ class CertificateExtractor:
         # 清理和标准化提取的字段
         result['extracted_fields'] = self._clean_fields(result['extracted_fields'])
 
-        # 提取额外信息
-        result['additional_info'] = self._extract_additional_info(ocr_text, certificate_type)
+        # 提取额外信息（可选，已过截止时间时跳过）
+        if deadline is not None and deadline.expired():
+            result['additional_info'] = {}
+            result['degraded'] = True
+        else:
+            result['additional_info'] = self._extract_additional_info(ocr_text, certificate_type)
 
         return result
 
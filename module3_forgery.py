@@ -4,11 +4,678 @@
 """
 import cv2
 import numpy as np
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
+from pathlib import Path
 import torch
 import torch.nn as nn
 from PIL import Image
 import json
+import re
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from config import (CNN_MODEL_PATH, CNN_TORCHSCRIPT_PATH, CNN_ONNX_PATH, CNN_QUANTIZED_PATH,
+                    CNN_INFERENCE_CONFIG, HEATMAP_CONFIG, COPY_MOVE_CONFIG,
+                    TEMPLATE_INDEX_PATH, TEMPLATE_CONFIG, ALIGNMENT_CONFIG,
+                    FORGERY_THRESHOLDS, SCHEDULER_CONFIG, IMAGE_ANALYSIS_CONFIG,
+                    NOISE_RESIDUAL_CONFIG, JPEG_ANALYSIS_CONFIG, METADATA_CONFIG,
+                    SEAL_CONFIG, FONT_CONFIG, BATCHING_CONFIG, DEADLINE_CONFIG)
+from micro_batch import MicroBatcher
+from pdf_utils import PDF_LOCK
+from deadline import Deadline
+from thread_budget import governor
+
+
+# 风险等级，按严重程度从低到高
+RISK_LEVELS = ('genuine', 'suspicious', 'forged')
+
+
+class SimpleForgeryNet(nn.Module):
+    """简单的CNN伪造检测网络
+
+    输入为 (N, 3, H, W) 的RGB图像块（取值0-1），输出每个图像块的伪造概率 (N, 1)。
+    """
+
+    # 静态INT8量化前需要融合的 Conv/Linear + ReLU 层
+    fuse_patterns = [
+        ['features.0', 'features.1'],
+        ['features.3', 'features.4'],
+        ['features.6', 'features.7'],
+        ['classifier.0', 'classifier.1'],
+    ]
+
+    def __init__(self):
+        super(SimpleForgeryNet, self).__init__()
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 32, 3, padding=1),
+            nn.ReLU(),
+            nn.MaxPool2d(2, 2),
+            nn.Conv2d(32, 64, 3, padding=1),
+            nn.ReLU(),
+            nn.MaxPool2d(2, 2),
+            nn.Conv2d(64, 128, 3, padding=1),
+            nn.ReLU(),
+            nn.AdaptiveAvgPool2d((1, 1))
+        )
+        self.classifier = nn.Sequential(
+            nn.Linear(128, 64),
+            nn.ReLU(),
+            nn.Dropout(0.5),
+            nn.Linear(64, 1),
+            nn.Sigmoid()
+        )
+
+    def forward(self, x):
+        x = self.features(x)
+        x = x.view(x.size(0), -1)
+        x = self.classifier(x)
+        return x
+
+
+class QuantizableForgeryNet(nn.Module):
+    """静态INT8量化包装
+
+    在网络前后插入量化/反量化节点，使卷积层和全连接层以INT8执行。
+    """
+
+    def __init__(self, model: nn.Module):
+        super(QuantizableForgeryNet, self).__init__()
+        self.quant = torch.ao.quantization.QuantStub()
+        self.model = model
+        self.dequant = torch.ao.quantization.DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.model(self.quant(x)))
+
+
+def select_quantized_engine() -> str:
+    """选择并启用INT8量化计算后端（x86优先fbgemm，ARM使用qnnpack）"""
+    engines = torch.backends.quantized.supported_engines
+    engine = 'fbgemm' if 'fbgemm' in engines else 'qnnpack'
+    torch.backends.quantized.engine = engine
+    return engine
+
+
+def hamming_distances(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    计算两组二进制描述子之间的汉明距离矩阵
+
+    描述子展开为比特向量后由矩阵乘法得到：d(a, b) = |a| + |b| - 2 a·b
+
+    Args:
+        a: 描述子 (M, B) uint8，或已展开的比特向量 (M, 8B) float32
+        b: 描述子 (N, B) uint8，或已展开的比特向量 (N, 8B) float32
+
+    Returns:
+        距离矩阵 (M, N) float32
+    """
+    if a.dtype == np.uint8:
+        a = np.unpackbits(a, axis=1).astype(np.float32)
+    if b.dtype == np.uint8:
+        b = np.unpackbits(b, axis=1).astype(np.float32)
+    return a.sum(axis=1)[:, None] + b.sum(axis=1)[None, :] - 2.0 * (a @ b.T)
+
+
+def extract_ocr_polygons(ocr_result) -> np.ndarray:
+    """
+    从OCR结果中提取文本框四边形
+
+    PaddleX OCRResult 取检测阶段的全部文本框（dt_polys，含未通过识别置信度过滤的框），
+    解析方式与 extract_ocr_lines 相同。
+
+    Args:
+        ocr_result: PaddleOCR返回的结果
+
+    Returns:
+        文本框数组 (N, 4, 2) float32
+    """
+    return extract_ocr_lines(ocr_result, detected=True)[0]
+
+
+def extract_ocr_lines(ocr_result, detected: bool = False) -> Tuple[np.ndarray, List[str]]:
+    """
+    从OCR结果中提取识别文本行及其四边形
+
+    PaddleX OCRResult 取 rec_polys/rec_texts（与识别文本一一对应），
+    传统嵌套列表格式取 [poly, (text, score)]。非四点多边形用最小外接矩形代替。
+
+    Args:
+        ocr_result: PaddleOCR返回的结果
+        detected: 为True时 PaddleX OCRResult 改取检测阶段的全部文本框（dt_polys），对应文本为空串
+
+    Returns:
+        (文本框数组 (N, 4, 2) float32, 对应的文本列表)
+    """
+    pairs = []
+
+    try:
+        if isinstance(ocr_result, list) and len(ocr_result) > 0:
+            first_item = ocr_result[0]
+
+            if hasattr(first_item, 'json'):
+                for result_obj in ocr_result:
+                    result_json = result_obj.json
+                    if isinstance(result_json, dict):
+                        res_dict = result_json.get('res', result_json)
+                        if not isinstance(res_dict, dict):
+                            continue
+                        if detected:
+                            if isinstance(res_dict.get('dt_polys'), list):
+                                pairs.extend((poly, '') for poly in res_dict['dt_polys'])
+                            continue
+                        texts = res_dict.get('rec_texts') or []
+                        polys = res_dict.get('rec_polys')
+                        if polys is None or len(polys) != len(texts):
+                            polys = res_dict.get('dt_polys') or []
+                        if len(polys) == len(texts):
+                            pairs.extend(zip(polys, texts))
+
+            elif isinstance(first_item, list):
+                for page_result in ocr_result:
+                    if isinstance(page_result, list):
+                        for line_result in page_result:
+                            if not isinstance(line_result, list) or len(line_result) < (1 if detected else 2):
+                                continue
+                            text = line_result[1] if len(line_result) >= 2 else ''
+                            if isinstance(text, (list, tuple)):
+                                text = text[0]
+                            pairs.append((line_result[0], text))
+    except Exception as e:
+        print(f"提取文本行错误: {str(e)}")
+
+    quads, texts = [], []
+    for poly, text in pairs:
+        points = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+        if points.shape[0] != 4:
+            if points.shape[0] < 3:
+                continue
+            points = cv2.boxPoints(cv2.minAreaRect(points)).astype(np.float32)
+        quads.append(points)
+        texts.append(str(text))
+
+    if not quads:
+        return np.empty((0, 4, 2), dtype=np.float32), []
+    return np.stack(quads), texts
+
+
+# JPEG量化表在DQT段中按之字形顺序存储，此为对应的8x8自然顺序下标
+JPEG_ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63
+])
+
+# IJG (libjpeg) 标准亮度量化表，质量50
+IJG_LUMINANCE_TABLE = np.array([
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99]
+], dtype=np.int32)
+
+# 质量1-100对应的IJG缩放亮度表 (100, 8, 8)，估计质量因子时直接比对
+_IJG_QUALITIES = np.arange(1, 101)
+_IJG_SCALES = np.where(_IJG_QUALITIES < 50, 5000 // _IJG_QUALITIES, 200 - 2 * _IJG_QUALITIES)
+IJG_QUALITY_TABLES = np.clip((IJG_LUMINANCE_TABLE[None] * _IJG_SCALES[:, None, None] + 50) // 100, 1, 255)
+
+JPEG_SOF_TYPES = {
+    0xC0: 'baseline', 0xC1: 'extended', 0xC2: 'progressive', 0xC3: 'lossless',
+    0xC5: 'differential', 0xC6: 'differential-progressive', 0xC7: 'differential-lossless',
+    0xC9: 'arithmetic', 0xCA: 'arithmetic-progressive', 0xCB: 'arithmetic-lossless',
+}
+
+
+def iter_jpeg_segments(data: bytes):
+    """
+    逐个产出JPEG标记段 (marker, segment)，到SOS为止
+
+    只遍历头部标记段，不触及熵编码数据；结构损坏时抛出 ValueError。
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        raise ValueError('不是JPEG文件')
+
+    i, n = 2, len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            raise ValueError(f'无效的JPEG标记位置: {i}')
+        marker = data[i + 1]
+        if marker == 0xFF:  # 填充字节
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # 无长度字段的标记
+            i += 2
+            continue
+
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        if marker == 0xDA:  # SOS之后是熵编码数据
+            return
+        yield marker, data[i + 4:i + 2 + length]
+        i += 2 + length
+
+
+def parse_jpeg_headers(data: bytes) -> Optional[Dict]:
+    """
+    直接从文件字节解析JPEG头部（不解码像素）
+
+    遍历SOI到SOS之间的标记段，提取量化表(DQT)、帧信息(SOF)和APP段签名。
+
+    Args:
+        data: 上传文件的原始字节
+
+    Returns:
+        头部信息字典，非JPEG或头部损坏时返回None：
+        - quantization_tables: {表号: 8x8 int32 数组（自然顺序）}
+        - frame: 帧类型、精度、尺寸和各分量的采样因子/量化表号
+        - app_markers: APP段名称列表（如 APP0:JFIF、APP14:Adobe）
+        - quality: 按IJG标准表估计的亮度质量因子
+        - standard_tables: 亮度表是否与IJG标准缩放表完全一致
+        - editor_signatures: 头部中的图像编辑软件痕迹
+    """
+    tables = {}
+    frame = None
+    app_markers = []
+
+    try:
+        for marker, segment in iter_jpeg_segments(data):
+            if marker == 0xDB:
+                j = 0
+                while j < len(segment):
+                    precision, table_id = segment[j] >> 4, segment[j] & 0x0F
+                    j += 1
+                    if precision:
+                        values = np.frombuffer(segment[j:j + 128], dtype='>u2')
+                        j += 128
+                    else:
+                        values = np.frombuffer(segment[j:j + 64], dtype=np.uint8)
+                        j += 64
+                    table = np.zeros(64, dtype=np.int32)
+                    table[JPEG_ZIGZAG] = values
+                    tables[table_id] = table.reshape(8, 8)
+
+            elif marker in JPEG_SOF_TYPES:
+                precision, height, width, count = struct.unpack('>BHHB', segment[:6])
+                frame = {
+                    'type': JPEG_SOF_TYPES[marker],
+                    'precision': precision,
+                    'height': height,
+                    'width': width,
+                    'components': [
+                        {
+                            'id': segment[6 + 3 * c],
+                            'sampling': [segment[7 + 3 * c] >> 4, segment[7 + 3 * c] & 0x0F],
+                            'table': segment[8 + 3 * c]
+                        }
+                        for c in range(count)
+                    ]
+                }
+
+            elif 0xE0 <= marker <= 0xEF:
+                name = segment[:segment.find(b'\x00')] if b'\x00' in segment[:32] else segment[:12]
+                app_markers.append(f"APP{marker - 0xE0}:{name.decode('latin-1', 'replace')}")
+    except (struct.error, ValueError, IndexError):
+        return None
+
+    if not tables:
+        return None
+
+    quality, standard = estimate_jpeg_quality(tables.get(0, next(iter(tables.values()))))
+    signatures = [m for m in app_markers if m.startswith(('APP13:Photoshop', 'APP14:Adobe'))]
+
+    return {
+        'quantization_tables': tables,
+        'frame': frame,
+        'app_markers': app_markers,
+        'quality': quality,
+        'standard_tables': standard,
+        'editor_signatures': signatures
+    }
+
+
+def estimate_jpeg_quality(table: np.ndarray) -> Tuple[int, bool]:
+    """
+    按IJG缩放公式估计亮度量化表对应的质量因子
+
+    Args:
+        table: 8x8 亮度量化表
+
+    Returns:
+        (最接近的质量因子1-100, 是否与该质量的标准表完全一致)
+    """
+    errors = np.abs(IJG_QUALITY_TABLES - table[None]).sum(axis=(1, 2))
+    best = int(np.argmin(errors))
+    return best + 1, bool(errors[best] == 0)
+
+
+# 可用的伪造检测网络结构，导出和推理时按名称选择
+FORGERY_MODELS = {
+    'simple': SimpleForgeryNet,
+}
+
+# 各推理后端默认加载的模型文件
+CNN_BACKEND_PATHS = {
+    'torch': CNN_MODEL_PATH,
+    'torchscript': CNN_TORCHSCRIPT_PATH,
+    'onnx': CNN_ONNX_PATH,
+}
+
+
+class CopyMoveAnalyzer:
+    """复制-移动伪造分析器
+
+    检测同一页面内被克隆的印章、数字等区域：
+    - 在限定尺寸的灰度图上提取ORB/AKAZE二进制关键点（数量有上限）
+    - 用NumPy汉明距离核（矩阵乘法）对描述子做自匹配
+    - 按位移向量聚类，位移一致的匹配簇即为克隆区域
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        初始化复制-移动分析器
+
+        Args:
+            config: 分析配置，默认使用 config.COPY_MOVE_CONFIG
+        """
+        self.config = dict(COPY_MOVE_CONFIG)
+        if config:
+            self.config.update(config)
+
+    def analyze(self, image: np.ndarray) -> Dict:
+        """
+        分析图像中的复制-移动区域
+
+        Args:
+            image: BGR图像
+
+        Returns:
+            分析结果字典：
+            - score: 复制-移动得分(0-1)
+            - regions: 克隆区域列表 [{'source', 'target', 'offset', 'matches'}]，坐标为原图像素
+            - keypoints: 使用的关键点数量
+        """
+        result = {
+            'score': 0.0,
+            'regions': [],
+            'keypoints': 0
+        }
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+        # 限制分析尺寸，保证大幅扫描件的耗时有上界
+        h, w = gray.shape
+        scale = min(1.0, self.config['max_side'] / max(h, w))
+        if scale < 1.0:
+            gray = cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+        points, descriptors = self._extract_features(gray)
+        result['keypoints'] = len(points)
+        if len(points) < self.config['min_cluster']:
+            return result
+
+        src, dst = self._match_self(points, descriptors)
+        if len(src) < self.config['min_cluster']:
+            return result
+
+        regions = self._cluster_offsets(src, dst)
+        for region in regions:
+            for key in ('source', 'target'):
+                region[key] = [int(round(v / scale)) for v in region[key]]
+            region['offset'] = [int(round(v / scale)) for v in region['offset']]
+
+        result['regions'] = regions
+        if regions:
+            largest = regions[0]['matches']
+            result['score'] = min(1.0, 0.5 + 0.05 * (largest - self.config['min_cluster']))
+
+        return result
+
+    def _extract_features(self, gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        提取二进制关键点描述子
+
+        Returns:
+            (关键点坐标 (N, 2) float32, 描述子 (N, B) uint8)
+        """
+        max_keypoints = int(self.config['max_keypoints'])
+
+        if self.config['detector'] == 'akaze':
+            extractor = cv2.AKAZE_create()
+            keypoints = extractor.detect(gray, None)
+            # AKAZE无法限制数量，按响应强度保留前 max_keypoints 个
+            keypoints = sorted(keypoints, key=lambda kp: kp.response, reverse=True)[:max_keypoints]
+        else:
+            extractor = cv2.ORB_create(nfeatures=max_keypoints)
+            keypoints = extractor.detect(gray, None)
+
+        if not keypoints:
+            return np.empty((0, 2), dtype=np.float32), np.empty((0, 32), dtype=np.uint8)
+
+        keypoints, descriptors = extractor.compute(gray, keypoints)
+        if descriptors is None:
+            return np.empty((0, 2), dtype=np.float32), np.empty((0, 32), dtype=np.uint8)
+
+        points = np.array([kp.pt for kp in keypoints], dtype=np.float32)
+        return points, descriptors
+
+    def _match_self(self, points: np.ndarray, descriptors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        描述子自匹配（最近邻比值检验）
+
+        汉明距离按行分块计算以限制内存，空间上过近的点对（同一局部结构）不参与匹配。
+
+        Returns:
+            (源点坐标 (M, 2), 目标点坐标 (M, 2))
+        """
+        bits = np.unpackbits(descriptors, axis=1).astype(np.float32)
+        n = len(bits)
+
+        min_offset_sq = float(self.config['min_offset']) ** 2
+        chunk = int(self.config['chunk_size'])
+        best = np.empty(n, dtype=np.int64)
+        best_dist = np.empty(n, dtype=np.float32)
+        second_dist = np.empty(n, dtype=np.float32)
+
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            dist = hamming_distances(bits[start:stop], bits)
+
+            delta = points[start:stop, None, :] - points[None, :, :]
+            too_close = (delta ** 2).sum(axis=2) < min_offset_sq
+            dist[too_close] = np.inf
+
+            nearest = np.argpartition(dist, 1, axis=1)[:, :2]
+            d = np.take_along_axis(dist, nearest, axis=1)
+            order = np.argsort(d, axis=1)
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            d = np.take_along_axis(d, order, axis=1)
+
+            best[start:stop] = nearest[:, 0]
+            best_dist[start:stop] = d[:, 0]
+            second_dist[start:stop] = d[:, 1]
+
+        accepted = (best_dist <= self.config['max_hamming']) & \
+                   (best_dist < self.config['ratio'] * second_dist)
+        src_idx = np.nonzero(accepted)[0]
+        dst_idx = best[src_idx]
+
+        # 互为匹配的点对只保留一次
+        keep = src_idx < dst_idx
+        keep |= ~accepted[dst_idx] | (best[dst_idx] != src_idx)
+        src_idx, dst_idx = src_idx[keep], dst_idx[keep]
+
+        return points[src_idx], points[dst_idx]
+
+    def _cluster_offsets(self, src: np.ndarray, dst: np.ndarray) -> List[Dict]:
+        """
+        按位移向量聚类匹配点对
+
+        位移方向统一为 dx > 0（或 dx == 0 且 dy > 0），量化到 offset_bin 像素后统计，
+        匹配数达到 min_cluster 的簇视为克隆区域。源区域与目标区域重叠（表格线、逐行重复的
+        表头文字等周期性结构）或面积过大的簇不计入。
+
+        Returns:
+            克隆区域列表，按匹配数降序
+        """
+        offset = dst - src
+        flip = (offset[:, 0] < 0) | ((offset[:, 0] == 0) & (offset[:, 1] < 0))
+        src, dst = np.where(flip[:, None], dst, src), np.where(flip[:, None], src, dst)
+        offset = dst - src
+
+        bins = np.round(offset / self.config['offset_bin']).astype(np.int64)
+        keys, inverse, counts = np.unique(bins, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+        image_area = float(np.prod(np.ptp(np.vstack([src, dst]), axis=0))) or 1.0
+        max_area = self.config['max_region_fraction'] * image_area
+
+        regions = []
+        for cluster in np.argsort(-counts):
+            if counts[cluster] < self.config['min_cluster'] or len(regions) >= self.config['max_regions']:
+                break
+            members = inverse == cluster
+            source = self._bounding_box(src[members])
+            target = self._bounding_box(dst[members])
+            if self._boxes_overlap(source, target) or source[2] * source[3] > max_area:
+                continue
+            regions.append({
+                'source': source,
+                'target': target,
+                'offset': [float(v) for v in np.median(offset[members], axis=0)],
+                'matches': int(counts[cluster])
+            })
+
+        return regions
+
+    @staticmethod
+    def _boxes_overlap(a: List[float], b: List[float]) -> bool:
+        """两个 [x, y, w, h] 矩形是否相交"""
+        return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+    @staticmethod
+    def _bounding_box(points: np.ndarray) -> List[float]:
+        """点集的外接矩形 [x, y, w, h]"""
+        x_min, y_min = points.min(axis=0)
+        x_max, y_max = points.max(axis=0)
+        return [float(x_min), float(y_min), float(x_max - x_min), float(y_max - y_min)]
+
+
+class NoiseResidualAnalyzer:
+    """噪声残差一致性分析器
+
+    用一组SRM高通滤波器（cv2.filter2D）提取噪声残差，截断后借助积分图向量化计算
+    每个块的残差方差，偏离文档主体噪声分布的块即为可疑区域。
+    同一设备一次成像的文档噪声特征一致，后期粘贴的文字块通常来自不同来源，噪声特征不同。
+    """
+
+    # SRM滤波器组：二阶、KV 5x5、一阶水平差分
+    SRM_KERNELS = [
+        np.array([[0, 0, 0, 0, 0],
+                  [0, -1, 2, -1, 0],
+                  [0, 2, -4, 2, 0],
+                  [0, -1, 2, -1, 0],
+                  [0, 0, 0, 0, 0]], dtype=np.float32) / 4.0,
+        np.array([[-1, 2, -2, 2, -1],
+                  [2, -6, 8, -6, 2],
+                  [-2, 8, -12, 8, -2],
+                  [2, -6, 8, -6, 2],
+                  [-1, 2, -2, 2, -1]], dtype=np.float32) / 12.0,
+        np.array([[0, 0, 0],
+                  [0, -1, 1],
+                  [0, 0, 0]], dtype=np.float32),
+    ]
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        初始化噪声残差分析器
+
+        Args:
+            config: 分析配置，默认使用 config.NOISE_RESIDUAL_CONFIG
+        """
+        self.config = dict(NOISE_RESIDUAL_CONFIG)
+        if config:
+            self.config.update(config)
+
+    def analyze(self, image: np.ndarray, block_size: Optional[int] = None) -> Dict:
+        """
+        分析噪声残差一致性
+
+        Args:
+            image: BGR或灰度图像
+            block_size: 块边长，默认使用配置值
+
+        Returns:
+            分析结果字典：
+            - score: 噪声不一致得分(0-1)
+            - grid: 每块的可疑度网格(0-1)
+            - flagged_fraction: 偏离主体分布的块所占比例
+        """
+        result = {
+            'score': 0.0,
+            'grid': np.zeros((0, 0), dtype=np.float32),
+            'flagged_fraction': 0.0
+        }
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        gray = gray.astype(np.float32)
+        block = int(block_size or self.config['block_size'])
+
+        h, w = gray.shape
+        rows, cols = h // block, w // block
+        if rows < 2 or cols < 2:
+            return result
+
+        # 块边界在积分图中的下标
+        ys = np.arange(rows + 1) * block
+        xs = np.arange(cols + 1) * block
+        truncation = float(self.config['truncation'])
+
+        # 只在平滑像素上统计噪声，避免文字笔画边缘主导残差方差
+        gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((5, 5), np.uint8))
+        smooth = (gradient < self.config['smooth_gradient']).astype(np.float32)
+        count = self._block_sums(cv2.integral(smooth, sdepth=cv2.CV_64F), ys, xs)
+        valid = count >= self.config['min_smooth_fraction'] * block * block
+        if np.count_nonzero(valid) < 4:
+            return result
+        count = np.maximum(count, 1.0)
+
+        features = []
+        for kernel in self.SRM_KERNELS:
+            residual = np.clip(cv2.filter2D(gray, cv2.CV_32F, kernel), -truncation, truncation) * smooth
+            total, squared = cv2.integral2(residual, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+
+            block_mean = self._block_sums(total, ys, xs) / count
+            block_sq = self._block_sums(squared, ys, xs) / count
+            variance = np.maximum(block_sq - block_mean ** 2, 0.0)
+            features.append(np.log(variance + 1e-4))
+
+        features = np.stack(features, axis=-1)
+
+        # 以有效块的中位数和MAD描述文档主体噪声分布，计算每块的稳健偏离度
+        reference = features[valid]
+        median = np.median(reference, axis=0)
+        mad = np.median(np.abs(reference - median), axis=0)
+        z = np.abs(features - median) / (1.4826 * mad + 1e-3)
+        deviation = np.where(valid, np.sqrt(np.mean(z ** 2, axis=-1)), 0.0)
+
+        threshold = float(self.config['z_threshold'])
+        flagged = deviation > threshold
+        result['flagged_fraction'] = float(np.count_nonzero(flagged) / np.count_nonzero(valid))
+        result['grid'] = np.clip((deviation - threshold) / threshold + 0.5 * flagged, 0.0, 1.0).astype(np.float32)
+        result['score'] = min(result['flagged_fraction'] / self.config['max_flagged_fraction'], 1.0)
+
+        return result
+
+    @staticmethod
+    def _block_sums(integral: np.ndarray, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        """由积分图一次性求出所有块的和 (rows, cols)"""
+        return (integral[ys[1:, None], xs[None, 1:]] - integral[ys[:-1, None], xs[None, 1:]]
+                - integral[ys[1:, None], xs[None, :-1]] + integral[ys[:-1, None], xs[None, :-1]])
 
 
 class ImageForgeryDetector:
@@ -17,98 +684,316 @@ class ImageForgeryDetector:
     使用CNN检测图像中的物理伪造痕迹：
     - 拼接伪影
     - 分辨率不一致
-    - 水印缺失或异常
+    - 水印缺失或异常（背景频谱与模板参考频谱比对）
     """
 
-    def __init__(self):
-        """初始化图像检测器"""
+    def __init__(self, model_path=None, inference_config: Optional[Dict] = None,
+                 template_index: Optional['TemplateIndex'] = None):
+        """
+        初始化图像检测器
+
+        Args:
+            model_path: 模型文件路径，默认按推理后端取 config 中对应的路径；文件不存在时不启用CNN推理
+            inference_config: CNN推理配置，默认使用 config.CNN_INFERENCE_CONFIG
+            template_index: 模板特征索引（含参考背景频谱），默认从 config.TEMPLATE_INDEX_PATH 加载
+        """
+        self.inference_config = dict(CNN_INFERENCE_CONFIG)
+        if inference_config:
+            self.inference_config.update(inference_config)
+
+        self.backend = self.inference_config.get('backend', 'torch')
+        if self.backend not in CNN_BACKEND_PATHS:
+            print(f"未知的CNN推理后端: {self.backend}，使用 torch")
+            self.backend = 'torch'
+
+        self.quantization = self.inference_config.get('quantization')
+        if self.quantization and self.backend == 'onnx':
+            print("ONNX推理后端不支持INT8量化选项，忽略")
+            self.quantization = None
+
+        if self.quantization == 'static':
+            default_path = CNN_QUANTIZED_PATH
+        else:
+            default_path = CNN_BACKEND_PATHS[self.backend]
+
+        self.copy_move_analyzer = CopyMoveAnalyzer()
+        self.noise_analyzer = NoiseResidualAnalyzer()
+        self.template_index = template_index if template_index is not None else TemplateIndex.load(TEMPLATE_INDEX_PATH)
+
         # 简化的CNN模型（实际应用中需要训练）
         self.model = self._build_simple_cnn()
+        self.onnx_session = None
+        self.model_loaded = self._load_model(model_path or default_path)
+
+        # 可选分析器耗时的指数滑动平均（秒），剩余时间不足时跳过
+        self.optional_costs = dict(DEADLINE_CONFIG['optional_cost_priors'])
+        self._optional_lock = threading.Lock()
+
+        # 并发请求的图像块合批推理，模型只在调度线程中调用
+        self.patch_batcher = None
+        if BATCHING_CONFIG['enabled']:
+            self.patch_batcher = MicroBatcher('cnn', self._predict_patch_batches, size_of=len,
+                                              **BATCHING_CONFIG['cnn'])
 
     def _build_simple_cnn(self):
         """构建简单的CNN模型用于伪造检测"""
-        class SimpleForgeryNet(nn.Module):
-            def __init__(self):
-                super(SimpleForgeryNet, self).__init__()
-                self.features = nn.Sequential(
-                    nn.Conv2d(3, 32, 3, padding=1),
-                    nn.ReLU(),
-                    nn.MaxPool2d(2, 2),
-                    nn.Conv2d(32, 64, 3, padding=1),
-                    nn.ReLU(),
-                    nn.MaxPool2d(2, 2),
-                    nn.Conv2d(64, 128, 3, padding=1),
-                    nn.ReLU(),
-                    nn.AdaptiveAvgPool2d((1, 1))
-                )
-                self.classifier = nn.Sequential(
-                    nn.Linear(128, 64),
-                    nn.ReLU(),
-                    nn.Dropout(0.5),
-                    nn.Linear(64, 1),
-                    nn.Sigmoid()
+        return FORGERY_MODELS[self.inference_config.get('architecture', 'simple')]()
+
+    def _load_model(self, model_path) -> bool:
+        """
+        按推理后端加载模型
+
+        - torch: 加载 state_dict 到 eager 模型
+        - torchscript: 加载导出的 TorchScript 模型
+        - onnx: 创建 ONNX Runtime CPU 推理会话（开启全部图优化）
+
+        量化选项：
+        - dynamic: 加载后对全连接层做INT8动态量化
+        - static: 加载 quantize_forgery_model.py 校准导出的INT8 TorchScript 模型
+
+        Args:
+            model_path: 模型文件路径
+
+        Returns:
+            是否加载成功
+        """
+        if not model_path or not Path(model_path).exists():
+            return False
+
+        num_threads = self.inference_config.get('num_threads') or governor.cnn_threads()
+
+        try:
+            if self.backend == 'onnx':
+                import onnxruntime as ort
+
+                options = ort.SessionOptions()
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                if num_threads:
+                    options.intra_op_num_threads = int(num_threads)
+                    options.inter_op_num_threads = 1
+
+                self.onnx_session = ort.InferenceSession(
+                    str(model_path), sess_options=options, providers=['CPUExecutionProvider']
                 )
+                self.onnx_input = self.onnx_session.get_inputs()[0].name
+                self.model = None
+                return True
 
-            def forward(self, x):
-                x = self.features(x)
-                x = x.view(x.size(0), -1)
-                x = self.classifier(x)
-                return x
+            if self.quantization:
+                select_quantized_engine()
 
-        return SimpleForgeryNet()
+            if self.backend == 'torchscript' or self.quantization == 'static':
+                self.model = torch.jit.load(str(model_path), map_location='cpu')
+            else:
+                checkpoint = torch.load(str(model_path), map_location='cpu')
+                if isinstance(checkpoint, dict) and 'state_dict' in checkpoint:
+                    checkpoint = checkpoint['state_dict']
+                self.model.load_state_dict(checkpoint)
+                if self.quantization == 'dynamic':
+                    self.model = torch.ao.quantization.quantize_dynamic(
+                        self.model.eval(), {nn.Linear}, dtype=torch.qint8
+                    )
+            self.model.eval()
+
+            # 控制CPU推理线程数，避免多worker时线程过度订阅
+            if num_threads:
+                torch.set_num_threads(int(num_threads))
+
+            return True
+
+        except ImportError:
+            print("错误: ONNX推理后端需要安装 onnxruntime")
+            print("请运行: pip install onnxruntime")
+            return False
+        except Exception as e:
+            print(f"加载CNN模型失败 ({self.backend}): {str(e)}")
+            return False
 
-    def detect(self, image_path: str) -> Dict:
+    def detect(self, image_path: str, certificate_type: Optional[str] = None,
+               image: Optional[np.ndarray] = None, deadline: Optional[Deadline] = None) -> Dict:
         """
         检测图像中的伪造痕迹
 
         Args:
             image_path: 图像路径
+            certificate_type: 证件类型（可选，提供时只与该类型模板的背景频谱比对）
+            image: 已解码的BGR图像（可选，提供时只从文件读取JPEG头部，不再解码）
+            deadline: 请求截止时间（可选），剩余时间不足时跳过可选分析器（CNN、复制-移动、噪声残差、背景频谱）
 
         Returns:
-            检测结果字典
+            检测结果字典，skipped 列出因时间不足跳过的分析器，degraded 表示结果是否降级，
+            score_bounds 为跳过的分析器得分按0/按1计时 forgery_score 的下界/上界
         """
         result = {
             'forgery_score': 0.0,
+            'score_bounds': [0.0, 0.0],
             'analysis': [],
-            'details': {}
+            'details': {},
+            'localization': None,
+            'skipped': [],
+            'degraded': False
         }
 
         try:
             # 读取图像
             with open(image_path, 'rb') as f:
-                image_data = np.frombuffer(f.read(), np.uint8)
-                image = cv2.imdecode(image_data, cv2.IMREAD_COLOR)
+                raw = f.read()
+
+            # 解码前先解析JPEG头部（量化表、帧信息），只读取标记段
+            jpeg_header = parse_jpeg_headers(raw)
+            if image is None:
+                image = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
 
             if image is None:
                 result['analysis'].append("无法读取图像")
                 return result
 
+            # 按各分析器所需分辨率降采样（同一尺寸只缩放一次）
+            pyramid = {}
+            scales = {}
+
+            def at_budget(name):
+                analysis_image, scale = self._downsample(image, IMAGE_ANALYSIS_CONFIG['pixel_budgets'][name], pyramid)
+                scales[name] = round(scale, 4)
+                return analysis_image, scale
+
             # 1. 检测拼接伪影
-            splice_score = self._detect_splicing(image)
+            splice_score, splice_grid = self._detect_splicing(at_budget('splice')[0])
             result['details']['splice_score'] = splice_score
             if splice_score > 0.5:
                 result['analysis'].append(f"检测到拼接伪影 (得分: {splice_score:.2f})")
 
             # 2. 检测分辨率不一致
-            resolution_score = self._detect_resolution_inconsistency(image)
+            resolution_score, sharpness_grid = self._detect_resolution_inconsistency(at_budget('resolution')[0])
             result['details']['resolution_score'] = resolution_score
             if resolution_score > 0.5:
                 result['analysis'].append(f"检测到分辨率不一致 (得分: {resolution_score:.2f})")
 
-            # 3. 检测JPEG压缩伪影
+            # 3. 检测JPEG压缩伪影（需要原始分辨率的8x8网格，在固定数量的原图切片上计算）
             jpeg_score = self._detect_jpeg_artifacts(image)
             result['details']['jpeg_score'] = jpeg_score
             if jpeg_score > 0.5:
                 result['analysis'].append(f"检测到JPEG压缩异常 (得分: {jpeg_score:.2f})")
 
             # 4. 检测边缘异常
-            edge_score = self._detect_edge_anomalies(image)
+            edge_score = self._detect_edge_anomalies(at_budget('edge')[0])
             result['details']['edge_score'] = edge_score
             if edge_score > 0.5:
                 result['analysis'].append(f"检测到边缘异常 (得分: {edge_score:.2f})")
 
-            # 综合评分
-            result['forgery_score'] = (splice_score + resolution_score + jpeg_score + edge_score) / 4
+            scores = [splice_score, resolution_score, jpeg_score, edge_score]
+            suspicion_grids = [
+                self._robust_deviation(splice_grid),
+                self._robust_deviation(sharpness_grid)
+            ]
+
+            # 5. CNN图像块分类（可选），等待合批推理最多到为必需步骤保留的时间之前
+            cnn = None
+            if self.model_loaded:
+                cnn_deadline = deadline.reserving() if deadline is not None else None
+                cnn = self._run_optional('cnn', deadline, result, lambda: self._run_cnn(at_budget('cnn')[0], cnn_deadline))
+            if cnn is not None:
+                cnn_score, cnn_grid = cnn
+                suspicion_grids.append(cnn_grid)
+                result['details']['cnn_score'] = cnn_score
+                scores.append(cnn_score)
+                if cnn_score > 0.5:
+                    result['analysis'].append(f"CNN检测到可疑图像块 (得分: {cnn_score:.2f})")
+
+            # 6. 检测复制-移动（同页克隆，可选），区域坐标换算回原图
+            def run_copy_move():
+                copy_move_image, copy_move_scale = at_budget('copy_move')
+                analysis = self.copy_move_analyzer.analyze(copy_move_image)
+                for region in analysis['regions']:
+                    for key in ('source', 'target', 'offset'):
+                        region[key] = [int(round(v / copy_move_scale)) for v in region[key]]
+                return analysis
+
+            copy_move = self._run_optional('copy_move', deadline, result, run_copy_move)
+            if copy_move is not None:
+                copy_move_score = copy_move['score']
+                result['details']['copy_move_score'] = copy_move_score
+                scores.append(copy_move_score)
+                if copy_move_score > 0.5:
+                    result['analysis'].append(
+                        f"检测到 {len(copy_move['regions'])} 处复制-移动区域 (得分: {copy_move_score:.2f})"
+                    )
+
+            # 7. 检测噪声残差不一致（粘贴的文字块，可选）
+            def run_noise():
+                noise_image = at_budget('noise')[0]
+                return self.noise_analyzer.analyze(
+                    noise_image, self._block_size(NOISE_RESIDUAL_CONFIG['block_size'], noise_image, 'noise')
+                )
+
+            noise = self._run_optional('noise', deadline, result, run_noise)
+            if noise is not None:
+                noise_score = noise['score']
+                result['details']['noise_score'] = noise_score
+                scores.append(noise_score)
+                suspicion_grids.append(noise['grid'])
+                if noise_score > 0.5:
+                    result['analysis'].append(f"检测到噪声特征不一致区域 (得分: {noise_score:.2f})")
+
+            # 8. JPEG量化表签名与二次压缩检测（仅JPEG输入）
+            if jpeg_header is not None:
+                quantization_score = self._detect_double_compression(image, jpeg_header)
+                result['details']['jpeg_header'] = {
+                    'quality': jpeg_header['quality'],
+                    'standard_tables': jpeg_header['standard_tables'],
+                    'frame': jpeg_header['frame'],
+                    'app_markers': jpeg_header['app_markers'],
+                    'editor_signatures': jpeg_header['editor_signatures']
+                }
+                result['details']['quantization_score'] = quantization_score
+                scores.append(quantization_score)
+                if jpeg_header['editor_signatures']:
+                    result['analysis'].append(
+                        f"JPEG头部含编辑软件签名: {', '.join(jpeg_header['editor_signatures'])}"
+                    )
+                if quantization_score > 0.5:
+                    result['analysis'].append(f"检测到JPEG二次压缩痕迹 (得分: {quantization_score:.2f})")
+
+            # 9. 背景底纹/水印频谱与模板参考频谱比对（索引中有参考频谱时，可选）
+            spectrum_match = None
+            if self.template_index.has_spectra(certificate_type):
+                spectrum_match = self._run_optional(
+                    'spectrum', deadline, result,
+                    lambda: self.template_index.match_spectrum(
+                        cv2.cvtColor(at_budget('spectrum')[0], cv2.COLOR_BGR2GRAY), certificate_type
+                    )
+                )
+            if spectrum_match is not None:
+                watermark_score = spectrum_match['score']
+                result['details']['watermark_score'] = watermark_score
+                result['details']['spectrum_match'] = spectrum_match
+                scores.append(watermark_score)
+                if watermark_score > 0.5:
+                    result['analysis'].append(
+                        f"背景底纹/水印与最近模板不一致 (相似度: {spectrum_match['similarity']:.2f})"
+                    )
+
+            result['details']['analysis_scales'] = scales
+
+            # 综合评分：已运行分析器的平均分；各分析器等权，跳过的分析器按0/按1计得到评分范围，
+            # 上层据此判断跳过的分析器能否改变风险等级
+            result['forgery_score'] = sum(scores) / len(scores)
+            skipped = len(result['skipped'])
+            result['score_bounds'] = [sum(scores) / (len(scores) + skipped),
+                                      (sum(scores) + skipped) / (len(scores) + skipped)]
+
+            # 10. 可疑区域定位（复用上面已计算的块统计量）
+            result['localization'] = self._localize(suspicion_grids, image.shape[:2])
+            result['localization']['cloned_regions'] = copy_move['regions'] if copy_move is not None else []
+            if result['localization']['regions']:
+                result['analysis'].append(f"定位到 {len(result['localization']['regions'])} 处可疑区域")
+
+            if result['skipped']:
+                result['degraded'] = True
+                result['analysis'].append(
+                    f"剩余时间不足，已跳过: {', '.join(item['analyzer'] for item in result['skipped'])}（结果已降级）"
+                )
 
             if not result['analysis']:
                 result['analysis'].append("未检测到明显的图像伪造痕迹")
@@ -118,83 +1003,416 @@ class ImageForgeryDetector:
 
         return result
 
-    def _detect_splicing(self, image: np.ndarray) -> float:
-        """检测拼接伪影"""
+    def _run_optional(self, name: str, deadline: Optional[Deadline], result: Dict, run):
+        """
+        运行可选分析器并更新其耗时估计；剩余时间不足，或分析器等待合批推理超过截止时间（TimeoutError）时跳过
+
+        Returns:
+            分析器的返回值，跳过时为 None（记录在 result['skipped']）
+        """
+        with self._optional_lock:
+            cost = self.optional_costs[name]
+
+        if deadline is not None and not deadline.allows(cost):
+            result['skipped'].append({
+                'analyzer': name,
+                'reason': f"剩余时间 {deadline.remaining_ms():.0f}ms 不足（预计耗时 {cost * 1000:.0f}ms）"
+            })
+            return None
+
+        start = time.perf_counter()
+        try:
+            value = run()
+        except TimeoutError:
+            result['skipped'].append({'analyzer': name, 'reason': '等待合批推理超过请求截止时间'})
+            return None
+        elapsed = time.perf_counter() - start
+
+        alpha = DEADLINE_CONFIG['cost_ema_alpha']
+        with self._optional_lock:
+            self.optional_costs[name] = (1 - alpha) * self.optional_costs[name] + alpha * elapsed
+        return value
+
+    def _downsample(self, image: np.ndarray, max_pixels: Optional[int], cache: Dict) -> Tuple[np.ndarray, float]:
+        """
+        将图像用 INTER_AREA 缩小到像素预算以内
+
+        Args:
+            image: 原图
+            max_pixels: 像素预算，None 表示使用原图
+            cache: 同一请求内的缩放结果缓存，键为目标尺寸
+
+        Returns:
+            (缩放后的图像, 缩放比例)
+        """
+        h, w = image.shape[:2]
+        if not max_pixels or h * w <= max_pixels:
+            return image, 1.0
+
+        scale = np.sqrt(max_pixels / (h * w))
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        if size not in cache:
+            cache[size] = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return cache[size], size[0] / w
+
+    def _block_size(self, base_size: int, image: np.ndarray, budget_name: str) -> int:
+        """
+        按分析分辨率换算块边长
+
+        base_size 是按像素预算定义的块边长；小于预算的图像按比例缩小块边长，
+        使各尺寸输入的块网格覆盖相近的文档面积，得分可以直接比较。
+        """
+        h, w = image.shape[:2]
+        budget = IMAGE_ANALYSIS_CONFIG['pixel_budgets'][budget_name]
+        ratio = min(1.0, np.sqrt(h * w / budget))
+        return max(8, int(round(base_size * ratio)))
+
+    def _extract_patches(self, image: np.ndarray) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        将图像切分为固定大小的图像块
+
+        图像块数量超过 max_patches 时先用 INTER_AREA 缩小图像，保证图像块网格覆盖整张证件。
+
+        Args:
+            image: BGR图像
+
+        Returns:
+            (图像块数组 (N, 3, P, P) uint8 RGB, 网格形状 (rows, cols))
+        """
+        patch_size = int(self.inference_config['patch_size'])
+        max_patches = int(self.inference_config['max_patches'])
+
+        h, w = image.shape[:2]
+        n_patches = (h // patch_size) * (w // patch_size)
+        if n_patches > max_patches:
+            scale = np.sqrt(max_patches / n_patches)
+            new_w = max(patch_size, int(w * scale))
+            new_h = max(patch_size, int(h * scale))
+            image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
+            h, w = new_h, new_w
+
+        rows, cols = h // patch_size, w // patch_size
+        if rows == 0 or cols == 0:
+            return np.empty((0, 3, patch_size, patch_size), dtype=np.uint8), (0, 0)
+
+        rgb = cv2.cvtColor(image[:rows * patch_size, :cols * patch_size], cv2.COLOR_BGR2RGB)
+        patches = rgb.reshape(rows, patch_size, cols, patch_size, 3)
+        patches = patches.transpose(0, 2, 4, 1, 3).reshape(-1, 3, patch_size, patch_size)
+
+        return np.ascontiguousarray(patches), (rows, cols)
+
+    def _predict_patches(self, patches: np.ndarray) -> np.ndarray:
+        """
+        分批推理图像块的伪造概率
+
+        Args:
+            patches: 图像块数组 (N, 3, P, P) uint8
+
+        Returns:
+            伪造概率数组 (N,) float32
+        """
+        batch_size = int(self.inference_config['batch_size'])
+        probs = []
+
+        if self.onnx_session is not None:
+            for start in range(0, len(patches), batch_size):
+                batch = patches[start:start + batch_size].astype(np.float32) / 255.0
+                output = self.onnx_session.run(None, {self.onnx_input: batch})[0]
+                probs.append(output.reshape(-1))
+            if not probs:
+                return np.empty(0, dtype=np.float32)
+            return np.concatenate(probs).astype(np.float32)
+
+        with torch.inference_mode():
+            for start in range(0, len(patches), batch_size):
+                batch = torch.from_numpy(patches[start:start + batch_size]).float().div_(255.0)
+                probs.append(self.model(batch).reshape(-1).numpy())
+
+        if not probs:
+            return np.empty(0, dtype=np.float32)
+        return np.concatenate(probs).astype(np.float32)
+
+    def _predict_patch_batches(self, batches: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        合并多个请求的图像块一次推理，再按请求拆分结果（微批调度的批处理函数）
+
+        Args:
+            batches: 各请求的图像块数组 (N_i, 3, P, P) uint8
+
+        Returns:
+            各请求的伪造概率数组 (N_i,)
+        """
+        lengths = [len(patches) for patches in batches]
+        probs = self._predict_patches(np.concatenate(batches) if len(batches) > 1 else batches[0])
+        return np.split(probs, np.cumsum(lengths)[:-1])
+
+    def _run_cnn(self, image: np.ndarray, deadline: Optional[Deadline] = None) -> Tuple[float, np.ndarray]:
+        """
+        使用CNN对图像块分类并汇总为图像得分
+
+        伪造痕迹通常是局部的，因此取概率最高的前 top_ratio 图像块的均值作为得分。
+
+        Args:
+            image: BGR图像
+            deadline: 请求截止时间（可选），合批推理在截止时间内未完成时抛出 TimeoutError
+
+        Returns:
+            (CNN得分, 图像块概率网格 (rows, cols))
+        """
+        try:
+            patches, (rows, cols) = self._extract_patches(image)
+            if len(patches) == 0:
+                return 0.0, np.zeros((0, 0), dtype=np.float32)
+
+            if self.patch_batcher is not None:
+                probs = self.patch_batcher.submit(patches, deadline)
+            else:
+                probs = self._predict_patches(patches)
+            top_k = max(1, int(np.ceil(len(probs) * self.inference_config['top_ratio'])))
+            top_probs = np.partition(probs, len(probs) - top_k)[-top_k:]
+
+            return float(np.mean(top_probs)), probs.reshape(rows, cols)
+
+        except TimeoutError:
+            raise
+        except Exception as e:
+            print(f"CNN推理错误: {str(e)}")
+            return 0.0, np.zeros((0, 0), dtype=np.float32)
+
+    def _block_mean_std(self, array: np.ndarray, grid_size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        按网格向量化计算每个块的均值和标准差
+
+        与逐块循环 range(0, h - grid_size, grid_size) 覆盖相同的完整块，
+        利用 INTER_AREA 整数倍缩小等价于块内求均值的特性，避免Python层循环。
+
+        Args:
+            array: 单通道或多通道数组（多通道时统计块内所有通道的像素）
+            grid_size: 块边长
+
+        Returns:
+            (块均值网格, 块标准差网格)，形状均为 (rows, cols)
+        """
+        h, w = array.shape[:2]
+        rows, cols = (h - 1) // grid_size, (w - 1) // grid_size
+        if rows <= 0 or cols <= 0:
+            empty = np.zeros((0, 0), dtype=np.float64)
+            return empty, empty
+
+        region = array[:rows * grid_size, :cols * grid_size].astype(np.float64)
+        mean = cv2.resize(region, (cols, rows), interpolation=cv2.INTER_AREA)
+        sq_mean = cv2.resize(region * region, (cols, rows), interpolation=cv2.INTER_AREA)
+
+        if mean.ndim == 3:
+            mean = mean.mean(axis=2)
+            sq_mean = sq_mean.mean(axis=2)
+
+        std = np.sqrt(np.maximum(sq_mean - mean * mean, 0.0))
+        return mean.reshape(rows, cols), std.reshape(rows, cols)
+
+    def _detect_splicing(self, image: np.ndarray) -> Tuple[float, np.ndarray]:
+        """
+        检测拼接伪影
+
+        Returns:
+            (拼接得分, 块标准差网格；块边长在像素预算分辨率下为64)
+        """
         # 使用ELA (Error Level Analysis) 技术
         # 简化实现：检测图像不同区域的压缩差异
         try:
-            h, w = image.shape[:2]
-            # 将图像分成网格
-            grid_size = 64
-            scores = []
-
-            for i in range(0, h - grid_size, grid_size):
-                for j in range(0, w - grid_size, grid_size):
-                    block = image[i:i+grid_size, j:j+grid_size]
-                    # 计算块的标准差
-                    std = np.std(block)
-                    scores.append(std)
-
-            if len(scores) > 0:
+            # 将图像分成网格，计算每个块的标准差
+            _, block_std = self._block_mean_std(image, self._block_size(64, image, 'splice'))
+
+            if block_std.size > 0:
                 # 如果标准差差异很大，可能存在拼接
-                score_std = np.std(scores)
-                return min(score_std / 100.0, 1.0)
+                score_std = np.std(block_std)
+                return min(score_std / 100.0, 1.0), block_std
 
         except:
             pass
 
-        return 0.0
+        return 0.0, np.zeros((0, 0), dtype=np.float64)
+
+    def _detect_resolution_inconsistency(self, image: np.ndarray) -> Tuple[float, np.ndarray]:
+        """
+        检测分辨率不一致
 
-    def _detect_resolution_inconsistency(self, image: np.ndarray) -> float:
-        """检测分辨率不一致"""
+        Returns:
+            (分辨率不一致得分, 块清晰度网格；块边长在像素预算分辨率下为100)
+        """
         try:
             # 使用拉普拉斯算子检测不同区域的清晰度
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             laplacian = cv2.Laplacian(gray, cv2.CV_64F)
 
-            h, w = gray.shape
-            grid_size = 100
-            sharpness_scores = []
-
-            for i in range(0, h - grid_size, grid_size):
-                for j in range(0, w - grid_size, grid_size):
-                    block = laplacian[i:i+grid_size, j:j+grid_size]
-                    sharpness = np.var(block)
-                    sharpness_scores.append(sharpness)
+            _, block_std = self._block_mean_std(laplacian, self._block_size(100, image, 'resolution'))
+            sharpness = block_std ** 2
 
-            if len(sharpness_scores) > 1:
+            if sharpness.size > 1:
                 # 清晰度差异大可能表示分辨率不一致
-                score_std = np.std(sharpness_scores)
-                mean_score = np.mean(sharpness_scores)
+                score_std = np.std(sharpness)
+                mean_score = np.mean(sharpness)
                 if mean_score > 0:
-                    return min(score_std / mean_score, 1.0)
+                    return min(score_std / mean_score, 1.0), sharpness
 
         except:
             pass
 
-        return 0.0
+        return 0.0, np.zeros((0, 0), dtype=np.float64)
+
+    def _robust_deviation(self, grid: np.ndarray) -> np.ndarray:
+        """
+        将块统计量网格转换为0-1的可疑度网格
+
+        以中位数和MAD估计文档的主体分布，偏离超过2个稳健标准差的块开始计为可疑，
+        偏离6个稳健标准差时可疑度为1。
+
+        Args:
+            grid: 块统计量网格
+
+        Returns:
+            可疑度网格 float32
+        """
+        if grid.size == 0:
+            return grid.astype(np.float32)
+
+        median = np.median(grid)
+        mad = np.median(np.abs(grid - median))
+        scale = max(1.4826 * mad, 0.1 * abs(median), 1e-6)
+        deviation = np.abs(grid - median) / scale
+
+        return np.clip((deviation - 2.0) / 4.0, 0.0, 1.0).astype(np.float32)
+
+    def _resize_grid(self, grid: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+        """将网格缩放到指定形状：缩小时取块均值，放大时保持块边界"""
+        rows, cols = shape
+        if grid.shape == (rows, cols):
+            return grid.astype(np.float32)
+        shrinking = grid.shape[0] >= rows and grid.shape[1] >= cols
+        interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_NEAREST
+        return cv2.resize(grid.astype(np.float32), (cols, rows), interpolation=interpolation)
+
+    def _localize(self, suspicion_grids: List[np.ndarray], image_shape: Tuple[int, int]) -> Dict:
+        """
+        融合各分析器的块级可疑度，生成紧凑热力图并提取连通的可疑区域
+
+        Args:
+            suspicion_grids: 0-1可疑度网格列表（形状可以不同）
+            image_shape: 原图 (h, w)
+
+        Returns:
+            定位结果字典：
+            - heatmap: uint8热力图 (rows, cols)，覆盖整张图像，255表示最可疑
+            - regions: 可疑区域列表 [{'bbox': [x, y, w, h], 'score': float}]，坐标为原图像素
+        """
+        localization = {
+            'heatmap': np.zeros((0, 0), dtype=np.uint8),
+            'regions': []
+        }
+
+        grids = [g for g in suspicion_grids if g is not None and g.size > 0]
+        if not grids:
+            return localization
+
+        max_cells = int(HEATMAP_CONFIG['max_cells'])
+        rows = max(g.shape[0] for g in grids)
+        cols = max(g.shape[1] for g in grids)
+        scale = min(1.0, max_cells / max(rows, cols))
+        shape = (max(1, int(round(rows * scale))), max(1, int(round(cols * scale))))
+
+        # 任一分析器认为可疑即标记
+        heat = np.maximum.reduce([self._resize_grid(g, shape) for g in grids])
+        heatmap = np.round(heat * 255).astype(np.uint8)
+        localization['heatmap'] = heatmap
+
+        threshold = int(HEATMAP_CONFIG['region_threshold'] * 255)
+        mask = (heatmap >= threshold).astype(np.uint8)
+        n_labels, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if n_labels <= 1:
+            return localization
+
+        # 各连通域内的最大可疑度
+        peak = np.zeros(n_labels, dtype=np.uint8)
+        np.maximum.at(peak, labels.ravel(), heatmap.ravel())
+
+        img_h, img_w = image_shape
+        cell_h, cell_w = img_h / shape[0], img_w / shape[1]
+        min_cells = int(HEATMAP_CONFIG['min_region_cells'])
+
+        for label in range(1, n_labels):
+            x, y, w, h, area = stats[label]
+            if area < min_cells:
+                continue
+            localization['regions'].append({
+                'bbox': [int(x * cell_w), int(y * cell_h), int(round(w * cell_w)), int(round(h * cell_h))],
+                'score': round(float(peak[label]) / 255.0, 3)
+            })
+
+        localization['regions'].sort(key=lambda r: r['score'], reverse=True)
+        return localization
+
+    @staticmethod
+    def render_heatmap_overlay(image: np.ndarray, heatmap: np.ndarray, regions: List[Dict],
+                               max_width: int = 1200) -> np.ndarray:
+        """
+        将热力图和可疑区域框叠加到证件图像上
+
+        Args:
+            image: BGR原图
+            heatmap: uint8热力图
+            regions: 可疑区域列表（原图坐标）
+            max_width: 输出图像最大宽度
+
+        Returns:
+            叠加后的BGR图像
+        """
+        h, w = image.shape[:2]
+        scale = min(1.0, max_width / w)
+        if scale < 1.0:
+            image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        out_h, out_w = image.shape[:2]
+
+        if heatmap.size == 0:
+            return image.copy()
+
+        heat = cv2.resize(heatmap, (out_w, out_h), interpolation=cv2.INTER_LINEAR)
+        colored = cv2.applyColorMap(heat, cv2.COLORMAP_JET)
+        overlay = cv2.addWeighted(image, 0.6, colored, 0.4, 0)
+
+        for region in regions:
+            x, y, bw, bh = [int(v * scale) for v in region['bbox']]
+            cv2.rectangle(overlay, (x, y), (x + bw, y + bh), (0, 0, 255), 2)
+            cv2.putText(overlay, f"{region['score']:.2f}", (x, max(y - 5, 12)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+        return overlay
 
     def _detect_jpeg_artifacts(self, image: np.ndarray) -> float:
-        """检测JPEG压缩伪影"""
+        """
+        检测JPEG压缩伪影
+
+        8x8块边界只在原始分辨率下存在，因此不降采样；大图只取均匀分布、8像素对齐的
+        若干原图切片，使耗时与输入尺寸无关。
+        """
         try:
             # 检测8x8块边界的不连续性
             gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-            # 计算8的倍数位置的梯度
             block_size = 8
             discontinuities = []
 
-            h, w = gray.shape
-            for i in range(block_size, h - block_size, block_size):
-                diff = np.abs(gray[i, :] - gray[i-1, :])
-                discontinuities.append(np.mean(diff))
-
-            for j in range(block_size, w - block_size, block_size):
-                diff = np.abs(gray[:, j] - gray[:, j-1])
-                discontinuities.append(np.mean(diff))
+            for tile in self._native_tiles(gray):
+                # 计算8的倍数位置的梯度（转为有符号类型，避免uint8相减溢出）
+                tile = tile.astype(np.int16)
+                h, w = tile.shape
+                rows = np.arange(block_size, h - block_size, block_size)
+                cols = np.arange(block_size, w - block_size, block_size)
+                if len(rows) > 0:
+                    discontinuities.append(np.abs(tile[rows, :] - tile[rows - 1, :]).mean(axis=1))
+                if len(cols) > 0:
+                    discontinuities.append(np.abs(tile[:, cols] - tile[:, cols - 1]).mean(axis=0))
 
             if discontinuities:
-                score = np.mean(discontinuities) / 50.0
+                score = np.mean(np.concatenate(discontinuities)) / 50.0
                 return min(score, 1.0)
 
         except:
@@ -202,6 +1420,92 @@ class ImageForgeryDetector:
 
         return 0.0
 
+    def _detect_double_compression(self, image: np.ndarray, header: Dict) -> float:
+        """
+        基于DCT系数直方图检测JPEG二次压缩
+
+        先以较粗量化表压缩、再以较细量化表重新保存的图像，其低频DCT系数按当前量化步长
+        取整后的直方图会周期性出现空桶；单次压缩的直方图是平滑递减的。
+        在原图8x8网格对齐的切片上，用一次矩阵乘法只计算选定频率的DCT系数。
+
+        Args:
+            image: 解码后的BGR图像
+            header: parse_jpeg_headers 的结果
+
+        Returns:
+            得分(0-1)，取头部编辑软件签名分与二次压缩分的较大值
+        """
+        config = JPEG_ANALYSIS_CONFIG
+        header_score = config['editor_signature_score'] if header['editor_signatures'] else 0.0
+
+        try:
+            table = header['quantization_tables'].get(0)
+            if table is None:
+                return header_score
+
+            frequencies = config['dct_frequencies']
+            dct = cv2.dct(np.eye(8, dtype=np.float32), flags=cv2.DCT_ROWS).T
+            basis = np.stack([np.outer(dct[u], dct[v]).ravel() for u, v in frequencies], axis=1)
+            steps = np.array([table[u, v] for u, v in frequencies], dtype=np.float32)
+
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            blocks = []
+            for tile in self._native_tiles(gray):
+                h, w = tile.shape[0] // 8 * 8, tile.shape[1] // 8 * 8
+                if h == 0 or w == 0:
+                    continue
+                blocks.append(
+                    tile[:h, :w].astype(np.float32)
+                    .reshape(h // 8, 8, w // 8, 8).transpose(0, 2, 1, 3).reshape(-1, 64)
+                )
+            if not blocks:
+                return header_score
+
+            # 量化后的系数幅值直方图 (频率数, bins)，不含0桶
+            bins = int(config['histogram_bins'])
+            quantized = np.abs(np.rint(np.concatenate(blocks) @ basis / steps)).astype(np.int64)
+            quantized = np.minimum(quantized, bins + 1)
+            hist = np.stack([
+                np.bincount(quantized[:, k], minlength=bins + 2)[1:bins + 1]
+                for k in range(len(frequencies))
+            ]).astype(np.float64)
+
+            # 空桶：两侧窗口内都有充足计数，而本桶计数远低于两侧
+            window = int(config['valley_window'])
+            padded = np.pad(hist, ((0, 0), (window, window)))
+            left = np.max(np.stack([padded[:, window - d:window - d + bins] for d in range(1, window + 1)]), axis=0)
+            right = np.max(np.stack([padded[:, window + d:window + d + bins] for d in range(1, window + 1)]), axis=0)
+            envelope = np.minimum(left, right)
+
+            min_count = config['min_bin_count']
+            populated = hist >= min_count
+            valleys = (hist < config['valley_ratio'] * envelope) & (envelope >= min_count)
+            usable = populated.sum(axis=1) >= 3
+            if not np.any(usable):
+                return header_score
+
+            fractions = valleys.sum(axis=1)[usable] / (populated.sum(axis=1) + valleys.sum(axis=1))[usable]
+            double_score = min(float(np.median(fractions)) / config['double_compression_fraction'], 1.0)
+            return max(header_score, double_score)
+
+        except Exception as e:
+            print(f"二次压缩检测错误: {str(e)}")
+
+        return header_score
+
+    def _native_tiles(self, gray: np.ndarray) -> List[np.ndarray]:
+        """在原图上均匀选取8像素对齐的切片，总像素数不超过 jpeg_native_pixels"""
+        h, w = gray.shape
+        budget = IMAGE_ANALYSIS_CONFIG['jpeg_native_pixels']
+        if h * w <= budget:
+            return [gray]
+
+        tile = int(IMAGE_ANALYSIS_CONFIG['jpeg_tile'])
+        per_side = max(1, int(np.sqrt(budget / (tile * tile))))
+        ys = (np.linspace(0, max(h - tile, 0), per_side) // 8 * 8).astype(int)
+        xs = (np.linspace(0, max(w - tile, 0), per_side) // 8 * 8).astype(int)
+        return [gray[y:y + tile, x:x + tile] for y in ys for x in xs]
+
     def _detect_edge_anomalies(self, image: np.ndarray) -> float:
         """检测边缘异常"""
         try:
@@ -354,6 +1658,664 @@ class TextConsistencyChecker:
         return 0.0
 
 
+class TemplateIndex:
+    """证件模板特征索引
+
+    为每个模板预计算紧凑描述子，按 (certificate_type, country) 组织在内存中：
+    - 布局向量：文本框归一化到文本区域后栅格化的占用网格（L2归一化）
+    - 关键点：限定数量的ORB关键点坐标和描述子
+    - 背景频谱：固定尺寸切片2D FFT的平均频谱周期峰，刻画底纹/防伪纹/水印的周期结构
+    索引以未压缩的 .npz 二进制文件缓存到磁盘，worker启动时毫秒级加载。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        初始化空索引
+
+        Args:
+            config: 模板匹配配置，默认使用 config.TEMPLATE_CONFIG
+        """
+        self.config = dict(TEMPLATE_CONFIG)
+        if config:
+            self.config.update(config)
+
+        self.templates = []                 # 模板元数据 [{'certificate_type', 'country', 'name'}]
+        self.keys = {}                      # (certificate_type, country) -> 模板序号列表
+        self.layouts = np.zeros((0, self.config['layout_grid'] ** 2), dtype=np.float32)
+        self.points = []                    # 每个模板的关键点坐标 (K, 2) float32
+        self.descriptors = []               # 每个模板的关键点描述子 (K, 32) uint8
+        self.spectra = np.zeros((0, self.config['spectrum_grid'] ** 2), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.templates)
+
+    def layout_vector(self, polygons: np.ndarray) -> np.ndarray:
+        """
+        计算文本框布局向量
+
+        Args:
+            polygons: 文本框数组 (N, 4, 2)
+
+        Returns:
+            布局向量 (grid*grid,) float32，无文本框时为全零
+        """
+        grid = int(self.config['layout_grid'])
+        if len(polygons) == 0:
+            return np.zeros(grid * grid, dtype=np.float32)
+
+        # 归一化到所有文本框的外接矩形，消除平移、缩放和页边距差异
+        flat = polygons.reshape(-1, 2)
+        origin = flat.min(axis=0)
+        extent = np.maximum(flat.max(axis=0) - origin, 1.0)
+
+        canvas_size = grid * 4
+        normalized = (polygons - origin) / extent * (canvas_size - 1)
+        canvas = np.zeros((canvas_size, canvas_size), dtype=np.uint8)
+        cv2.fillPoly(canvas, list(np.round(normalized).astype(np.int32)), 255)
+
+        occupancy = cv2.resize(canvas.astype(np.float32) / 255.0, (grid, grid), interpolation=cv2.INTER_AREA)
+        vector = occupancy.reshape(-1)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).astype(np.float32)
+
+    def keypoint_features(self, gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        提取限定数量的ORB关键点
+
+        Args:
+            gray: 灰度图像（长边超过 max_side 时先缩小）
+
+        Returns:
+            (关键点坐标 (K, 2)，按 max_side 尺度归一化, 描述子 (K, 32) uint8)
+        """
+        h, w = gray.shape[:2]
+        scale = self.config['max_side'] / max(h, w)
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))),
+                          interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+        orb = cv2.ORB_create(nfeatures=int(self.config['max_keypoints']))
+        keypoints, descriptors = orb.detectAndCompute(gray, None)
+        if descriptors is None:
+            return np.empty((0, 2), dtype=np.float32), np.empty((0, 32), dtype=np.uint8)
+
+        points = np.array([kp.pt for kp in keypoints], dtype=np.float32)
+        return points, descriptors
+
+    def background_spectrum(self, gray: np.ndarray) -> np.ndarray:
+        """
+        计算背景频谱签名
+
+        文档先缩放到固定宽度（底纹周期在模板与待检文档间可比），填补文字笔画后均匀取固定数量的
+        spectrum_size 见方切片加汉宁窗做2D FFT，平均功率谱（Welch法，文字内容被平均掉，
+        平稳的底纹周期峰保留）。对数幅度谱减去其平滑版本只留下周期峰，去掉低频后
+        最大值汇聚成 grid x grid 网格，去均值、L2归一化，用余弦相似度比较。
+        FFT尺寸和数量固定，耗时与输入分辨率无关。
+
+        Args:
+            gray: 灰度图像
+
+        Returns:
+            频谱签名 (grid*grid,) float32
+        """
+        size = int(self.config['spectrum_size'])
+        grid = int(self.config['spectrum_grid'])
+        per_side = int(self.config['spectrum_tiles'])
+
+        h, w = gray.shape[:2]
+        scale = self.config['spectrum_width'] / w
+        height = max(size, int(round(h * scale)))
+        width = max(size, int(self.config['spectrum_width']))
+        resized = cv2.resize(gray, (width, height),
+                             interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR).astype(np.float32)
+
+        ys = np.linspace(0, height - size, per_side).astype(int)
+        xs = np.linspace(0, width - size, per_side).astype(int)
+        tiles = np.concatenate([resized[y:y + size, x:x + size] for y in ys for x in xs])
+
+        # 文字笔画远比底纹深，用周围纸面的加权平均填补（归一化卷积），避免行距周期盖过底纹
+        sample = tiles[::4, ::4]
+        median = float(np.median(sample))
+        mad = float(np.median(np.abs(sample - median))) + 1.0
+        paper = (tiles > median - 4 * 1.4826 * mad).astype(np.float32)
+        filled = cv2.GaussianBlur(tiles * paper, (0, 0), 4) / np.maximum(cv2.GaussianBlur(paper, (0, 0), 4), 1e-3)
+        tiles = np.where(paper > 0, tiles, filled).reshape(-1, size, size)
+        tiles -= tiles.mean(axis=(1, 2), keepdims=True)
+        tiles *= cv2.createHanningWindow((size, size), cv2.CV_32F)
+
+        power = np.mean(np.abs(np.fft.fft2(tiles)) ** 2, axis=0)
+        magnitude = np.log1p(np.sqrt(np.fft.fftshift(power))).astype(np.float32)
+        peaks = np.maximum(magnitude - cv2.GaussianBlur(magnitude, (0, 0), 3), 0.0)
+
+        yy, xx = np.ogrid[:size, :size]
+        radius = np.hypot(yy - size // 2, xx - size // 2)
+        peaks[radius < self.config['spectrum_min_radius'] * size] = 0.0
+
+        cell = size // grid
+        pooled = peaks[:grid * cell, :grid * cell].reshape(grid, cell, grid, cell).max(axis=(1, 3)).reshape(-1)
+        pooled -= pooled.mean()
+        norm = np.linalg.norm(pooled)
+        return (pooled / norm if norm > 0 else pooled).astype(np.float32)
+
+    def add(self, certificate_type: str, country: str, name: str,
+            polygons: np.ndarray, gray: Optional[np.ndarray] = None):
+        """
+        向索引中添加模板
+
+        Args:
+            certificate_type: 证件类型
+            country: 国家
+            name: 模板名称（通常为模板图像路径）
+            polygons: 模板OCR文本框 (N, 4, 2)
+            gray: 模板灰度图像，用于提取关键点和背景频谱
+        """
+        if gray is not None:
+            points, descriptors = self.keypoint_features(gray)
+            spectrum = self.background_spectrum(gray)
+        else:
+            points, descriptors = np.empty((0, 2), dtype=np.float32), np.empty((0, 32), dtype=np.uint8)
+            spectrum = np.zeros(self.spectra.shape[1], dtype=np.float32)
+
+        index = len(self.templates)
+        self.templates.append({'certificate_type': certificate_type, 'country': country, 'name': name})
+        self.keys.setdefault((certificate_type, country), []).append(index)
+        self.layouts = np.vstack([self.layouts, self.layout_vector(polygons)[None, :]])
+        self.points.append(points)
+        self.descriptors.append(descriptors)
+        self.spectra = np.vstack([self.spectra, spectrum[None, :]])
+
+    def save(self, path):
+        """
+        以二进制格式保存索引
+
+        关键点按模板顺序拼接存放，offsets 记录每个模板的起止位置。
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        counts = [len(d) for d in self.descriptors]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        points = np.concatenate(self.points) if self.points else np.empty((0, 2), dtype=np.float32)
+        descriptors = np.concatenate(self.descriptors) if self.descriptors else np.empty((0, 32), dtype=np.uint8)
+
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps({'templates': self.templates, 'config': self.config},
+                                         ensure_ascii=False)),
+                layouts=self.layouts,
+                points=points.astype(np.float32),
+                descriptors=descriptors.astype(np.uint8),
+                offsets=offsets,
+                spectra=self.spectra.astype(np.float32)
+            )
+
+    @classmethod
+    def load(cls, path) -> 'TemplateIndex':
+        """
+        加载二进制索引，文件不存在或损坏时返回空索引
+
+        Args:
+            path: 索引文件路径
+
+        Returns:
+            模板索引
+        """
+        if not path or not Path(path).exists():
+            return cls()
+
+        try:
+            with np.load(str(path)) as data:
+                meta = json.loads(str(data['meta']))
+                index = cls(meta['config'])
+                index.layouts = data['layouts']
+                offsets = data['offsets']
+                points, descriptors = data['points'], data['descriptors']
+                # 旧版索引没有背景频谱，全零行在比对时跳过
+                if 'spectra' in data.files:
+                    index.spectra = data['spectra']
+                else:
+                    index.spectra = np.zeros((len(meta['templates']), index.config['spectrum_grid'] ** 2),
+                                             dtype=np.float32)
+
+            index.templates = meta['templates']
+            for i, template in enumerate(index.templates):
+                index.keys.setdefault((template['certificate_type'], template['country']), []).append(i)
+                index.points.append(points[offsets[i]:offsets[i + 1]])
+                index.descriptors.append(descriptors[offsets[i]:offsets[i + 1]])
+            return index
+
+        except Exception as e:
+            print(f"加载模板索引失败: {str(e)}")
+            return cls()
+
+    def candidates(self, certificate_type: str, country: Optional[str] = None) -> List[int]:
+        """返回指定类型（和国家）的模板序号"""
+        if country:
+            return list(self.keys.get((certificate_type, country), []))
+        return [i for (cert_type, _), ids in self.keys.items() if cert_type == certificate_type for i in ids]
+
+    def match(self, certificate_type: str, polygons: np.ndarray, gray: Optional[np.ndarray] = None,
+              country: Optional[str] = None) -> Optional[Dict]:
+        """
+        查找最近的模板并计算模板偏离得分
+
+        先用布局向量的余弦距离在候选模板中取前 top_k 个，再对这些模板做关键点匹配和
+        单应性验证，综合两者得到与模板的相似度。
+
+        Args:
+            certificate_type: 证件类型
+            polygons: 待检文档的OCR文本框 (N, 4, 2)
+            gray: 待检文档灰度图像（可选，提供时做关键点验证）
+            country: 国家（可选，提供时只在该国模板中查找）
+
+        Returns:
+            匹配结果字典，无候选模板时返回None：
+            - template: 最近模板元数据
+            - layout_similarity: 布局相似度(0-1)
+            - keypoint_inlier_ratio: 关键点内点比例(0-1)，未做关键点验证时为None
+            - score: 模板偏离得分(0-1)，越高越可疑
+        """
+        ids = self.candidates(certificate_type, country)
+        if not ids or len(polygons) == 0:
+            return None
+
+        query = self.layout_vector(polygons)
+        similarity = self.layouts[ids] @ query
+        order = np.argsort(-similarity)[:int(self.config['top_k'])]
+
+        if gray is not None:
+            points, descriptors = self.keypoint_features(gray)
+        else:
+            points, descriptors = None, None
+
+        weight = float(self.config['layout_weight'])
+        best = None
+        for rank in order:
+            template_id = ids[rank]
+            layout_similarity = float(max(similarity[rank], 0.0))
+            inlier_ratio = None
+            combined = layout_similarity
+
+            if descriptors is not None and len(descriptors) > 0 and len(self.descriptors[template_id]) > 0:
+                inlier_ratio = self._keypoint_inlier_ratio(points, descriptors, template_id)
+                combined = weight * layout_similarity + (1 - weight) * inlier_ratio
+
+            if best is None or combined > best['similarity']:
+                best = {
+                    'template': self.templates[template_id],
+                    'layout_similarity': round(layout_similarity, 4),
+                    'keypoint_inlier_ratio': None if inlier_ratio is None else round(inlier_ratio, 4),
+                    'similarity': combined
+                }
+
+        # 相似度低于 min_similarity 时得分线性升至1
+        min_similarity = float(self.config['min_similarity'])
+        best['score'] = float(np.clip((min_similarity - best['similarity']) / min_similarity, 0.0, 1.0))
+        best['similarity'] = round(best['similarity'], 4)
+        return best
+
+    def has_spectra(self, certificate_type: Optional[str] = None) -> bool:
+        """是否有可比对的模板参考频谱"""
+        return bool(self._spectrum_ids(certificate_type))
+
+    def _spectrum_ids(self, certificate_type: Optional[str] = None) -> List[int]:
+        """有参考频谱的候选模板下标"""
+        ids = self.candidates(certificate_type) if certificate_type else list(range(len(self.templates)))
+        return [i for i in ids if np.any(self.spectra[i])]
+
+    def match_spectrum(self, gray: np.ndarray, certificate_type: Optional[str] = None) -> Optional[Dict]:
+        """
+        将文档背景频谱与模板参考频谱比对
+
+        参考频谱在构建索引时预计算并常驻内存，每次请求只计算一次待检文档的FFT，
+        与所有候选模板的相似度由一次矩阵乘法得到。
+
+        Args:
+            gray: 待检文档灰度图像
+            certificate_type: 证件类型（可选，不提供时与全部模板比对）
+
+        Returns:
+            匹配结果字典，无参考频谱时返回None：
+            - template: 频谱最接近的模板元数据
+            - similarity: 余弦相似度
+            - score: 底纹/水印异常得分(0-1)
+        """
+        ids = self._spectrum_ids(certificate_type)
+        if not ids:
+            return None
+
+        similarity = self.spectra[ids] @ self.background_spectrum(gray)
+        best = int(np.argmax(similarity))
+        best_similarity = float(similarity[best])
+
+        min_similarity = float(self.config['min_spectrum_similarity'])
+        return {
+            'template': self.templates[ids[best]],
+            'similarity': round(best_similarity, 4),
+            'score': float(np.clip((min_similarity - best_similarity) / min_similarity, 0.0, 1.0))
+        }
+
+    def _keypoint_inlier_ratio(self, points: np.ndarray, descriptors: np.ndarray, template_id: int) -> float:
+        """关键点最近邻匹配后用RANSAC单应性验证，返回内点占较少一方关键点数的比例"""
+        template_points = self.points[template_id]
+        dist = hamming_distances(descriptors, self.descriptors[template_id])
+
+        if dist.shape[1] < 2:
+            return 0.0
+        nearest = np.argpartition(dist, 1, axis=1)[:, :2]
+        d = np.sort(np.take_along_axis(dist, nearest, axis=1), axis=1)
+        best_idx = np.argmin(dist, axis=1)
+
+        good = (d[:, 0] <= self.config['max_hamming']) & (d[:, 0] < self.config['ratio'] * d[:, 1])
+        if good.sum() < 4:
+            return 0.0
+
+        _, mask = cv2.findHomography(points[good], template_points[best_idx[good]], cv2.RANSAC, 8.0)
+        if mask is None:
+            return 0.0
+
+        return float(mask.sum()) / min(len(points), len(template_points))
+
+
+class SealAnalyzer:
+    """红色印章分析器
+
+    在缩小后的图像上用HSV阈值（cv2.inRange，整幅图像一次完成）分割红色区域，
+    筛选圆形/椭圆形连通域作为印章，检查：
+    - 数量：彩色文档没有印章，或印章数量过多
+    - 位置：印章中心落在证件边界框之外
+    - 边缘锐度：与周围印刷文字的锐度差异过大（数字粘贴的印章边缘通常更锐利）
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        初始化印章分析器
+
+        Args:
+            config: 分析配置，默认使用 config.SEAL_CONFIG
+        """
+        self.config = dict(SEAL_CONFIG)
+        if config:
+            self.config.update(config)
+
+    def analyze(self, image: np.ndarray, bbox: Optional[List[int]] = None, image_scale: float = 1.0) -> Dict:
+        """
+        检测并校验印章
+
+        Args:
+            image: BGR图像
+            bbox: 证件边界框 [x, y, w, h]（原图坐标）
+            image_scale: image 相对原图的缩放比例，用于换算坐标
+
+        Returns:
+            分析结果字典：
+            - score: 印章可疑度(0-1)
+            - seals: [{'box': [x, y, w, h], 'circularity', 'sharpness_ratio', 'inside_bbox'}]（原图坐标）
+            - flags: 命中的可疑项
+            - issues: 可读的问题描述
+        """
+        result = {
+            'score': 0.0,
+            'seals': [],
+            'flags': [],
+            'issues': []
+        }
+        config = self.config
+
+        h, w = image.shape[:2]
+        scale = min(1.0, config['max_side'] / max(h, w))
+        if scale < 1.0:
+            image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        to_original = 1.0 / (scale * image_scale)
+
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        low_hue, high_hue = config['red_hue']
+        sat, val = config['min_saturation'], config['min_value']
+        mask = cv2.inRange(hsv, (0, sat, val), (low_hue, 255, 255)) | \
+            cv2.inRange(hsv, (high_hue, sat, val), (180, 255, 255))
+
+        # 闭运算连接印章外圈和内部文字
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (7, 7)))
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+        # 边缘区域膨胀后覆盖灰度过渡的两侧；印刷文字取印章以外的深色笔画
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        kernel = np.ones((5, 5), np.uint8)
+        print_region = cv2.dilate((gray < 100).astype(np.uint8), kernel) & (cv2.dilate(mask, kernel) == 0)
+        print_sharpness = self._edge_sharpness(gray, print_region > 0)
+
+        area_total = float(image.shape[0] * image.shape[1])
+        areas = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+        sides = stats[1:, [cv2.CC_STAT_WIDTH, cv2.CC_STAT_HEIGHT]].astype(np.float64)
+        aspect = sides[:, 0] / np.maximum(sides[:, 1], 1.0)
+        candidates = np.flatnonzero(
+            (areas >= config['min_area_fraction'] * area_total) &
+            (areas <= config['max_area_fraction'] * area_total) &
+            (aspect >= config['aspect_range'][0]) & (aspect <= config['aspect_range'][1])
+        ) + 1
+
+        flag_scores = config['flag_scores']
+        flags = []
+        for label in candidates:
+            x, y, bw, bh = stats[label, :4]
+            component = (labels[y:y + bh, x:x + bw] == label).astype(np.uint8)
+            contours, _ = cv2.findContours(component, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            hull = cv2.convexHull(np.concatenate(contours))
+            perimeter = cv2.arcLength(hull, True)
+            circularity = 4 * np.pi * cv2.contourArea(hull) / max(perimeter * perimeter, 1e-6)
+            if circularity < config['min_circularity']:
+                continue
+
+            seal_sharpness = self._edge_sharpness(gray[y:y + bh, x:x + bw], cv2.dilate(component, kernel) > 0)
+            ratio = seal_sharpness / print_sharpness if print_sharpness and seal_sharpness else None
+
+            box = [int(round(v * to_original)) for v in (x, y, bw, bh)]
+            seal = {
+                'box': box,
+                'circularity': round(float(circularity), 3),
+                'sharpness_ratio': round(float(ratio), 3) if ratio else None,
+                'inside_bbox': self._inside_bbox(box, bbox)
+            }
+            result['seals'].append(seal)
+
+            if not seal['inside_bbox']:
+                flags.append({'flag': 'outside_bbox', 'detail': f"印章 {box} 位于证件区域之外"})
+            tolerance = config['sharpness_tolerance']
+            if ratio and (ratio > tolerance or ratio < 1.0 / tolerance):
+                flags.append({'flag': 'sharpness_mismatch',
+                              'detail': f"印章 {box} 边缘锐度与周围文字不一致 (比值: {ratio:.2f})"})
+
+        seal_count = len(result['seals'])
+        is_color = float(hsv[..., 1].mean()) >= config['color_saturation'] or np.any(mask)
+        if seal_count < config['expected_count'][0] and is_color:
+            flags.append({'flag': 'missing_seal', 'detail': "未检测到红色印章"})
+        elif seal_count > config['expected_count'][1]:
+            flags.append({'flag': 'extra_seals', 'detail': f"检测到 {seal_count} 个印章，数量异常"})
+
+        result['flags'] = flags
+        result['issues'] = [flag['detail'] for flag in flags]
+        result['score'] = float(max((flag_scores.get(flag['flag'], 0.0) for flag in flags), default=0.0))
+
+        return result
+
+    @staticmethod
+    def _edge_sharpness(gray: np.ndarray, region: np.ndarray) -> Optional[float]:
+        """
+        区域内边缘的锐度：梯度幅值与局部灰度范围之比
+
+        台阶边缘越陡，梯度相对于两侧灰度差越大；除以局部范围后不受墨色深浅影响。
+        """
+        if np.count_nonzero(region) < 50:
+            return None
+        gray = gray.astype(np.float32)
+        gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+        gradient = cv2.magnitude(gx, gy)
+        local_range = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((7, 7), np.uint8))
+
+        # 只取区域内梯度较强的像素，阈值相对于区域内的强边缘
+        edges = region & (gradient > 0.5 * np.percentile(gradient[region], 95)) & (local_range > 10)
+        if np.count_nonzero(edges) < 50:
+            return None
+        return float(np.median(gradient[edges] / local_range[edges]))
+
+    def _inside_bbox(self, box: List[int], bbox: Optional[List[int]]) -> bool:
+        """印章中心是否落在（按比例放宽的）证件边界框内"""
+        if not bbox or len(bbox) != 4 or bbox[2] <= 0 or bbox[3] <= 0:
+            return True
+        bx, by, bw, bh = bbox
+        margin_x, margin_y = self.config['bbox_margin'] * bw, self.config['bbox_margin'] * bh
+        cx, cy = box[0] + box[2] / 2, box[1] + box[3] / 2
+        return bool(bx - margin_x <= cx <= bx + bw + margin_x and by - margin_y <= cy <= by + bh + margin_y)
+
+
+class FontConsistencyAnalyzer:
+    """逐行字体一致性分析器
+
+    粘贴或重新录入的字段常用略有不同的字号或笔画粗细。所有文本行的裁剪图拼接成
+    一张图，一次完成二值化、距离变换和连通域分析，再按行号聚合：
+    - 笔画宽度：距离变换在笔画中脊（局部极大值）处的取值 x2
+    - 字高：行内连通域高度的中位数
+    每行按内容分为标题/数值/文本三类，只与同类行比较，稳健偏离度过大的行判为离群。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        初始化字体一致性分析器
+
+        Args:
+            config: 分析配置，默认使用 config.FONT_CONFIG
+        """
+        self.config = dict(FONT_CONFIG)
+        if config:
+            self.config.update(config)
+
+    def analyze(self, gray: np.ndarray, polygons: np.ndarray, texts: List[str]) -> Dict:
+        """
+        分析各文本行的字体一致性
+
+        Args:
+            gray: 原分辨率灰度图像
+            polygons: 文本行四边形 (N, 4, 2)，原图坐标
+            texts: 各行识别文本
+
+        Returns:
+            分析结果字典：
+            - score: 字体不一致得分(0-1)
+            - lines: [{'index', 'text', 'role', 'stroke_width', 'glyph_height', 'outlier'}]
+            - outlier_lines: 离群行序号
+        """
+        result = {
+            'score': 0.0,
+            'lines': [],
+            'outlier_lines': []
+        }
+        config = self.config
+
+        h, w = gray.shape[:2]
+        polygons = polygons[:int(config['max_lines'])]
+        mins = np.clip(np.floor(polygons.min(axis=1)), 0, [w - 1, h - 1]).astype(int)
+        maxs = np.clip(np.ceil(polygons.max(axis=1)), 0, [w, h]).astype(int)
+        sizes = maxs - mins
+        keep = np.flatnonzero((sizes[:, 0] >= 4) & (sizes[:, 1] >= 4))
+        if len(keep) < config['min_lines_per_role']:
+            return result
+
+        # 各行裁剪图纵向拼接，行间留空白，rows_line 记录拼接图每一行像素所属的文本行
+        pad = int(config['padding'])
+        heights = sizes[keep, 1]
+        offsets = np.concatenate([[0], np.cumsum(heights + pad)])
+        mosaic = np.full((int(offsets[-1]), int(sizes[keep, 0].max())), 255, dtype=np.uint8)
+        for slot, line in enumerate(keep):
+            (x0, y0), (x1, y1) = mins[line], maxs[line]
+            mosaic[offsets[slot]:offsets[slot] + heights[slot], :x1 - x0] = gray[y0:y1, x0:x1]
+        slot_rows = np.repeat(np.arange(len(keep)), heights + pad)
+        within = np.arange(len(mosaic)) - offsets[slot_rows]
+        rows_line = np.where(within < heights[slot_rows], slot_rows, -1)
+
+        # 一次完成二值化、距离变换和连通域分析
+        _, ink = cv2.threshold(mosaic, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        distance = cv2.distanceTransform(ink, cv2.DIST_L2, 3)
+        ridge = (ink > 0) & (distance >= cv2.dilate(distance, np.ones((3, 3), np.uint8)))
+        ridge_rows, ridge_cols = np.nonzero(ridge)
+        ridge_line = rows_line[ridge_rows]
+        valid = ridge_line >= 0
+        counts = np.bincount(ridge_line[valid], minlength=len(keep))
+        stroke = np.bincount(ridge_line[valid], weights=2 * distance[ridge_rows[valid], ridge_cols[valid]] - 1,
+                             minlength=len(keep)) / np.maximum(counts, 1)
+
+        _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+        stats = stats[1:]
+        stats = stats[stats[:, cv2.CC_STAT_AREA] >= config['min_component_area']]
+        component_line = rows_line[stats[:, cv2.CC_STAT_TOP]]
+        glyph_height = self._group_median(component_line, stats[:, cv2.CC_STAT_HEIGHT].astype(np.float64),
+                                          len(keep))
+
+        # 按内容和行高划分行类别
+        box_height = heights.astype(np.float64)
+        median_height = max(float(np.median(box_height)), 1.0)
+        roles = [self.line_role(texts[line] if line < len(texts) else '', box_height[slot] / median_height)
+                 for slot, line in enumerate(keep)]
+        roles = np.array(roles)
+
+        measured = (counts > 0) & np.isfinite(glyph_height)
+        outliers = np.zeros(len(keep), dtype=bool)
+        for role in np.unique(roles):
+            members = (roles == role) & measured
+            if members.sum() < config['min_lines_per_role']:
+                continue
+            deviation = np.zeros(len(keep))
+            for values in (stroke, glyph_height):
+                median = np.median(values[members])
+                spread = 1.4826 * np.median(np.abs(values[members] - median)) + config['relative_floor'] * median
+                deviation = np.maximum(deviation, np.abs(values - median) / max(spread, 1e-6))
+            outliers |= members & (deviation > config['z_threshold'])
+
+        for slot, line in enumerate(keep):
+            result['lines'].append({
+                'index': int(line),
+                'text': texts[line] if line < len(texts) else '',
+                'role': str(roles[slot]),
+                'stroke_width': round(float(stroke[slot]), 2) if counts[slot] else None,
+                'glyph_height': round(float(glyph_height[slot]), 1) if np.isfinite(glyph_height[slot]) else None,
+                'outlier': bool(outliers[slot])
+            })
+
+        result['outlier_lines'] = [int(line) for line in keep[outliers]]
+        compared = int(measured.sum())
+        if compared:
+            result['score'] = min(outliers.sum() / compared / config['max_outlier_fraction'], 1.0)
+
+        return result
+
+    def line_role(self, text: str, relative_height: float) -> str:
+        """按行高和内容划分行类别：title / numeric / text"""
+        if relative_height > self.config['title_height_ratio']:
+            return 'title'
+        chars = [c for c in text if not c.isspace()]
+        if chars and sum(c.isdigit() for c in chars) / len(chars) >= self.config['numeric_fraction']:
+            return 'numeric'
+        return 'text'
+
+    @staticmethod
+    def _group_median(groups: np.ndarray, values: np.ndarray, count: int) -> np.ndarray:
+        """按组求中位数（排序后取每组中间位置），无成员的组为NaN"""
+        medians = np.full(count, np.nan)
+        valid = groups >= 0
+        groups, values = groups[valid], values[valid]
+        if len(groups) == 0:
+            return medians
+        order = np.lexsort((values, groups))
+        groups, values = groups[order], values[order]
+        starts = np.searchsorted(groups, np.arange(count), side='left')
+        ends = np.searchsorted(groups, np.arange(count), side='right')
+        present = ends > starts
+        lower = values[(starts[present] + ends[present] - 1) // 2]
+        upper = values[(starts[present] + ends[present]) // 2]
+        medians[present] = (lower + upper) / 2
+        return medians
+
+
 class StructureValidator:
     """结构与格式层面校验器
 
@@ -363,11 +2325,19 @@ class StructureValidator:
     - 格式模板匹配
     """
 
-    def __init__(self):
-        """初始化结构校验器"""
-        pass
+    def __init__(self, template_index: Optional[TemplateIndex] = None):
+        """
+        初始化结构校验器
+
+        Args:
+            template_index: 模板特征索引，默认从 config.TEMPLATE_INDEX_PATH 加载
+        """
+        self.template_index = template_index if template_index is not None else TemplateIndex.load(TEMPLATE_INDEX_PATH)
+        self.seal_analyzer = SealAnalyzer()
+        self.font_analyzer = FontConsistencyAnalyzer()
 
-    def validate(self, ocr_result, certificate_type: str, bbox: List[int]) -> Dict:
+    def validate(self, ocr_result, certificate_type: str, bbox: List[int],
+                 image_path: Optional[str] = None, image: Optional[np.ndarray] = None) -> Dict:
         """
         校验证件结构
 
@@ -375,6 +2345,8 @@ class StructureValidator:
             ocr_result: OCR结果
             certificate_type: 证件类型
             bbox: 证件边界框
+            image_path: 图像路径（可选，提供时做字体和印章检测，模板匹配包含关键点验证）
+            image: 已解码的BGR图像（可选，提供时不再从 image_path 解码）
 
         Returns:
             校验结果字典
@@ -386,6 +2358,9 @@ class StructureValidator:
         }
 
         try:
+            # 文本框四边形 (N, 4, 2)，供布局、对齐和模板检查共用
+            polygons = extract_ocr_polygons(ocr_result)
+
             # 1. 检查文本框数量
             text_count_score = self._check_text_count(ocr_result, certificate_type)
             result['details']['text_count_score'] = text_count_score
@@ -393,19 +2368,67 @@ class StructureValidator:
                 result['issues'].append(f"文本框数量异常 (得分: {text_count_score:.2f})")
 
             # 2. 检查布局规范性
-            layout_score = self._check_layout(ocr_result, bbox)
+            layout_score = self._check_layout(polygons, bbox)
             result['details']['layout_score'] = layout_score
             if layout_score > 0.5:
                 result['issues'].append(f"布局不规范 (得分: {layout_score:.2f})")
 
             # 3. 检查文本对齐
-            alignment_score = self._check_alignment(ocr_result)
+            alignment_score, alignment_metrics = self._check_alignment(polygons)
             result['details']['alignment_score'] = alignment_score
+            result['details']['alignment_metrics'] = alignment_metrics
             if alignment_score > 0.5:
                 result['issues'].append(f"文本对齐异常 (得分: {alignment_score:.2f})")
 
+            scores = [text_count_score, layout_score, alignment_score]
+
+            # 解码一次：原分辨率灰度图供字体分析，1/2分辨率彩色图供印章检测和模板关键点匹配
+            full = image if image is not None else self._load_image(image_path)
+            image = None
+            if full is not None:
+                image = cv2.resize(full, (max(1, full.shape[1] // 2), max(1, full.shape[0] // 2)),
+                                   interpolation=cv2.INTER_AREA)
+
+                # 4. 逐行字体一致性
+                line_polygons, line_texts = extract_ocr_lines(ocr_result)
+                if len(line_polygons) > 0:
+                    font_result = self.font_analyzer.analyze(
+                        cv2.cvtColor(full, cv2.COLOR_BGR2GRAY), line_polygons, line_texts
+                    )
+                    if font_result['lines']:
+                        result['details']['font_score'] = font_result['score']
+                        result['details']['font_lines'] = font_result['lines']
+                        scores.append(font_result['score'])
+                        for line in font_result['lines']:
+                            if line['outlier']:
+                                result['issues'].append(
+                                    f"文本行字体与同类行不一致: {line['text']} "
+                                    f"(笔画宽度 {line['stroke_width']}, 字高 {line['glyph_height']})"
+                                )
+
+            # 5. 红色印章检测
+            if image is not None:
+                seal_result = self.seal_analyzer.analyze(image, bbox, image_scale=0.5)
+                result['details']['seal_score'] = seal_result['score']
+                result['details']['seals'] = seal_result['seals']
+                scores.append(seal_result['score'])
+                result['issues'].extend(seal_result['issues'])
+
+            # 6. 模板匹配（索引中有该类型模板时）
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image is not None else None
+            template_match = self._match_template(polygons, certificate_type, gray)
+            if template_match is not None:
+                template_score = template_match['score']
+                result['details']['template_score'] = template_score
+                result['details']['template_match'] = template_match
+                scores.append(template_score)
+                if template_score > 0.5:
+                    result['issues'].append(
+                        f"与最近模板 {template_match['template']['country']} 差异较大 (得分: {template_score:.2f})"
+                    )
+
             # 综合评分
-            result['structure_score'] = (text_count_score + layout_score + alignment_score) / 3
+            result['structure_score'] = sum(scores) / len(scores)
 
             if not result['issues']:
                 result['issues'].append("未检测到结构问题")
@@ -437,9 +2460,15 @@ class StructureValidator:
 
         return 0.0
 
-    def _check_layout(self, ocr_result, bbox: List[int]) -> float:
-        """检查布局"""
-        # 简化实现：检查文本是否分布在整个证书区域
+    def _check_layout(self, polygons: np.ndarray, bbox: List[int]) -> float:
+        """
+        检查布局
+
+        - 证件宽高比
+        - 文本框相互重叠（在原有文字上覆盖粘贴的文本框会与原框重叠）
+        """
+        score = 0.0
+
         try:
             if bbox and len(bbox) == 4:
                 x, y, w, h = bbox
@@ -447,36 +2476,463 @@ class StructureValidator:
 
                 # 证书通常是横向的，宽高比约在1.2-1.8之间
                 if aspect_ratio < 0.8 or aspect_ratio > 2.5:
-                    return 0.6
+                    score = 0.6
+
+            if len(polygons) >= 2:
+                # 轴对齐外接矩形的两两IoU
+                mins = polygons.min(axis=1)
+                maxs = polygons.max(axis=1)
+                inter = np.clip(np.minimum(maxs[:, None], maxs[None]) - np.maximum(mins[:, None], mins[None]), 0, None)
+                inter_area = inter[..., 0] * inter[..., 1]
+                area = np.prod(maxs - mins, axis=1)
+                iou = inter_area / np.maximum(area[:, None] + area[None] - inter_area, 1e-6)
+                np.fill_diagonal(iou, 0.0)
+
+                overlap_fraction = float(np.mean(iou.max(axis=1) > 0.3))
+                score = max(score, min(overlap_fraction / 0.1, 1.0))
         except:
             pass
 
-        return 0.0
+        return score
 
-    def _check_alignment(self, ocr_result) -> float:
-        """检查文本对齐"""
-        # 简化实现
-        return 0.0
+    def _load_image(self, image_path: Optional[str]) -> Optional[np.ndarray]:
+        """解码图像，PDF或失败时返回None"""
+        if not image_path or str(image_path).lower().endswith('.pdf'):
+            return None
+        try:
+            with open(image_path, 'rb') as f:
+                return cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+        except Exception as e:
+            print(f"图像读取错误: {str(e)}")
+            return None
+
+    def _match_template(self, polygons: np.ndarray, cert_type: str, gray: Optional[np.ndarray]) -> Optional[Dict]:
+        """与模板索引中同类型证件的最近模板比对"""
+        if len(self.template_index) == 0:
+            return None
+
+        try:
+            return self.template_index.match(cert_type, polygons, gray)
+        except Exception as e:
+            print(f"模板匹配错误: {str(e)}")
+            return None
+
+    def _check_alignment(self, polygons: np.ndarray) -> Tuple[float, Dict]:
+        """
+        检查文本对齐
+
+        在 (N, 4, 2) 文本框数组上向量化计算四项指标，每项为离群文本框所占比例：
+        - left_edge: 左边缘接近某一列却未对齐（粘贴行常有几个像素的错位）
+        - baseline: 同一行内基线偏离行均值
+        - line_height: 行高偏离文档主体行高
+        - skew: 倾斜角偏离文档主体倾斜角
+
+        文本框顶点顺序为 左上、右上、右下、左下（PaddleOCR输出顺序）。
+
+        Returns:
+            (对齐得分, 各项离群比例及离群文本框序号 outlier_boxes)
+        """
+        metrics = {}
+        if len(polygons) < ALIGNMENT_CONFIG['min_boxes']:
+            return 0.0, metrics
+
+        try:
+            tl, tr, br, bl = polygons[:, 0], polygons[:, 1], polygons[:, 2], polygons[:, 3]
+
+            left = (tl[:, 0] + bl[:, 0]) / 2
+            baseline = (bl[:, 1] + br[:, 1]) / 2
+            center_y = polygons[:, :, 1].mean(axis=1)
+            height = (np.linalg.norm(bl - tl, axis=1) + np.linalg.norm(br - tr, axis=1)) / 2
+            width = (np.linalg.norm(tr - tl, axis=1) + np.linalg.norm(br - bl, axis=1)) / 2
+            angle = np.degrees(np.arctan2(tr[:, 1] - tl[:, 1], tr[:, 0] - tl[:, 0]))
+
+            median_height = max(float(np.median(height)), 1.0)
+
+            outliers = np.zeros(len(polygons), dtype=bool)
+
+            # 1. 行高一致性
+            height_outlier = np.abs(height - median_height) > ALIGNMENT_CONFIG['height_tolerance'] * median_height
+            metrics['line_height'] = float(np.mean(height_outlier))
+            outliers |= height_outlier
+
+            # 2. 倾斜角一致性（只统计足够长的文本行，短框的角度估计不可靠）
+            long_lines = width > 2 * height
+            if long_lines.sum() >= 3:
+                line_angle = angle[long_lines]
+                skew_outlier = np.abs(angle - np.median(line_angle)) > ALIGNMENT_CONFIG['skew_tolerance']
+                skew_outlier &= long_lines
+                metrics['skew'] = float(skew_outlier.sum() / long_lines.sum())
+                metrics['skew_std'] = float(np.std(line_angle))
+                outliers |= skew_outlier
+            else:
+                metrics['skew'] = 0.0
+
+            # 3. 行内基线一致性：按中心y排序，间隔超过半个行高则开始新行
+            order = np.argsort(center_y)
+            row_break = np.diff(center_y[order]) > 0.5 * median_height
+            rows = np.empty(len(order), dtype=np.int64)
+            rows[order] = np.concatenate([[0], np.cumsum(row_break)])
+
+            row_size = np.bincount(rows)
+            row_mean = np.bincount(rows, weights=baseline) / row_size
+            in_multi_box_row = row_size[rows] >= 2
+            baseline_dev = np.abs(baseline - row_mean[rows]) / median_height
+            if in_multi_box_row.any():
+                baseline_outlier = in_multi_box_row & (baseline_dev > ALIGNMENT_CONFIG['baseline_tolerance'])
+                metrics['baseline'] = float(baseline_outlier.sum() / in_multi_box_row.sum())
+                outliers |= baseline_outlier
+            else:
+                metrics['baseline'] = 0.0
+
+            # 4. 左边缘聚类：容差内相邻的左边缘归为一列，至少3个文本框才算一列
+            tolerance = ALIGNMENT_CONFIG['edge_tolerance'] * median_height
+            sorted_left = np.sort(left)
+            cluster = np.concatenate([[0], np.cumsum(np.diff(sorted_left) > tolerance)])
+            cluster_size = np.bincount(cluster)
+            cluster_center = np.bincount(cluster, weights=sorted_left) / cluster_size
+            columns = cluster_center[cluster_size >= 3]
+
+            if len(columns) > 0:
+                distance = np.abs(left[:, None] - columns[None, :]).min(axis=1)
+                # 接近某一列（一个行高以内）但又超出对齐容差
+                near_miss = (distance > tolerance) & (distance < median_height)
+                metrics['left_edge'] = float(np.mean(near_miss))
+                outliers |= near_miss
+            else:
+                metrics['left_edge'] = 0.0
+
+            outlier_fraction = max(metrics['left_edge'], metrics['baseline'],
+                                   metrics['line_height'], metrics['skew'])
+            score = min(outlier_fraction / ALIGNMENT_CONFIG['max_outlier_fraction'], 1.0)
+            metrics['outlier_boxes'] = np.nonzero(outliers)[0].tolist()
+
+            return score, metrics
+
+        except Exception as e:
+            print(f"文本对齐检查错误: {str(e)}")
+            return 0.0, metrics
+
+
+class MetadataAnalyzer:
+    """元数据与来源分析器
+
+    直接从文件字节读取EXIF/XMP（JPEG的APP1段、PNG的文本块）和PDF文档信息
+    （PyMuPDF只读取元数据，不渲染页面），检查编辑软件签名和时间戳矛盾。
+    不解码像素，可在OCR之前执行，单次耗时在毫秒以内。
+    """
+
+    # 关心的EXIF标签
+    EXIF_TAGS = {
+        0x010F: 'make',
+        0x0110: 'model',
+        0x0131: 'software',
+        0x0132: 'modify_date',
+        0x9003: 'original_date',
+        0x9004: 'digitized_date',
+    }
+    EXIF_IFD_POINTER = 0x8769
+
+    # XMP属性 -> 字段名
+    XMP_FIELDS = {
+        'xmp:CreatorTool': 'creator_tool',
+        'xmp:CreateDate': 'create_date',
+        'xmp:ModifyDate': 'modify_date',
+        'xmp:MetadataDate': 'metadata_date',
+        'pdf:Producer': 'producer',
+    }
+
+    # PNG文本块关键字 -> 字段名
+    PNG_KEYWORDS = {
+        'Software': 'software',
+        'Creation Time': 'create_date',
+        'Author': 'author',
+    }
+
+    # 参与签名检查的字段（软件/工具名称）
+    SOFTWARE_FIELDS = ('software', 'creator_tool', 'producer', 'creator', 'history_agents')
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        初始化元数据分析器
+
+        Args:
+            config: 分析配置，默认使用 config.METADATA_CONFIG
+        """
+        self.config = dict(METADATA_CONFIG)
+        if config:
+            self.config.update(config)
+        self.signatures = [sig.lower() for sig in self.config['editor_signatures']]
+
+    def analyze(self, data: bytes) -> Dict:
+        """
+        分析文件元数据
+
+        Args:
+            data: 上传文件的原始字节
+
+        Returns:
+            分析结果字典：
+            - score: 元数据可疑度(0-1)
+            - format: jpeg / png / pdf / unknown
+            - fields: 提取到的元数据字段
+            - flags: 命中的可疑项 [{'flag', 'detail'}]
+            - issues: 可读的问题描述
+        """
+        result = {
+            'score': 0.0,
+            'format': 'unknown',
+            'fields': {},
+            'flags': [],
+            'issues': []
+        }
+
+        try:
+            if data[:2] == b'\xff\xd8':
+                result['format'] = 'jpeg'
+                fields = self._read_jpeg(data)
+            elif data[:8] == b'\x89PNG\r\n\x1a\n':
+                result['format'] = 'png'
+                fields = self._read_png(data)
+            elif data[:5] == b'%PDF-':
+                result['format'] = 'pdf'
+                fields = self._read_pdf(data)
+            else:
+                return result
+        except Exception as e:
+            result['issues'].append(f"元数据解析错误: {str(e)}")
+            return result
+
+        result['fields'] = fields
+        flags = self._check_software(fields) + self._check_timestamps(fields)
+        if result['format'] == 'pdf' and data.count(b'%%EOF') > 1:
+            flags.append({'flag': 'incremental_update', 'detail': f"PDF经过 {data.count(b'%%EOF') - 1} 次增量保存"})
+
+        weights = self.config['flag_weights']
+        result['flags'] = flags
+        result['issues'] = [flag['detail'] for flag in flags]
+        result['score'] = float(min(sum(weights.get(flag['flag'], 0.0) for flag in flags), 1.0))
+
+        return result
+
+    def _read_jpeg(self, data: bytes) -> Dict:
+        """读取JPEG APP1段中的EXIF和XMP"""
+        fields = {}
+        for marker, segment in iter_jpeg_segments(data):
+            if marker != 0xE1:
+                continue
+            if segment.startswith(b'Exif\x00\x00'):
+                fields.update(self._read_exif(segment[6:]))
+            elif segment.startswith(b'http://ns.adobe.com/xap/1.0/\x00'):
+                fields.update(self._read_xmp(segment[29:]))
+        return fields
+
+    def _read_png(self, data: bytes) -> Dict:
+        """读取PNG文本块（tEXt/zTXt/iTXt）和eXIf块，遇到IDAT即停止"""
+        fields = {}
+        i = 8
+        while i + 8 <= len(data):
+            length, kind = struct.unpack('>I4s', data[i:i + 8])
+            chunk = data[i + 8:i + 8 + length]
+            i += 12 + length
+
+            if kind == b'IDAT' or kind == b'IEND':
+                break
+            if kind == b'eXIf':
+                fields.update(self._read_exif(chunk))
+                continue
+            if kind not in (b'tEXt', b'zTXt', b'iTXt'):
+                continue
+
+            keyword, _, text = chunk.partition(b'\x00')
+            if kind == b'zTXt':
+                text = zlib.decompress(text[1:])
+            elif kind == b'iTXt':
+                compressed = text[:1] == b'\x01'
+                text = text[2:].split(b'\x00', 2)[-1]
+                if compressed:
+                    text = zlib.decompress(text)
+
+            keyword = keyword.decode('latin-1')
+            if keyword == 'XML:com.adobe.xmp':
+                fields.update(self._read_xmp(text))
+            elif keyword in self.PNG_KEYWORDS:
+                fields[self.PNG_KEYWORDS[keyword]] = text.decode('utf-8', 'replace').strip()
+        return fields
+
+    def _read_pdf(self, data: bytes) -> Dict:
+        """读取PDF文档信息字典和XMP（不渲染页面）"""
+        fields = {}
+        try:
+            import fitz  # PyMuPDF
+        except ImportError:
+            print("错误: 需要安装 PyMuPDF 库来读取PDF元数据")
+            return fields
+
+        with PDF_LOCK:
+            doc = fitz.open(stream=data, filetype='pdf')
+            try:
+                metadata = doc.metadata or {}
+                for key, name in (('producer', 'producer'), ('creator', 'creator'),
+                                  ('creationDate', 'create_date'), ('modDate', 'modify_date')):
+                    if metadata.get(key):
+                        fields[name] = metadata[key]
+                xmp = doc.get_xml_metadata()
+            finally:
+                doc.close()
+        if xmp:
+            for key, value in self._read_xmp(xmp.encode('utf-8')).items():
+                fields.setdefault(key, value)
+        return fields
+
+    def _read_exif(self, tiff: bytes) -> Dict:
+        """解析EXIF TIFF结构中IFD0和Exif子IFD的ASCII标签"""
+        fields = {}
+        if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+            return fields
+        order = '<' if tiff[:2] == b'II' else '>'
+
+        pending = [struct.unpack(order + 'I', tiff[4:8])[0]]
+        visited = set()
+        while pending:
+            offset = pending.pop()
+            if offset in visited or offset + 2 > len(tiff):
+                continue
+            visited.add(offset)
+
+            count = struct.unpack(order + 'H', tiff[offset:offset + 2])[0]
+            for k in range(count):
+                entry = tiff[offset + 2 + 12 * k:offset + 14 + 12 * k]
+                if len(entry) < 12:
+                    break
+                tag, kind, length = struct.unpack(order + 'HHI', entry[:8])
+                if tag == self.EXIF_IFD_POINTER:
+                    pending.append(struct.unpack(order + 'I', entry[8:12])[0])
+                elif tag in self.EXIF_TAGS and kind == 2:
+                    if length <= 4:
+                        raw = entry[8:8 + length]
+                    else:
+                        start = struct.unpack(order + 'I', entry[8:12])[0]
+                        raw = tiff[start:start + length]
+                    fields[self.EXIF_TAGS[tag]] = raw.split(b'\x00', 1)[0].decode('latin-1').strip()
+        return fields
+
+    def _read_xmp(self, xml: bytes) -> Dict:
+        """用正则从XMP包中取出创建工具、时间戳和编辑历史（属性和元素两种写法）"""
+        text = xml.decode('utf-8', 'replace')
+        fields = {}
+        for key, name in self.XMP_FIELDS.items():
+            match = re.search(rf'{key}\s*=\s*"([^"]*)"|<{key}>([^<]*)</{key}>', text)
+            if match:
+                fields[name] = (match.group(1) or match.group(2) or '').strip()
+
+        agents = re.findall(r'stEvt:softwareAgent\s*=\s*"([^"]*)"|<stEvt:softwareAgent>([^<]*)<', text)
+        agents = [a or b for a, b in agents if a or b]
+        if agents:
+            fields['history_agents'] = '; '.join(dict.fromkeys(agents))
+        return fields
+
+    def _check_software(self, fields: Dict) -> List[Dict]:
+        """检查软件/工具字段中的编辑软件签名"""
+        flags = []
+        for name in self.SOFTWARE_FIELDS:
+            value = fields.get(name)
+            if not value:
+                continue
+            lowered = value.lower()
+            hits = [sig for sig in self.signatures if sig in lowered]
+            if hits:
+                flags.append({'flag': 'editor_software', 'detail': f"{name} 含编辑软件签名: {value}"})
+                break
+        return flags
+
+    def _check_timestamps(self, fields: Dict) -> List[Dict]:
+        """检查创建/修改时间的先后关系和未来时间"""
+        created = [t for t in (self.parse_timestamp(fields.get(k)) for k in
+                               ('original_date', 'digitized_date', 'create_date')) if t]
+        modified = [t for t in (self.parse_timestamp(fields.get(k)) for k in
+                                ('modify_date', 'metadata_date')) if t]
+        flags = []
+
+        if created and modified:
+            first, last = min(created), max(modified)
+            gap = timedelta(hours=self.config['modification_gap_hours'])
+            if last < first - gap:
+                flags.append({'flag': 'timestamp_order',
+                              'detail': f"修改时间 {last} 早于创建时间 {first}"})
+            elif last - first > gap:
+                flags.append({'flag': 'modified_after_creation',
+                              'detail': f"创建 {first} 后于 {last} 被再次修改"})
+
+        future = datetime.now() + timedelta(days=1)
+        if any(t > future for t in created + modified):
+            flags.append({'flag': 'future_timestamp', 'detail': "元数据时间戳晚于当前时间"})
+
+        return flags
+
+    @staticmethod
+    def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+        """
+        解析EXIF(2020:01:02 10:00:00)、XMP(ISO 8601)和PDF(D:20200102100000)时间戳
+
+        时区信息被忽略，返回不带时区的本地时间。
+        """
+        if not value:
+            return None
+        match = re.search(r'(\d{4})[:\-]?(\d{2})[:\-]?(\d{2})(?:[T ]?(\d{2}):?(\d{2})(?::?(\d{2}))?)?', value)
+        if not match:
+            return None
+        try:
+            return datetime(*(int(part) if part else 0 for part in match.groups()))
+        except ValueError:
+            return None
 
 
 class ForgeryDetectionSystem:
-    """证件鉴伪系统主类"""
+    """证件鉴伪系统主类
+
+    各分析器按测得的耗时从低到高依次执行。每完成一个分析器，已知得分给出综合评分的下界，
+    加上剩余分析器权重得到上界；上下界落在同一风险等级时，剩余分析器已无法改变结论，
+    直接跳过。图像层内部因截止时间跳过子分析器时，图像得分本身也是一个范围，按其上下界计入。
+    """
 
     def __init__(self):
         """初始化鉴伪系统"""
-        self.image_detector = ImageForgeryDetector()
+        # 模板索引只加载一次，图像检测（背景频谱）和结构校验（布局/关键点）共用
+        template_index = TemplateIndex.load(TEMPLATE_INDEX_PATH)
+        self.image_detector = ImageForgeryDetector(template_index=template_index)
         self.text_checker = TextConsistencyChecker()
-        self.structure_validator = StructureValidator()
+        self.structure_validator = StructureValidator(template_index=template_index)
+        self.metadata_analyzer = MetadataAnalyzer()
 
         # 特征融合权重
         self.weights = {
-            'image': 0.4,
-            'text': 0.35,
-            'structure': 0.25
+            'image': 0.35,
+            'text': 0.3,
+            'structure': 0.2,
+            'metadata': 0.15
         }
 
+        # 各分析器耗时的指数滑动平均（秒），以配置中的先验值起步
+        self.analyzer_costs = dict(SCHEDULER_CONFIG['cost_priors'])
+        self._cost_lock = threading.Lock()
+
+    def inspect_metadata(self, image_path: str) -> Dict:
+        """
+        读取文件元数据并分析来源（不解码图像，可在OCR之前调用）
+
+        Args:
+            image_path: 上传文件路径
+
+        Returns:
+            MetadataAnalyzer.analyze 的结果
+        """
+        with open(image_path, 'rb') as f:
+            return self.metadata_analyzer.analyze(f.read())
+
     def detect(self, image_path: str, ocr_result, ocr_text: str,
-               extracted_fields: Dict, certificate_type: str, bbox: List[int]) -> Dict:
+               extracted_fields: Dict, certificate_type: str, bbox: List[int],
+               metadata: Optional[Dict] = None, image: Optional[np.ndarray] = None,
+               deadline: Optional[Deadline] = None) -> Dict:
         """
         综合检测证件真伪
 
@@ -487,6 +2943,10 @@ class ForgeryDetectionSystem:
             extracted_fields: 提取的字段
             certificate_type: 证件类型
             bbox: 边界框
+            metadata: OCR之前由 inspect_metadata 得到的元数据结果，None 时在此读取
+            image: 已解码的BGR图像（可选，图像层和结构层共用，不再从文件解码）
+            deadline: 请求截止时间（可选），剩余时间不足时图像层跳过可选分析器，
+                      已过期时不再运行剩余的分析器，结果标记为 degraded
 
         Returns:
             检测结果字典
@@ -494,55 +2954,179 @@ class ForgeryDetectionSystem:
         result = {
             'forgery_risk': 'genuine',
             'forgery_score': 0.0,
+            'score_bounds': [0.0, 1.0],
+            'score_complete': False,
+            'risk_determined': False,
             'image_score': 0.0,
+            'image_score_bounds': None,
             'text_score': 0.0,
             'structure_score': 0.0,
+            'metadata_score': 0.0,
             'image_analysis': '',
             'text_analysis': '',
             'structure_analysis': '',
+            'metadata_analysis': '',
+            'metadata': None,
+            'image_localization': None,
+            'seal_regions': [],
+            'analyzer_order': [],
+            'skipped_analyzers': [],
+            'degraded': False,
+            'degraded_analyzers': [],
             'recommendation': ''
         }
 
-        try:
+        runners = {
             # 1. 图像层面检测
-            image_result = self.image_detector.detect(image_path)
-            result['image_score'] = image_result['forgery_score']
-            result['image_analysis'] = '\n'.join(image_result['analysis'])
-
+            'image': lambda: self._run_image(result, image_path, certificate_type, image, deadline),
             # 2. 文本层面检测
-            text_result = self.text_checker.check(ocr_text, extracted_fields, certificate_type)
-            result['text_score'] = text_result['consistency_score']
-            result['text_analysis'] = '\n'.join(text_result['issues'])
-
+            'text': lambda: self._run_text(result, ocr_text, extracted_fields, certificate_type),
             # 3. 结构层面检测
-            structure_result = self.structure_validator.validate(ocr_result, certificate_type, bbox)
-            result['structure_score'] = structure_result['structure_score']
-            result['structure_analysis'] = '\n'.join(structure_result['issues'])
-
-            # 4. 特征融合
-            final_score = (
-                result['image_score'] * self.weights['image'] +
-                result['text_score'] * self.weights['text'] +
-                result['structure_score'] * self.weights['structure']
-            )
-            result['forgery_score'] = final_score
-
-            # 5. 风险等级判定
-            if final_score < 0.5:
-                result['forgery_risk'] = 'genuine'
-                result['recommendation'] = '证件真实性较高，建议通过'
-            elif final_score < 0.8:
-                result['forgery_risk'] = 'suspicious'
-                result['recommendation'] = '证件存在可疑特征，建议人工复核'
+            'structure': lambda: self._run_structure(result, ocr_result, certificate_type, bbox, image_path, image),
+            # 4. 元数据与来源检测
+            'metadata': lambda: self._run_metadata(result, image_path, metadata),
+        }
+
+        try:
+            # 5. 按耗时从低到高调度，特征融合
+            order = self._schedule()
+            result['analyzer_order'] = order
+
+            # known 为已完成分析器的加权得分；lower/upper 为其下界/上界（图像层跳过子分析器时不相等）
+            # remaining 为未完成分析器的权重和，每步对剩余分析器重新求和（累减的浮点误差会让恰好落在阈值上的
+            # 上界被判入低一级的风险等级）
+            known = lower = upper = completed = 0.0
+            remaining = sum(self.weights[name] for name in order)
+
+            for position, name in enumerate(order):
+                if deadline is not None and deadline.expired():
+                    for skipped in order[position:]:
+                        result['skipped_analyzers'].append({'analyzer': skipped, 'reason': '已超过请求截止时间'})
+                        result['degraded_analyzers'].append({'analyzer': skipped, 'reason': '已超过请求截止时间'})
+                        result[f'{skipped}_analysis'] = '已跳过（超过请求截止时间）'
+                    break
+
+                start = time.perf_counter()
+                score = runners[name]()
+                self._record_cost(name, time.perf_counter() - start)
+
+                score_lower, score_upper = result.get(f'{name}_score_bounds') or (score, score)
+                known += score * self.weights[name]
+                lower += score_lower * self.weights[name]
+                upper += score_upper * self.weights[name]
+                completed += self.weights[name]
+
+                pending = order[position + 1:]
+                remaining = sum(self.weights[skipped] for skipped in pending)
+                if pending and SCHEDULER_CONFIG['early_termination'] and \
+                        self._risk_band(lower) == self._risk_band(upper + remaining):
+                    band = self._risk_band(lower)
+                    for skipped in pending:
+                        result['skipped_analyzers'].append({
+                            'analyzer': skipped,
+                            'reason': f"已完成分析器确定综合评分在 [{lower:.3f}, {upper + remaining:.3f}] 内，"
+                                      f"风险等级 {band} 不受剩余分析器影响"
+                        })
+                        result[f'{skipped}_analysis'] = '已跳过（不影响风险等级）'
+                    break
+
+            # score_bounds 为跳过的分析器（含图像层跳过的子分析器）得分按0/按1计时综合评分的下界/上界；
+            # forgery_score 为点估计：跳过的分析器按已完成分析器的加权平均分计，始终落在 score_bounds 内
+            result['degraded'] = bool(result['degraded_analyzers'])
+            estimate = known / completed if completed > 0 else 0.5
+            result['forgery_score'] = known + remaining * estimate
+            result['score_bounds'] = [lower, upper + remaining]
+            result['score_complete'] = remaining == 0.0 and not result['degraded']
+
+            # 6. 风险等级判定：上下界落在同一等级时等级已确定；否则（截止时间到达时跳过了分析器）
+            # 不能按点估计或下界给出"建议通过"，至少判为疑似，转人工复核
+            lower_band, upper_band = self._risk_band(lower), self._risk_band(upper + remaining)
+            result['risk_determined'] = lower_band == upper_band
+            if result['risk_determined']:
+                result['forgery_risk'] = lower_band
             else:
-                result['forgery_risk'] = 'forged'
-                result['recommendation'] = '证件伪造风险高，建议拒绝'
+                result['forgery_risk'] = max(self._risk_band(result['forgery_score']), 'suspicious',
+                                             key=RISK_LEVELS.index)
+            result['recommendation'] = {
+                'genuine': '证件真实性较高，建议通过',
+                'suspicious': '证件存在可疑特征，建议人工复核',
+                'forged': '证件伪造风险高，建议拒绝'
+            }[result['forgery_risk']]
+            if not result['risk_determined']:
+                result['recommendation'] = (f"部分分析因请求时间不足被跳过，综合评分在 "
+                                            f"[{lower:.2f}, {upper + remaining:.2f}] 内，无法确定风险等级，建议人工复核")
+            elif result['degraded']:
+                result['recommendation'] += '（部分分析因请求时间不足被跳过，结果已降级）'
 
         except Exception as e:
             result['recommendation'] = f'检测过程出错: {str(e)}'
 
         return result
 
+    def _run_image(self, result: Dict, image_path: str, certificate_type: str,
+                   image: Optional[np.ndarray] = None, deadline: Optional[Deadline] = None) -> float:
+        """图像层面检测，写入结果并返回得分"""
+        image_result = self.image_detector.detect(image_path, certificate_type, image, deadline)
+        result['degraded_analyzers'].extend(
+            {'analyzer': f"image.{item['analyzer']}", 'reason': item['reason']} for item in image_result['skipped']
+        )
+        result['image_score'] = image_result['forgery_score']
+        result['image_score_bounds'] = image_result['score_bounds']
+        result['image_analysis'] = '\n'.join(image_result['analysis'])
+        result['image_localization'] = image_result.get('localization')
+        return result['image_score']
+
+    def _run_text(self, result: Dict, ocr_text: str, extracted_fields: Dict, certificate_type: str) -> float:
+        """文本层面检测，写入结果并返回得分"""
+        text_result = self.text_checker.check(ocr_text, extracted_fields, certificate_type)
+        result['text_score'] = text_result['consistency_score']
+        result['text_analysis'] = '\n'.join(text_result['issues'])
+        return result['text_score']
+
+    def _run_structure(self, result: Dict, ocr_result, certificate_type: str,
+                       bbox: List[int], image_path: str, image: Optional[np.ndarray] = None) -> float:
+        """结构层面检测，写入结果并返回得分"""
+        structure_result = self.structure_validator.validate(ocr_result, certificate_type, bbox, image_path, image)
+        result['structure_score'] = structure_result['structure_score']
+        result['structure_analysis'] = '\n'.join(structure_result['issues'])
+        result['seal_regions'] = structure_result['details'].get('seals', [])
+        return result['structure_score']
+
+    def _run_metadata(self, result: Dict, image_path: str, metadata: Optional[Dict]) -> float:
+        """元数据检测，写入结果并返回得分"""
+        if metadata is None:
+            metadata = self.inspect_metadata(image_path)
+        result['metadata_score'] = metadata['score']
+        result['metadata_analysis'] = '\n'.join(metadata['issues']) or '未发现元数据异常'
+        result['metadata'] = {
+            'format': metadata['format'],
+            'fields': metadata['fields'],
+            'flags': metadata['flags']
+        }
+        return result['metadata_score']
+
+    def _schedule(self) -> List[str]:
+        """按测得耗时从低到高排列分析器，耗时相同时权重大的优先"""
+        with self._cost_lock:
+            costs = dict(self.analyzer_costs)
+        return sorted(self.weights, key=lambda name: (costs.get(name, 0.0), -self.weights[name]))
+
+    def _record_cost(self, name: str, elapsed: float):
+        """更新分析器耗时的指数滑动平均"""
+        alpha = SCHEDULER_CONFIG['cost_ema_alpha']
+        with self._cost_lock:
+            previous = self.analyzer_costs.get(name)
+            self.analyzer_costs[name] = elapsed if previous is None else (1 - alpha) * previous + alpha * elapsed
+
+    @staticmethod
+    def _risk_band(score: float) -> str:
+        """综合评分对应的风险等级"""
+        if score < FORGERY_THRESHOLDS['genuine']:
+            return 'genuine'
+        elif score < FORGERY_THRESHOLDS['suspicious']:
+            return 'suspicious'
+        return 'forged'
+
 
 if __name__ == '__main__':
     # 设置控制台编码
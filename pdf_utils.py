@@ -0,0 +1,9 @@
+"""
+PDF 处理公共设施
+PyMuPDF（fitz）不支持多线程并发调用，推理进程内多个请求线程（证件检测的PDF转图像、元数据分析的
+PDF信息读取）的 fitz 调用通过 PDF_LOCK 串行执行。
+"""
+import threading
+
+
+PDF_LOCK = threading.Lock()
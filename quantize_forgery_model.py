@@ -0,0 +1,269 @@
+"""
+鉴伪CNN模型INT8量化工具
+- dynamic: 全连接层动态量化（推理时直接由 ImageForgeryDetector 完成，此处仅评估）
+- static: 卷积层和全连接层静态量化，使用 books/ 中的证件图像块校准并导出TorchScript
+并在带标注的样本集上报告量化模型相对浮点模型的精度漂移
+"""
+import sys
+import copy
+import io
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+
+from module3_forgery import ImageForgeryDetector, QuantizableForgeryNet, select_quantized_engine
+from export_forgery_model import load_eager_model
+from config import CNN_MODEL_PATH, CNN_QUANTIZED_PATH, CNN_INFERENCE_CONFIG, BOOKS_DIR
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+def read_image(path) -> Optional[np.ndarray]:
+    """读取图像 - 使用numpy方式处理中文路径"""
+    with open(path, 'rb') as f:
+        return cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+
+
+def sample_calibration_patches(detector: ImageForgeryDetector, image_dir, max_images: int,
+                               max_patches: int, seed: int = 0) -> np.ndarray:
+    """
+    从证件目录中随机抽取校准用图像块
+
+    Args:
+        detector: 用于切分图像块的检测器
+        image_dir: 图像目录（递归查找）
+        max_images: 最多使用的图像数
+        max_patches: 最多返回的图像块数
+        seed: 随机种子
+
+    Returns:
+        图像块数组 (N, 3, P, P) uint8
+    """
+    rng = np.random.default_rng(seed)
+    paths = sorted(p for p in Path(image_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+    if len(paths) > max_images:
+        paths = [paths[i] for i in sorted(rng.choice(len(paths), max_images, replace=False))]
+
+    per_image = max(1, max_patches // max(len(paths), 1))
+    samples = []
+    for path in paths:
+        image = read_image(path)
+        if image is None:
+            continue
+        patches, _ = detector._extract_patches(image)
+        if len(patches) > per_image:
+            patches = patches[rng.choice(len(patches), per_image, replace=False)]
+        samples.append(patches)
+
+    if not samples:
+        return np.empty((0, 3, detector.inference_config['patch_size'],
+                         detector.inference_config['patch_size']), dtype=np.uint8)
+    return np.concatenate(samples)[:max_patches]
+
+
+def quantize_static(model: nn.Module, calibration: np.ndarray, batch_size: int) -> nn.Module:
+    """
+    静态INT8量化：融合层、插入观察器、用校准图像块统计激活范围后转换
+
+    Args:
+        model: eval模式的浮点模型
+        calibration: 校准图像块 (N, 3, P, P) uint8
+        batch_size: 校准批大小
+
+    Returns:
+        量化后的模型
+    """
+    engine = select_quantized_engine()
+    quantizable = QuantizableForgeryNet(copy.deepcopy(model)).eval()
+    torch.ao.quantization.fuse_modules(quantizable.model, getattr(model, 'fuse_patterns', []),
+                                       inplace=True)
+    quantizable.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+    torch.ao.quantization.prepare(quantizable, inplace=True)
+
+    with torch.inference_mode():
+        for start in range(0, len(calibration), batch_size):
+            quantizable(torch.from_numpy(calibration[start:start + batch_size]).float().div_(255.0))
+
+    return torch.ao.quantization.convert(quantizable, inplace=False)
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    """动态INT8量化：仅全连接层，权重离线量化、激活在推理时量化"""
+    select_quantized_engine()
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized(model: nn.Module, output_path, patch_size: int) -> Path:
+    """将量化模型导出为冻结的 TorchScript，ImageForgeryDetector 以 quantization='static' 加载"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    example = torch.rand(1, 3, patch_size, patch_size)
+    traced = torch.jit.freeze(torch.jit.trace(model.eval(), example))
+    traced.save(str(output_path))
+
+    return output_path
+
+
+def model_size_mb(model: nn.Module) -> float:
+    """序列化后的模型大小（MB）"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1024 / 1024
+
+
+def load_labeled_set(label_file) -> List[Tuple[str, int]]:
+    """
+    读取标注样本列表
+
+    每行格式: <图像路径> <标签>，标签 0 表示真实、1 表示伪造；路径可包含空格。
+    """
+    samples = []
+    with open(label_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            path, label = line.rsplit(maxsplit=1)
+            samples.append((path, int(label)))
+    return samples
+
+
+def evaluate_drift(float_detector: ImageForgeryDetector, quantized_detector: ImageForgeryDetector,
+                   samples: List[Tuple[str, Optional[int]]]) -> Dict:
+    """
+    比较浮点模型与量化模型的图像块概率、图像得分和判定结果
+
+    Args:
+        float_detector: 浮点模型检测器
+        quantized_detector: 量化模型检测器
+        samples: [(图像路径, 标签或None)]
+
+    Returns:
+        漂移报告字典
+    """
+    patch_diffs = []
+    float_scores, quant_scores, labels = [], [], []
+    float_time = quant_time = 0.0
+    n_patches = 0
+
+    for path, label in samples:
+        image = read_image(path)
+        if image is None:
+            continue
+
+        patches, _ = float_detector._extract_patches(image)
+        if len(patches) == 0:
+            continue
+        n_patches += len(patches)
+
+        start = time.perf_counter()
+        float_probs = float_detector._predict_patches(patches)
+        float_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        quant_probs = quantized_detector._predict_patches(patches)
+        quant_time += time.perf_counter() - start
+
+        patch_diffs.append(np.abs(float_probs - quant_probs))
+        top_k = max(1, int(np.ceil(len(float_probs) * float_detector.inference_config['top_ratio'])))
+        float_scores.append(float(np.mean(np.sort(float_probs)[-top_k:])))
+        quant_scores.append(float(np.mean(np.sort(quant_probs)[-top_k:])))
+        labels.append(label)
+
+    if not patch_diffs:
+        return {'images': 0}
+
+    diffs = np.concatenate(patch_diffs)
+    float_pred = np.array(float_scores) > 0.5
+    quant_pred = np.array(quant_scores) > 0.5
+
+    report = {
+        'images': len(float_scores),
+        'patches': n_patches,
+        'patch_mae': float(np.mean(diffs)),
+        'patch_max_abs_diff': float(np.max(diffs)),
+        'score_mae': float(np.mean(np.abs(np.array(float_scores) - np.array(quant_scores)))),
+        'decision_agreement': float(np.mean(float_pred == quant_pred)),
+        'float_ms_per_patch': float_time * 1000 / n_patches,
+        'quantized_ms_per_patch': quant_time * 1000 / n_patches,
+    }
+
+    if all(label is not None for label in labels):
+        truth = np.array(labels) == 1
+        report['float_accuracy'] = float(np.mean(float_pred == truth))
+        report['quantized_accuracy'] = float(np.mean(quant_pred == truth))
+
+    return report
+
+
+if __name__ == '__main__':
+    # 设置控制台编码
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='鉴伪CNN模型INT8量化工具')
+    parser.add_argument('--mode', choices=['dynamic', 'static'], default='static', help='量化方式')
+    parser.add_argument('--weights', default=str(CNN_MODEL_PATH), help='浮点模型权重路径')
+    parser.add_argument('--output', default=str(CNN_QUANTIZED_PATH), help='静态量化模型输出路径')
+    parser.add_argument('--calibration-dir', default=str(BOOKS_DIR), help='校准图像目录')
+    parser.add_argument('--calibration-images', type=int, default=32, help='校准使用的图像数')
+    parser.add_argument('--calibration-patches', type=int, default=2048, help='校准使用的图像块数')
+    parser.add_argument('--labels', help='标注样本列表文件（每行: 图像路径 标签），用于评估精度漂移')
+
+    args = parser.parse_args()
+    config = CNN_INFERENCE_CONFIG
+    patch_size = config['patch_size']
+
+    print("="*80)
+    print(f"鉴伪CNN模型INT8量化 ({args.mode})")
+    print("="*80)
+
+    try:
+        float_model = load_eager_model(config['architecture'], args.weights)
+    except FileNotFoundError as e:
+        print(f"\n✗ {str(e)}")
+        sys.exit(1)
+
+    float_detector = ImageForgeryDetector(model_path=args.weights,
+                                          inference_config={'backend': 'torch', 'quantization': None})
+
+    if args.mode == 'static':
+        calibration = sample_calibration_patches(float_detector, args.calibration_dir,
+                                                 args.calibration_images, args.calibration_patches)
+        if len(calibration) == 0:
+            print(f"\n✗ 校准目录中没有可用图像: {args.calibration_dir}")
+            sys.exit(1)
+        print(f"校准图像块: {len(calibration)}")
+
+        quantized_model = quantize_static(float_model, calibration, config['batch_size'])
+        path = save_quantized(quantized_model, args.output, patch_size)
+        print(f"✓ 静态量化模型: {path}")
+        print("  设置 CNN_QUANTIZATION=static 启用")
+    else:
+        quantized_model = quantize_dynamic(float_model)
+        print("动态量化在加载时完成，设置 CNN_QUANTIZATION=dynamic 启用")
+
+    print(f"\n模型大小: 浮点 {model_size_mb(float_model):.2f} MB -> INT8 {model_size_mb(quantized_model):.2f} MB")
+
+    if args.labels:
+        samples = load_labeled_set(args.labels)
+    else:
+        paths = sorted(p for p in Path(args.calibration_dir).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        samples = [(str(p), None) for p in paths[:args.calibration_images]]
+
+    quantized_detector = copy.copy(float_detector)
+    quantized_detector.model = quantized_model.eval()
+
+    report = evaluate_drift(float_detector, quantized_detector, samples)
+
+    print("\n精度漂移报告:")
+    print("-"*80)
+    for key, value in report.items():
+        print(f"{key:24s}: {value:.4f}" if isinstance(value, float) else f"{key:24s}: {value}")
+    print("="*80)
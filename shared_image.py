@@ -0,0 +1,229 @@
+"""
+共享内存图像传递
+Web进程解码一次上传图像，写入共享内存段，只把描述符（段名、形状、dtype）发给推理进程；
+推理进程直接映射同一块内存，不再经套接字传输或重复解码几十MB的像素数据。
+
+共享内存段归Web进程所有：推理进程只映射、用完即关闭，从不删除；段在请求结束后回收到
+缓冲池复用，请求失败（推理进程崩溃、超时）时直接删除，避免仍在运行的推理进程读到被复用的数据。
+"""
+import os
+import re
+import gc
+import atexit
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory, resource_tracker
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+from config import INFERENCE_CONFIG
+
+
+SHM_DIR = Path('/dev/shm')
+
+
+def decode_image(path) -> Optional[np.ndarray]:
+    """解码上传的图像文件（BGR），PDF或无法解码时返回None"""
+    if str(path).lower().endswith('.pdf'):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return cv2.imdecode(np.frombuffer(f.read(), np.uint8), cv2.IMREAD_COLOR)
+    except Exception as e:
+        print(f"图像读取错误: {str(e)}")
+        return None
+
+
+class SharedImagePool:
+    """共享内存缓冲池（Web进程端）
+
+    按容量复用已创建的共享内存段；段名包含创建进程的PID，进程异常退出后遗留的段可由
+    sweep_stale_segments 按PID清理。
+    """
+
+    def __init__(self, prefix: Optional[str] = None, max_buffers: Optional[int] = None,
+                 granularity: Optional[int] = None):
+        """
+        初始化缓冲池
+
+        Args:
+            prefix: 共享内存段名前缀
+            max_buffers: 空闲时保留的最大段数，超出的段直接删除
+            granularity: 段容量取整粒度（字节），使尺寸相近的图像可以复用同一个段
+        """
+        self.prefix = prefix or INFERENCE_CONFIG['shm_prefix']
+        self.max_buffers = max_buffers or INFERENCE_CONFIG['shm_pool_size']
+        self.granularity = granularity or INFERENCE_CONFIG['shm_granularity']
+        self.free: List[shared_memory.SharedMemory] = []
+        self.leased: Dict[str, shared_memory.SharedMemory] = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+
+        # 清理已退出的Web进程遗留的段（例如上一个被杀掉的gunicorn worker）
+        sweep_stale_segments(self.prefix)
+        atexit.register(self.close)
+
+    @contextmanager
+    def lease(self, image: np.ndarray, run: Optional[Callable] = None) -> Iterator[Dict]:
+        """
+        把图像写入共享内存段，返回描述符；退出时回收该段
+
+        with 块内抛出异常时该段不再复用（推理进程可能仍在读取），直接删除。
+
+        Args:
+            image: 图像
+            run: 执行像素拷贝的函数 run(fn, *args)，默认直接调用（gevent worker 传入线程池，见 inference_client.py）
+        """
+        shm = self.acquire(image.nbytes)
+        view = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)
+        try:
+            (run or _call)(np.copyto, view, image)
+        except BaseException:
+            del view
+            self.release(shm, reuse=False)
+            raise
+        del view
+
+        descriptor = {'name': shm.name, 'shape': image.shape, 'dtype': image.dtype.str}
+        try:
+            yield descriptor
+        except BaseException:
+            self.release(shm, reuse=False)
+            raise
+        else:
+            self.release(shm, reuse=True)
+
+    def acquire(self, nbytes: int) -> shared_memory.SharedMemory:
+        """取容量不小于 nbytes 的最小空闲段，没有时新建"""
+        with self.lock:
+            candidates = [shm for shm in self.free if shm.size >= nbytes]
+            if candidates:
+                shm = min(candidates, key=lambda s: s.size)
+                self.free.remove(shm)
+            else:
+                self.counter += 1
+                name = f"{self.prefix}_{os.getpid()}_{self.counter}"
+                size = -(-nbytes // self.granularity) * self.granularity
+                shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.leased[shm.name] = shm
+            return shm
+
+    def release(self, shm: shared_memory.SharedMemory, reuse: bool = True):
+        """归还段；不可复用或空闲段已满时删除最小的段"""
+        with self.lock:
+            self.leased.pop(shm.name, None)
+            if not reuse:
+                _destroy(shm)
+                return
+
+            self.free.append(shm)
+            if len(self.free) > self.max_buffers:
+                self.free.sort(key=lambda s: s.size)
+                _destroy(self.free.pop(0))
+
+    def close(self):
+        """删除缓冲池中的全部段（进程退出时自动调用）"""
+        with self.lock:
+            for shm in self.free + list(self.leased.values()):
+                _destroy(shm)
+            self.free = []
+            self.leased = {}
+
+
+@contextmanager
+def attach_image(descriptor: Dict) -> Iterator[np.ndarray]:
+    """
+    映射Web进程传来的共享内存图像（推理进程端）
+
+    返回的数组直接引用共享内存，只在 with 块内有效，调用方不应在块外保留引用；
+    推理进程只关闭映射，不删除段。
+    """
+    shm = _attach(descriptor['name'])
+    image = np.ndarray(tuple(descriptor['shape']), dtype=np.dtype(descriptor['dtype']), buffer=shm.buf)
+    try:
+        yield image
+    finally:
+        del image
+        try:
+            shm.close()
+        except BufferError:
+            # 调用方或OCR结果对象的引用环仍持有该数组，回收后再关闭
+            gc.collect()
+            try:
+                shm.close()
+            except BufferError:
+                print(f"共享内存段 {descriptor['name']} 仍被引用，映射随引用对象回收时释放")
+
+
+def sweep_stale_segments(prefix: Optional[str] = None) -> int:
+    """
+    删除创建进程已退出的共享内存段
+
+    Args:
+        prefix: 共享内存段名前缀
+
+    Returns:
+        删除的段数
+    """
+    prefix = prefix or INFERENCE_CONFIG['shm_prefix']
+    if not SHM_DIR.is_dir():
+        return 0
+
+    pattern = re.compile(rf'^{re.escape(prefix)}_(\d+)_\d+$')
+    removed = 0
+    for entry in SHM_DIR.iterdir():
+        match = pattern.match(entry.name)
+        if not match or _pid_alive(int(match.group(1))):
+            continue
+        try:
+            entry.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        print(f"已清理 {removed} 个遗留的共享内存段")
+    return removed
+
+
+def _call(fn, *args):
+    return fn(*args)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """映射已有的共享内存段，不登记到本进程的 resource_tracker
+
+    否则推理进程退出时 resource_tracker 会把仍归Web进程所有的段删除。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 没有 track 参数
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _destroy(shm: shared_memory.SharedMemory):
+    """关闭并删除共享内存段"""
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    """判断进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
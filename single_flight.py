@@ -0,0 +1,195 @@
+"""
+相同上传的请求合并（single-flight）
+多名窗口人员同时上传同一份文件时，按文件内容哈希合并：第一个请求执行分析，同时到达的重复请求
+等待并共享同一结果。同一Web进程内的线程/协程通过内存中的等待对象合并；同一节点上的多个Web进程
+通过每个哈希一个锁文件（fcntl.flock）合并，执行方把结果写入结果文件，等待方获得锁后读取。
+持锁进程崩溃时内核自动释放锁，等待方会接手重新执行。
+"""
+import fcntl
+import hashlib
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from config import SINGLE_FLIGHT_CONFIG
+
+
+def content_digest(path) -> str:
+    """文件内容的 SHA-256 十六进制摘要"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Flight:
+    """一次合并执行的结果"""
+
+    def __init__(self, value: Any, coalesced: bool, wait_ms: float):
+        """
+        Args:
+            value: 执行结果（与其他请求共享，修改前应先复制）
+            coalesced: 是否复用了其他请求的结果
+            wait_ms: 等待其他请求结果所用的时间（毫秒）
+        """
+        self.value = value
+        self.coalesced = coalesced
+        self.wait_ms = wait_ms
+
+
+class _Call:
+    """进程内正在执行的调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.coalesced = False
+
+
+class SingleFlight:
+    """按键合并并发调用（进程内 + 跨进程）
+
+    等待对象和锁在首次使用时按进程创建（gevent 猴子补丁在 gunicorn fork 之后才生效）。
+    """
+
+    def __init__(self, lock_dir: Optional[str] = None):
+        """
+        Args:
+            lock_dir: 锁文件和结果文件目录，默认使用 config.SINGLE_FLIGHT_CONFIG['lock_dir']
+        """
+        self.lock_dir = Path(lock_dir or SINGLE_FLIGHT_CONFIG['lock_dir'])
+        self.calls: Dict[str, _Call] = {}
+        self.lock = None
+        self.pid = None
+
+    def run(self, key: str, fn: Callable[[], Any]) -> Flight:
+        """
+        执行 fn，相同 key 的并发调用共享同一结果
+
+        fn 抛出的异常同样传给进程内的等待方；跨进程的等待方拿不到结果时自己重新执行。
+        """
+        if not SINGLE_FLIGHT_CONFIG['enabled']:
+            return Flight(fn(), False, 0.0)
+
+        if self.pid != os.getpid():
+            self.calls = {}
+            self.lock = threading.Lock()
+            self.pid = os.getpid()
+
+        arrived = time.monotonic()
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return Flight(call.value, True, (time.monotonic() - arrived) * 1000.0)
+
+        try:
+            call.value, call.coalesced = self._run_across_processes(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+            call.done.set()
+
+        wait_ms = (time.monotonic() - arrived) * 1000.0 if call.coalesced else 0.0
+        return Flight(call.value, call.coalesced, wait_ms)
+
+    def _run_across_processes(self, key: str, fn: Callable[[], Any]):
+        """持有该键的锁文件执行 fn；锁被其他进程持有时等待并读取其结果
+
+        Returns:
+            (结果, 是否复用了其他进程的结果)
+        """
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        lock_path = self.lock_dir / f'{key}.lock'
+        result_path = self.lock_dir / f'{key}.result'
+        arrived = time.time()
+
+        fd, waited = self._acquire(lock_path)
+        try:
+            if waited:
+                value = self._read_result(result_path, arrived)
+                if value is not None:
+                    return value, True
+
+            value = fn()
+            self._write_result(result_path, value)
+            return value, False
+        finally:
+            if fd is not None:
+                # 先删除锁文件再释放锁：之后到达的请求在新文件上加锁，等待方通过 inode 比对发现并重试
+                try:
+                    lock_path.unlink()
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+
+    def _acquire(self, lock_path: Path):
+        """
+        非阻塞轮询获取锁文件（阻塞的 flock 会卡住整个 gevent worker）
+
+        Returns:
+            (文件描述符, 是否等待过其他进程)；等待超过 max_wait 时返回 (None, True)，不持锁执行
+        """
+        waited = False
+        give_up = time.monotonic() + SINGLE_FLIGHT_CONFIG['max_wait']
+        while True:
+            fd = os.open(str(lock_path), os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                waited = True
+                if time.monotonic() > give_up:
+                    print(f"等待重复请求的结果超时，直接执行: {lock_path.stem[:12]}")
+                    return None, waited
+                time.sleep(SINGLE_FLIGHT_CONFIG['poll_interval'])
+                continue
+
+            # 锁文件可能在 open 和 flock 之间被上一个执行方删除，此时锁住的是已删除的旧文件
+            try:
+                current = os.stat(str(lock_path)).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                return fd, waited
+            os.close(fd)
+
+    @staticmethod
+    def _read_result(result_path: Path, arrived: float) -> Any:
+        """读取本请求到达之后写入的结果，没有时返回 None"""
+        try:
+            if result_path.stat().st_mtime < arrived:
+                return None
+            with open(result_path, 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write_result(self, result_path: Path, value: Any):
+        """原子写入结果文件，并清理过期的结果文件"""
+        tmp_path = result_path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, result_path)
+
+        expired = time.time() - SINGLE_FLIGHT_CONFIG['result_ttl']
+        for path in self.lock_dir.glob('*.result'):
+            try:
+                if path.stat().st_mtime < expired:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
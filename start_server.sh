@@ -11,5 +11,8 @@ mkdir -p logs
 # 设置GPU环境变量
 export CUDA_VISIBLE_DEVICES=1
 
-# 使用gunicorn启动
+# 启动推理进程池（加载OCR和鉴伪模型）
+nohup python inference_server.py > logs/inference.log 2>&1 &
+
+# 使用gunicorn启动（HTTP worker通过Unix套接字转发推理请求）
 gunicorn -c gunicorn_config.py app:app
@@ -13,3 +13,14 @@ else
     pkill -f "gunicorn.*credit_detection"
     echo "已尝试停止所有相关进程"
 fi
+
+INFERENCE_PID_FILE="logs/inference.pid"
+
+if [ -f "$INFERENCE_PID_FILE" ]; then
+    PID=$(cat $INFERENCE_PID_FILE)
+    echo "正在停止推理服务 (PID: $PID)..."
+    kill $PID
+    echo "推理服务已停止"
+else
+    pkill -f "python inference_server.py"
+fi
@@ -0,0 +1,131 @@
+"""
+准入控制单元测试
+运行: python -m pytest -q test_admission.py
+"""
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, AdmissionStage
+
+
+LANES = {
+    'interactive': {'priority': 0, 'weight': 1, 'max_share': 1.0},
+    # bulk 权重更高也不能越过优先级
+    'bulk': {'priority': 1, 'weight': 4, 'max_share': 0.5},
+}
+
+
+def make_stage(concurrency=1, max_queue=4, max_wait=5.0):
+    return AdmissionStage('test', concurrency, max_queue, max_wait, service_time=1.0, lanes=LANES)
+
+
+def hold(stage, lane, started, release, order=None):
+    """在线程中占用一个名额，直到 release 被设置"""
+    def run():
+        with stage.enter(lane):
+            if order is not None:
+                order.append(lane)
+            started.set()
+            release.wait(5)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_queued(stage, lane, depth):
+    for _ in range(200):
+        if len(stage.queues[lane]) >= depth:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f'{lane} 队列未达到 {depth}')
+
+
+def test_interactive_queued_behind_bulk_is_granted_first():
+    stage = make_stage(concurrency=1)
+    order = []
+
+    first_started, first_release = threading.Event(), threading.Event()
+    hold(stage, 'interactive', first_started, first_release)
+    assert first_started.wait(2)
+
+    bulk_started, interactive_started, release = threading.Event(), threading.Event(), threading.Event()
+    bulk = hold(stage, 'bulk', bulk_started, release, order)
+    wait_queued(stage, 'bulk', 1)
+    interactive = hold(stage, 'interactive', interactive_started, release, order)
+    wait_queued(stage, 'interactive', 1)
+
+    first_release.set()
+    assert interactive_started.wait(2)
+    assert not bulk_started.is_set()
+
+    release.set()
+    bulk.join(2)
+    interactive.join(2)
+    assert order == ['interactive', 'bulk']
+
+
+def test_bulk_cannot_take_reserved_slots():
+    stage = make_stage(concurrency=4)
+    release = threading.Event()
+    started = [threading.Event() for _ in range(3)]
+    threads = [hold(stage, 'bulk', event, release) for event in started]
+
+    assert started[0].wait(2) and started[1].wait(2)
+    wait_queued(stage, 'bulk', 1)
+    assert stage.lane_active['bulk'] == 2
+    assert not started[2].is_set()
+
+    # 保留的名额仍可立即分给 interactive
+    with stage.enter('interactive') as ticket:
+        assert ticket.wait_ms < 100
+
+    release.set()
+    for thread in threads:
+        thread.join(2)
+    assert stage.active == 0
+
+
+def test_queue_full_rejects_with_retry_after():
+    stage = make_stage(concurrency=1, max_queue=1)
+    started, release = threading.Event(), threading.Event()
+    hold(stage, 'interactive', started, release)
+    assert started.wait(2)
+    queued = hold(stage, 'interactive', threading.Event(), release)
+    wait_queued(stage, 'interactive', 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        stage.check('interactive')
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        with stage.enter('interactive'):
+            pass
+    assert rejected.value.status == 429
+
+    release.set()
+    queued.join(2)
+
+
+def test_queue_wait_timeout_returns_503():
+    stage = make_stage(concurrency=1, max_wait=0.1)
+    started, release = threading.Event(), threading.Event()
+    hold(stage, 'interactive', started, release)
+    assert started.wait(2)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        with stage.enter('interactive'):
+            pass
+    assert rejected.value.status == 503
+    assert rejected.value.retry_after >= 1
+    assert stage.metrics['interactive'].timed_out == 1
+    assert not stage.queues['interactive']
+    release.set()
+
+
+def test_unknown_lane_falls_back_to_default():
+    assert AdmissionController.lane('BULK') == 'bulk'
+    assert AdmissionController.lane('urgent') == 'interactive'
+    assert AdmissionController.lane(None) == 'interactive'
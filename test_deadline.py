@@ -0,0 +1,76 @@
+"""
+请求截止时间单元测试
+运行: python -m pytest -q test_deadline.py
+"""
+import time
+
+import pytest
+
+import deadline as deadline_module
+from deadline import Deadline
+
+
+@pytest.fixture
+def config(monkeypatch):
+    """固定截止时间配置，不受环境变量影响"""
+    values = dict(deadline_module.DEADLINE_CONFIG, default_ms=10000, max_ms=20000, reserve=0.5)
+    monkeypatch.setattr(deadline_module, 'DEADLINE_CONFIG', values)
+    return values
+
+
+def test_header_relative_budget(config):
+    deadline = Deadline.from_header('3000')
+    assert 2900 < deadline.remaining_ms() <= 3000
+
+
+def test_header_epoch_is_absolute(config):
+    epoch_ms = time.time() * 1000.0 + 5000
+    deadline = Deadline.from_header(str(epoch_ms))
+    assert 4900 < deadline.remaining_ms() <= 5000
+
+
+def test_header_epoch_in_the_past_is_expired(config):
+    deadline = Deadline.from_header(str(time.time() * 1000.0 - 1000))
+    assert deadline.expired()
+    assert deadline.remaining_ms() == 0.0
+
+
+def test_header_missing_or_invalid_uses_default(config):
+    for value in (None, '', 'soon'):
+        deadline = Deadline.from_header(value)
+        assert 9900 < deadline.remaining_ms() <= 10000
+
+
+def test_header_capped_at_max(config):
+    assert Deadline.from_header('600000').remaining_ms() <= 20000
+    assert Deadline.from_header(str(time.time() * 1000.0 + 600000)).remaining_ms() <= 20000
+
+
+def test_no_default_means_unbounded(config):
+    config['default_ms'] = None
+    assert Deadline.from_header(None) is None
+    assert Deadline.after_ms(None) is None
+    assert Deadline.at_epoch_ms(None) is None
+
+
+def test_epoch_round_trip_charges_elapsed_time():
+    deadline = Deadline.after_ms(1000)
+    sent = deadline.epoch_ms()
+    time.sleep(0.1)
+    received = Deadline.at_epoch_ms(sent)
+    assert abs(received.remaining() - deadline.remaining()) < 0.02
+    assert received.remaining_ms() < 950
+
+
+def test_allows_keeps_reserve(config):
+    deadline = Deadline.after_ms(1000)
+    assert deadline.allows(0.4)
+    assert not deadline.allows(0.6)
+    assert deadline.allows(0.9, reserve=0.0)
+    assert not Deadline(time.monotonic() - 1.0).allows(0.0, reserve=0.0)
+
+
+def test_reserving_ends_earlier(config):
+    deadline = Deadline.after_ms(1000)
+    assert deadline.reserving().expires_at == pytest.approx(deadline.expires_at - 0.5)
+    assert deadline.reserving(0.2).expires_at == pytest.approx(deadline.expires_at - 0.2)
@@ -0,0 +1,185 @@
+"""
+鉴伪综合评分与风险等级单元测试
+运行: python -m pytest -q test_forgery_scoring.py
+"""
+import cv2
+import numpy as np
+import pytest
+
+from config import FORGERY_THRESHOLDS
+from deadline import Deadline
+from module3_forgery import ForgeryDetectionSystem
+
+
+ORDER = ['text', 'structure', 'metadata', 'image']
+
+
+@pytest.fixture(scope='module')
+def system():
+    return ForgeryDetectionSystem()
+
+
+@pytest.fixture
+def document(tmp_path):
+    rng = np.random.default_rng(0)
+    image = np.full((480, 640, 3), 235, dtype=np.uint8)
+    image[60:420, 80:560] = rng.integers(120, 200, (360, 480, 3), dtype=np.uint8)
+    cv2.putText(image, 'CERTIFICATE 2024', (120, 240), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 2)
+    path = tmp_path / 'document.png'
+    cv2.imwrite(str(path), image)
+    return str(path)
+
+
+@pytest.fixture
+def cnn_too_slow(system, monkeypatch):
+    """模型已加载但CNN预计耗时超过剩余时间：只有 CNN 被跳过"""
+    detector = system.image_detector
+    monkeypatch.setattr(detector, 'model_loaded', True)
+    monkeypatch.setattr(detector, '_run_cnn', lambda image, deadline=None: pytest.fail('CNN 不应运行'))
+    monkeypatch.setitem(detector.optional_costs, 'cnn', 100.0)
+    for name in ('copy_move', 'noise', 'spectrum'):
+        monkeypatch.setitem(detector.optional_costs, name, 0.0)
+    return Deadline.after_ms(10000)
+
+
+def stub_runners(system, monkeypatch, order=ORDER, **scores):
+    """按固定顺序调度，用给定得分代替各层检测（未给出得分的层运行时报错）"""
+    monkeypatch.setattr(system, '_schedule', lambda: list(order))
+    for name, score in scores.items():
+        def run(result, *args, name=name, score=score):
+            result[f'{name}_score'] = score
+            return score
+        monkeypatch.setattr(system, f'_run_{name}', run)
+
+
+def detect(system, document, deadline=None):
+    return system.detect(document, None, '', {}, 'test', [0, 0, 640, 480], deadline=deadline)
+
+
+def test_image_bounds_cover_skipped_cnn(system, document, cnn_too_slow):
+    result = system.image_detector.detect(document, deadline=cnn_too_slow)
+
+    assert [item['analyzer'] for item in result['skipped']] == ['cnn']
+    assert result['degraded']
+    ran = [name for name in result['details'] if name.endswith('_score')]
+    lower, upper = result['score_bounds']
+    # 各分析器等权，跳过的CNN得分按0/按1计
+    assert upper - lower == pytest.approx(1 / (len(ran) + 1))
+    assert lower <= result['forgery_score'] <= upper
+
+
+def test_skipped_cnn_that_could_change_the_band_is_not_passed(system, document, cnn_too_slow, monkeypatch):
+    lower, upper = system.image_detector.detect(document, deadline=cnn_too_slow)['score_bounds']
+    # 其余层取同一得分，使图像得分取下界时综合评分低于通过阈值、取上界时高于阈值
+    image_weight = system.weights['image']
+    score = (FORGERY_THRESHOLDS['genuine'] - image_weight * (lower + upper) / 2) / (1 - image_weight)
+    assert 0.0 <= score <= 1.0
+    stub_runners(system, monkeypatch, text=score, structure=score, metadata=score)
+
+    result = detect(system, document, cnn_too_slow)
+
+    assert result['image_score_bounds'] == [lower, upper]
+    assert [item['analyzer'] for item in result['degraded_analyzers']] == ['image.cnn']
+    assert result['score_bounds'][0] < FORGERY_THRESHOLDS['genuine'] <= result['score_bounds'][1]
+    assert not result['risk_determined']
+    assert not result['score_complete']
+    assert result['forgery_risk'] == 'suspicious'
+    assert '人工复核' in result['recommendation']
+
+
+def test_skipped_cnn_that_cannot_change_the_band_keeps_the_verdict(system, document, cnn_too_slow, monkeypatch):
+    # 图像层先运行，否则其余层得分为0时图像层被提前终止跳过
+    stub_runners(system, monkeypatch, order=['image', 'text', 'structure', 'metadata'],
+                 text=0.0, structure=0.0, metadata=0.0)
+
+    result = detect(system, document, cnn_too_slow)
+
+    # 图像得分即使取1，综合评分也低于通过阈值
+    assert result['score_bounds'][1] < FORGERY_THRESHOLDS['genuine']
+    assert result['risk_determined']
+    assert result['forgery_risk'] == 'genuine'
+    assert result['degraded'] and '结果已降级' in result['recommendation']
+
+
+class ExpiresAfter:
+    """前 checks 次检查未过期，之后过期的截止时间"""
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    def expired(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+def test_band_decided_early_skips_remaining_analyzers(system, document, monkeypatch):
+    # 图像层未给出得分，运行即报错
+    stub_runners(system, monkeypatch, text=0.0, structure=0.0, metadata=0.0)
+
+    result = detect(system, document)
+
+    # 已完成的三层得分为0，图像层即使得1分综合评分也只有其权重
+    assert [item['analyzer'] for item in result['skipped_analyzers']] == ['image']
+    assert result['score_bounds'] == pytest.approx([0.0, system.weights['image']])
+    assert result['forgery_score'] == pytest.approx(0.0)
+    assert result['risk_determined'] and result['forgery_risk'] == 'genuine'
+    assert not result['score_complete'] and not result['degraded']
+
+
+def test_forged_decided_early_uses_point_estimate(system, document, monkeypatch):
+    stub_runners(system, monkeypatch, order=['text', 'structure', 'image', 'metadata'],
+                 text=1.0, structure=1.0, image=1.0)
+
+    result = detect(system, document)
+
+    assert [item['analyzer'] for item in result['skipped_analyzers']] == ['metadata']
+    assert result['score_bounds'] == pytest.approx([1 - system.weights['metadata'], 1.0])
+    # 跳过的分析器按已完成分析器的加权平均分计
+    assert result['forgery_score'] == pytest.approx(1.0)
+    assert result['risk_determined'] and result['forgery_risk'] == 'forged'
+
+
+def test_bounds_straddling_a_threshold_need_review(system, document, monkeypatch):
+    stub_runners(system, monkeypatch, text=0.6)
+
+    result = detect(system, document, ExpiresAfter(1))
+
+    text_weight = system.weights['text']
+    assert [item['analyzer'] for item in result['degraded_analyzers']] == ORDER[1:]
+    assert result['score_bounds'] == pytest.approx([0.6 * text_weight, 0.6 * text_weight + 1 - text_weight])
+    assert result['forgery_score'] == pytest.approx(0.6)
+    assert not result['risk_determined']
+    assert result['forgery_risk'] == 'suspicious'
+    assert '人工复核' in result['recommendation']
+
+
+def test_every_analyzer_completing(system, document, monkeypatch):
+    # 每一步上下界都跨越通过阈值，不会提前终止
+    stub_runners(system, monkeypatch, text=0.5, structure=0.5, metadata=0.5, image=0.5)
+
+    result = detect(system, document)
+
+    assert not result['skipped_analyzers']
+    assert result['score_complete'] and result['risk_determined']
+    assert result['score_bounds'] == pytest.approx([0.5, 0.5])
+    assert result['forgery_score'] == pytest.approx(0.5)
+    assert result['forgery_risk'] == 'suspicious'
+    assert result['recommendation'] == '证件存在可疑特征，建议人工复核'
+
+
+@pytest.mark.parametrize('checks', range(len(ORDER) + 1))
+def test_point_estimate_stays_within_bounds(system, document, monkeypatch, checks):
+    scores = {'text': 0.9, 'structure': 0.2, 'metadata': 0.7, 'image': 0.4}
+    stub_runners(system, monkeypatch, **scores)
+
+    result = detect(system, document, ExpiresAfter(checks))
+
+    lower, upper = result['score_bounds']
+    assert lower <= result['forgery_score'] <= upper
+    assert result['score_complete'] == (checks >= len(ORDER))
+    if result['score_complete']:
+        assert result['forgery_score'] == pytest.approx(
+            sum(score * system.weights[name] for name, score in scores.items())
+        )
+    elif not result['risk_determined']:
+        assert result['forgery_risk'] != 'genuine'
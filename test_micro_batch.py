@@ -0,0 +1,194 @@
+"""
+跨请求微批调度单元测试
+运行: python -m pytest -q test_micro_batch.py
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from deadline import Deadline
+from micro_batch import MicroBatcher, _Pending
+
+
+class FakeModel:
+    """记录每次调用的批次；release 未设置时阻塞，模拟卡住的推理"""
+
+    def __init__(self, block=False):
+        self.batches = []
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def run_batch(self, items):
+        self.batches.append(list(items))
+        self.release.wait(5)
+        return [item * 10 for item in items]
+
+
+def submit_in_thread(batcher, item, outcomes, deadline=None):
+    def run():
+        try:
+            outcomes[item] = batcher.submit(item, deadline)
+        except Exception as e:
+            outcomes[item] = e
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_stalled_batch_raises_at_deadline():
+    model = FakeModel(block=True)
+    batcher = MicroBatcher('test', model.run_batch, max_batch_size=4, max_wait_ms=1.0)
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        batcher.submit(1, Deadline.after_ms(100))
+    assert time.monotonic() - started < 1.0
+
+    # 卡住的批次恢复后调度线程继续处理后续提交
+    model.release.set()
+    assert batcher.submit(2) == 20
+
+
+def test_queued_item_past_deadline_is_not_run():
+    model = FakeModel(block=True)
+    batcher = MicroBatcher('test', model.run_batch, max_batch_size=1, max_wait_ms=1.0)
+    outcomes = {}
+    first = submit_in_thread(batcher, 1, outcomes)
+    for _ in range(200):
+        if model.batches:
+            break
+        time.sleep(0.01)
+
+    # 调度线程被第一批占住，第二项在队列中等到截止时间后移出队列
+    with pytest.raises(TimeoutError):
+        batcher.submit(2, Deadline.after_ms(50))
+    assert not batcher.queue and batcher.queued_size == 0
+
+    model.release.set()
+    first.join(2)
+    assert outcomes[1] == 10
+    assert model.batches == [[1]]
+
+
+def queued(batcher, *sizes):
+    """不启动调度线程，直接向队列放入给定容量的提交"""
+    for size in sizes:
+        pending = _Pending(size, size)
+        batcher.queue.append(pending)
+        batcher.queued_size += size
+
+
+def collected_sizes(batcher):
+    return [pending.size for pending in batcher._collect()]
+
+
+def test_collect_caps_batch_size():
+    batcher = MicroBatcher('test', None, max_batch_size=4, max_wait_ms=5000.0)
+    queued(batcher, 2, 2, 2)
+
+    started = time.monotonic()
+    assert collected_sizes(batcher) == [2, 2]
+    # 已达到批容量，不再等待 max_wait
+    assert time.monotonic() - started < 1.0
+    assert batcher.queued_size == 2
+
+
+def test_collect_waits_at_most_max_wait():
+    batcher = MicroBatcher('test', None, max_batch_size=4, max_wait_ms=50.0)
+    queued(batcher, 1)
+
+    started = time.monotonic()
+    assert collected_sizes(batcher) == [1]
+    assert 0.04 <= time.monotonic() - started < 1.0
+    assert batcher.queued_size == 0
+
+
+def test_collect_runs_oversized_item_alone():
+    batcher = MicroBatcher('test', None, max_batch_size=4, max_wait_ms=1.0)
+    queued(batcher, 10, 1, 1, 9)
+
+    assert collected_sizes(batcher) == [10]
+    assert collected_sizes(batcher) == [1, 1]
+    assert collected_sizes(batcher) == [9]
+    assert batcher.queued_size == 0
+
+
+def test_concurrent_submits_are_batched_and_scattered():
+    model = FakeModel()
+    batcher = MicroBatcher('test', model.run_batch, max_batch_size=8, max_wait_ms=100.0)
+    outcomes = {}
+    threads = [submit_in_thread(batcher, item, outcomes) for item in range(1, 6)]
+    for thread in threads:
+        thread.join(2)
+
+    assert outcomes == {item: item * 10 for item in range(1, 6)}
+    assert sorted(item for batch in model.batches for item in batch) == [1, 2, 3, 4, 5]
+    assert len(model.batches) < 5
+
+
+def test_failed_item_raises_only_for_its_caller():
+    def run_batch(items):
+        return [ValueError(item) if item == 2 else item for item in items]
+
+    batcher = MicroBatcher('test', run_batch, max_batch_size=4, max_wait_ms=50.0)
+    outcomes = {}
+    threads = [submit_in_thread(batcher, item, outcomes) for item in (1, 2, 3)]
+    for thread in threads:
+        thread.join(2)
+
+    assert outcomes[1] == 1 and outcomes[3] == 3
+    assert isinstance(outcomes[2], ValueError)
+
+
+@pytest.fixture
+def image_detector(monkeypatch):
+    """图像检测器，CNN推理替换为取每个图像块左上角像素值"""
+    from module3_forgery import ImageForgeryDetector, TemplateIndex
+
+    detector = ImageForgeryDetector(template_index=TemplateIndex())
+    calls = []
+
+    def predict(patches):
+        calls.append(len(patches))
+        return patches[:, 0, 0, 0].astype(np.float32)
+
+    monkeypatch.setattr(detector, '_predict_patches', predict)
+    detector.predict_calls = calls
+    return detector
+
+
+def patches_of(*values):
+    """每个图像块的像素都取给定值"""
+    return np.array([np.full((3, 4, 4), value, dtype=np.uint8) for value in values]).reshape(-1, 3, 4, 4)
+
+
+def test_predict_patch_batches_splits_per_request(image_detector):
+    batches = [patches_of(1, 2, 3), patches_of(), patches_of(4, 5)]
+
+    results = image_detector._predict_patch_batches(batches)
+
+    assert image_detector.predict_calls == [5]
+    assert [result.tolist() for result in results] == [[1, 2, 3], [], [4, 5]]
+
+
+def test_patch_batcher_returns_each_request_its_own_patches(image_detector):
+    if image_detector.patch_batcher is None:
+        pytest.skip('INFERENCE_BATCHING=0')
+    outcomes = {}
+    requests = {value: patches_of(*[value] * value) for value in (1, 2, 3, 4)}
+
+    def run(value):
+        outcomes[value] = image_detector.patch_batcher.submit(requests[value])
+
+    threads = [threading.Thread(target=run, args=(value,)) for value in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert {value: probs.tolist() for value, probs in outcomes.items()} == \
+        {value: [float(value)] * value for value in requests}
+    assert sum(image_detector.predict_calls) == 10
@@ -0,0 +1,58 @@
+"""
+OCR跨请求合批与单张识别的一致性测试
+需要 requirements.txt 中固定版本的 paddleocr 及其模型，未安装时跳过
+运行: python -m pytest -q test_ocr_batch.py
+"""
+import re
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+paddleocr = pytest.importorskip('paddleocr')
+
+
+def pinned_version(package: str):
+    """requirements.txt 中固定的版本号"""
+    requirements = (Path(__file__).parent / 'requirements.txt').read_text(encoding='utf-8')
+    match = re.search(rf'^{package}==(\S+)', requirements, re.MULTILINE)
+    return match.group(1) if match else None
+
+
+@pytest.fixture(scope='module')
+def detector():
+    if paddleocr.__version__ != pinned_version('paddleocr'):
+        pytest.skip(f"paddleocr {paddleocr.__version__} 与 requirements.txt 固定的版本不一致")
+    from module1_detection import CertificateDetector
+    return CertificateDetector()
+
+
+def render(lines):
+    """白底黑字的多行文本图像"""
+    image = np.full((80 + 70 * max(len(lines), 1), 900, 3), 255, dtype=np.uint8)
+    for i, text in enumerate(lines):
+        cv2.putText(image, text, (40, 80 + 70 * i), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3)
+    return image
+
+
+def test_batched_recognition_matches_single_calls(detector):
+    images = [
+        render(['PHYTOSANITARY CERTIFICATE', 'No. 2024-000123', 'Place of origin: LAOS']),
+        render([]),
+        render(['Botanical name: Pinus', 'Quantity 120 m3']),
+        render(['Date 2024-05-01']),
+    ]
+
+    batched = detector._ocr_batch(images)
+    single = [detector.ocr.ocr(image, cls=False) for image in images]
+
+    assert len(batched) == len(single)
+    for batched_result, single_result in zip(batched, single):
+        assert len(batched_result) == len(single_result) == 1
+        batched_lines, single_lines = batched_result[0] or [], single_result[0] or []
+        assert [line[0] for line in batched_lines] == [line[0] for line in single_lines]
+        assert [line[1][0] for line in batched_lines] == [line[1][0] for line in single_lines]
+        # 合批时同一识别批次内的填充宽度不同，置信度只要求近似
+        for batched_line, single_line in zip(batched_lines, single_lines):
+            assert batched_line[1][1] == pytest.approx(single_line[1][1], abs=0.05)
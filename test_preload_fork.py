@@ -0,0 +1,86 @@
+"""
+预加载后 fork 的推理进程冒烟测试：父进程预热CNN后派生的推理进程能完成CNN推理
+运行: python -m pytest -q test_preload_fork.py
+"""
+import gc
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+import pytest
+import torch
+
+import inference_server
+from module3_forgery import ImageForgeryDetector, TemplateIndex
+from thread_budget import governor
+
+
+class CnnPipeline:
+    """只含CNN图像块推理的流水线，预热在调用线程中执行（不经微批调度线程）"""
+
+    def __init__(self):
+        self.detector = ImageForgeryDetector(template_index=TemplateIndex())
+        self.detector.model_loaded = True
+        self.detector.patch_batcher = None
+        self.image = np.random.default_rng(0).integers(0, 255, (512, 512, 3), dtype=np.uint8)
+        # 与 _load_model 一样按线程预算设置多线程推理
+        torch.set_num_threads(4)
+
+    def warmup(self):
+        self.analyze()
+
+    def analyze(self):
+        score, grid = self.detector._run_cnn(self.image)
+        return grid.size > 0
+
+
+def run_in_child(fn, timeout=30.0) -> int:
+    """在 fork 出的子进程中执行 fn，返回退出码；超时视为挂起"""
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = 0 if fn() else 1
+        finally:
+            os._exit(code)
+
+    give_up = time.monotonic() + timeout
+    while time.monotonic() < give_up:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return os.waitstatus_to_exitcode(status)
+        time.sleep(0.05)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    pytest.fail('推理进程中的CNN推理挂起')
+
+
+@pytest.fixture
+def preloaded(monkeypatch):
+    monkeypatch.setattr(inference_server, 'AnalysisPipeline', CnnPipeline)
+    previous = torch.get_num_threads()
+    server = inference_server.InferenceServer(num_workers=1, threads_per_worker=1)
+    server._preload()
+    yield server
+    gc.unfreeze()
+    gc.enable()
+    torch.set_num_threads(previous)
+
+
+def test_worker_runs_cnn_after_parent_warmup(preloaded):
+    # 预热后恢复线程数，推理进程按线程预算多线程推理
+    assert torch.get_num_threads() == 4
+
+    def worker():
+        governor.apply_runtime()
+        torch.set_num_threads(4)
+        # fork 的线程（推理进程主线程）和新建的请求线程都能推理
+        results = [preloaded.pipeline.analyze()]
+        thread = threading.Thread(target=lambda: results.append(preloaded.pipeline.analyze()))
+        thread.start()
+        thread.join()
+        return results == [True, True]
+
+    assert run_in_child(worker) == 0
@@ -0,0 +1,138 @@
+"""
+相同上传请求合并单元测试
+运行: python -m pytest -q test_single_flight.py
+"""
+import os
+import threading
+import time
+
+import pytest
+
+import single_flight as single_flight_module
+from single_flight import SingleFlight, content_digest
+
+
+@pytest.fixture
+def flight(tmp_path, monkeypatch):
+    config = dict(single_flight_module.SINGLE_FLIGHT_CONFIG, enabled=True, poll_interval=0.01, max_wait=10.0)
+    monkeypatch.setattr(single_flight_module, 'SINGLE_FLIGHT_CONFIG', config)
+    return SingleFlight(str(tmp_path))
+
+
+def run_concurrently(flight, key, fn, count):
+    """count 个线程同时以同一 key 调用，返回各线程的 Flight 或异常"""
+    outcomes = []
+    barrier = threading.Barrier(count)
+
+    def call():
+        barrier.wait()
+        try:
+            outcomes.append(flight.run(key, fn))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+def test_followers_receive_leader_result(flight):
+    calls = []
+
+    def analyze():
+        calls.append(1)
+        time.sleep(0.2)
+        return {'success': True}
+
+    outcomes = run_concurrently(flight, 'digest', analyze, 4)
+    assert len(calls) == 1
+    assert all(outcome.value == {'success': True} for outcome in outcomes)
+    assert sorted(outcome.coalesced for outcome in outcomes) == [False, True, True, True]
+    assert all(outcome.wait_ms > 0 for outcome in outcomes if outcome.coalesced)
+
+
+def test_followers_receive_leader_exception(flight):
+    calls = []
+
+    def analyze():
+        calls.append(1)
+        time.sleep(0.2)
+        raise ValueError('boom')
+
+    outcomes = run_concurrently(flight, 'digest', analyze, 3)
+    assert len(calls) == 1
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+
+    # 失败不留下结果，之后的请求重新执行
+    assert flight.run('digest', lambda: 'retry').value == 'retry'
+
+
+def test_different_keys_do_not_coalesce(flight):
+    assert not flight.run('a', lambda: 1).coalesced
+    assert not flight.run('b', lambda: 2).coalesced
+    assert flight.run('a', lambda: 3).value == 3
+
+
+def test_follower_in_other_process_reads_leader_result(flight, tmp_path):
+    marker = tmp_path / 'calls'
+    marker.write_text('')
+
+    def analyze():
+        with open(marker, 'a') as f:
+            f.write('x')
+        time.sleep(0.3)
+        return {'pid': os.getpid()}
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            flight.run('digest', analyze)
+        finally:
+            os._exit(0)
+
+    # 等子进程拿到锁后再发起
+    for _ in range(100):
+        if marker.read_text():
+            break
+        time.sleep(0.01)
+    outcome = flight.run('digest', analyze)
+    os.waitpid(pid, 0)
+
+    assert marker.read_text() == 'x'
+    assert outcome.coalesced
+    assert outcome.value == {'pid': pid}
+
+
+def test_result_written_before_arrival_is_ignored(flight, tmp_path):
+    result_path = tmp_path / 'digest.result'
+    flight._write_result(result_path, 'stale')
+    old = time.time() - 5
+    os.utime(result_path, (old, old))
+
+    assert SingleFlight._read_result(result_path, time.time()) is None
+    assert SingleFlight._read_result(result_path, old - 1) == 'stale'
+    assert SingleFlight._read_result(tmp_path / 'missing.result', 0) is None
+
+    # 锁空闲时直接执行，不读取旧结果
+    outcome = flight.run('digest', lambda: 'fresh')
+    assert outcome.value == 'fresh' and not outcome.coalesced
+
+
+def test_disabled_runs_every_call(flight, monkeypatch):
+    monkeypatch.setitem(single_flight_module.SINGLE_FLIGHT_CONFIG, 'enabled', False)
+    calls = []
+    outcomes = run_concurrently(flight, 'digest', lambda: calls.append(1) or len(calls), 3)
+    assert len(calls) == 3
+    assert not any(outcome.coalesced for outcome in outcomes)
+
+
+def test_content_digest(tmp_path):
+    first, second = tmp_path / 'a.png', tmp_path / 'b.png'
+    first.write_bytes(b'same bytes')
+    second.write_bytes(b'same bytes')
+    assert content_digest(first) == content_digest(second)
+    second.write_bytes(b'other bytes')
+    assert content_digest(first) != content_digest(second)
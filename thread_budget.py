@@ -0,0 +1,209 @@
+"""
+线程预算
+每个推理进程内 PaddleOCR、torch、OpenCV 和 BLAS 默认都按整机核数创建线程池，多个推理进程同时推理时
+线程数远超核数，延迟忽高忽低。本模块按可用CPU数、推理进程数和每进程请求线程数计算各库的线程数：
+
+- 模型推理：每个推理进程分得的核数按 ocr_share 分成两份，分别给 Paddle cpu_threads（OCR）和
+  torch intra-op / OpenMP / MKL（CNN）。OCR和CNN各自在微批调度线程中串行执行，但两个调度线程
+  之间并发，两者的线程数之和不超过进程的预算。
+- OpenCV / OpenBLAS：由多个请求线程并发调用，每个请求线程分得进程预算的一份。
+
+OpenMP/MKL/OpenBLAS 在库加载时读取环境变量，必须在导入 numpy/cv2/paddle/torch 之前调用 configure；
+运行时可调的设置（cv2.setNumThreads、torch.set_num_threads）在模型加载前和每个推理进程 fork 后由
+apply_runtime 设置。运维已显式设置的环境变量保持不变。
+"""
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+from config import CNN_INFERENCE_CONFIG, INFERENCE_CONFIG, OCR_CONFIG, THREAD_CONFIG
+
+
+# 模型推理线程池（torch 的 OpenMP / MKL；Paddle 由 cpu_threads 单独设置）
+MODEL_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS')
+# 请求线程中并发调用的 numpy BLAS
+REQUEST_ENV_VARS = ('OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS')
+
+
+def available_cpus() -> int:
+    """
+    本进程可用的CPU数：CPU亲和性掩码中的核数，再受 cgroup CPU 配额限制（容器部署）
+
+    Returns:
+        可用CPU数（至少为1）
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = _cgroup_cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+
+def _cgroup_cpu_quota() -> Optional[float]:
+    """cgroup 的CPU配额（核数），未限制时返回None"""
+    try:
+        # cgroup v2: "<quota> <period>" 或 "max <period>"
+        quota, period = Path('/sys/fs/cgroup/cpu.max').read_text().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (FileNotFoundError, PermissionError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        quota = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us').read_text())
+        period = int(Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us').read_text())
+        return None if quota <= 0 else quota / period
+    except (FileNotFoundError, PermissionError, ValueError):
+        return None
+
+
+class ThreadBudget:
+    """一组推理进程的线程预算"""
+
+    def __init__(self, cpus: int, processes: int, request_threads: int):
+        """
+        Args:
+            cpus: 可用CPU数
+            processes: 推理进程数
+            request_threads: 每个推理进程并发处理的请求数
+        """
+        self.cpus = cpus
+        self.processes = max(1, int(processes))
+        self.request_threads = max(1, int(request_threads))
+
+        usable = max(1, cpus - THREAD_CONFIG['reserved_cpus'])
+        self.per_process = max(1, usable // self.processes)
+        # 只有1个核时两个池各1个线程（无法再分）
+        self.ocr_threads = min(max(1, round(self.per_process * THREAD_CONFIG['ocr_share'])), self.per_process)
+        self.cnn_threads = max(1, self.per_process - self.ocr_threads)
+        self.request_share = max(1, self.per_process // self.request_threads)
+
+    def env(self) -> Dict[str, str]:
+        """各线程池环境变量的目标值（OpenMP/MKL 按CNN的份额；Paddle 通过 cpu_threads 单独设置）"""
+        values = {name: str(self.cnn_threads) for name in MODEL_ENV_VARS}
+        values.update({name: str(self.request_share) for name in REQUEST_ENV_VARS})
+        return values
+
+    def to_dict(self) -> Dict:
+        return {
+            'cpus': self.cpus,
+            'processes': self.processes,
+            'request_threads': self.request_threads,
+            'per_process': self.per_process,
+            'ocr_threads': self.ocr_threads,
+            'cnn_threads': self.cnn_threads,
+            'request_share': self.request_share
+        }
+
+
+class ThreadGovernor:
+    """计算并应用线程预算（每个进程一个实例，见模块级 governor）"""
+
+    def __init__(self):
+        self.budget: Optional[ThreadBudget] = None
+        self.env_sources: Dict[str, str] = {}     # 环境变量 -> 'budget' / 'env'（运维显式设置）
+        self.explicit_env = {name for name in MODEL_ENV_VARS + REQUEST_ENV_VARS if name in os.environ}
+
+    def configure(self, num_workers: Optional[int] = None, threads_per_worker: Optional[int] = None) -> Optional[ThreadBudget]:
+        """
+        计算线程预算并写入环境变量（在导入 numpy/cv2/paddle/torch 之前调用；可用命令行参数再次调用）
+
+        Args:
+            num_workers: 推理进程数，默认使用 config.INFERENCE_CONFIG['num_workers']
+            threads_per_worker: 每个推理进程的请求线程数，默认使用 config.INFERENCE_CONFIG['threads_per_worker']
+
+        Returns:
+            线程预算，THREAD_CONFIG['enabled'] 为 False 时返回None
+        """
+        if not THREAD_CONFIG['enabled']:
+            return None
+
+        self.budget = ThreadBudget(
+            THREAD_CONFIG['cpus'] or available_cpus(),
+            num_workers or INFERENCE_CONFIG['num_workers'],
+            threads_per_worker or INFERENCE_CONFIG['threads_per_worker']
+        )
+        for name, value in self.budget.env().items():
+            if name in self.explicit_env:
+                self.env_sources[name] = 'env'
+            else:
+                os.environ[name] = value
+                self.env_sources[name] = 'budget'
+        return self.budget
+
+    def ocr_threads(self) -> Optional[int]:
+        """OCR推理线程数（Paddle cpu_threads），未启用线程预算时返回None"""
+        return self.budget.ocr_threads if self.budget is not None else None
+
+    def cnn_threads(self) -> Optional[int]:
+        """CNN推理线程数（torch intra-op / onnxruntime），未启用线程预算时返回None"""
+        return self.budget.cnn_threads if self.budget is not None else None
+
+    def apply_runtime(self):
+        """设置已导入的库的运行时线程数（模型加载前调用，推理进程 fork 后再调用一次）"""
+        if self.budget is None:
+            return
+
+        cv2 = sys.modules.get('cv2')
+        if cv2 is not None:
+            cv2.setNumThreads(self.budget.request_share)
+
+        # Web进程不导入 torch，这里也不主动导入
+        torch = sys.modules.get('torch')
+        if torch is not None:
+            torch.set_num_threads(CNN_INFERENCE_CONFIG['num_threads'] or self.budget.cnn_threads)
+            try:
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                # 已有 inter-op 并行任务运行过（例如 fork 后的推理进程），只能在首次设置
+                pass
+
+    @contextmanager
+    def single_threaded(self) -> Iterator[None]:
+        """
+        临时把 torch 的 intra-op 线程数设为1，退出时恢复（推理服务父进程 fork 前预热用）
+
+        torch 的 OpenMP 运行时（libgomp）的线程池不能跨 fork：父进程中进入过多线程并行区的线程，在子进程中
+        再次进入并行区时会等待不存在的工作线程而挂起。预热只用调用线程执行，父进程不创建线程池。
+        Paddle 的 cpu_threads 在创建预测器时固定，不在这里调整；推理进程中的OCR在 fork 之后新建的
+        请求线程/微批调度线程中执行，不使用父进程线程的线程池。
+        """
+        torch = sys.modules.get('torch')
+        previous = torch.get_num_threads() if torch is not None else None
+        if torch is not None:
+            torch.set_num_threads(1)
+        try:
+            yield
+        finally:
+            if torch is not None:
+                torch.set_num_threads(previous)
+
+    def report(self) -> Dict:
+        """线程预算和各库实际生效的线程数"""
+        effective = {name: os.environ.get(name) for name in MODEL_ENV_VARS + REQUEST_ENV_VARS}
+
+        cv2 = sys.modules.get('cv2')
+        if cv2 is not None:
+            effective['opencv'] = cv2.getNumThreads()
+        torch = sys.modules.get('torch')
+        if torch is not None:
+            effective['torch'] = torch.get_num_threads()
+            effective['torch_interop'] = torch.get_num_interop_threads()
+        if 'paddleocr' in sys.modules:
+            effective['paddle_cpu_threads'] = OCR_CONFIG.get('cpu_threads', self.ocr_threads())
+
+        return {
+            'enabled': self.budget is not None,
+            'pid': os.getpid(),
+            'budget': self.budget.to_dict() if self.budget is not None else None,
+            'env_sources': dict(self.env_sources),
+            'effective': effective
+        }
+
+
+governor = ThreadGovernor()